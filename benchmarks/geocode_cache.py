@@ -0,0 +1,194 @@
+"""
+Benchmark: desalojo LRU/TTL de la caché de reverse geocoding.
+
+Compara el mantenimiento anterior (cada miss recorre toda la caché parseando fechas
+ISO para caducar por TTL y, al pasar del tope, la ordena entera; cada alta ordena
+su celda) con el de api/geocode_cache.GeocodeCache (orden LRU mantenido con cada
+alta/hit: caducar, desalojar y recortar quitan por el principio). Misma secuencia
+de hits, misses y altas sobre una caché precargada; comprueba que al final quedan
+las mismas entradas. No necesita Home Assistant (ver offline.py).
+
+    python benchmarks/geocode_cache.py --entries 100000 --ops 400
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import offline     # noqa: E402
+
+geocode_cache, rg = offline.load_api("geocode_cache", "reverse_geocode")
+GeocodeCache = geocode_cache.GeocodeCache
+
+T0 = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+
+# --------------------------------------------
+# Mantenimiento anterior (ordenaciones completas sobre fechas ISO), como referencia
+# --------------------------------------------
+def _effective_ts(entry, hot_map):
+    base_ts = datetime.fromisoformat(entry["ts"])
+    hot = hot_map.get(rg._hot_key(entry["lat"], entry["lon"]))
+    return max(base_ts, datetime.fromisoformat(hot)) if hot else base_ts
+
+
+class SortedMaintenance:
+    def __init__(self, entries, hot_map):
+        self.cache = GeocodeCache()
+        self.hot_map = dict(hot_map)
+        for it in entries:
+            self.cache.add(it, rg._cell_of(it["lat"], it["lon"]), 0.0)
+
+    def hit(self, entry, now):
+        self.hot_map[rg._hot_key(entry["lat"], entry["lon"])] = now.isoformat()
+
+    def miss(self, now, low, high):
+        cache, hot_map = self.cache, self.hot_map
+        cutoff = now - rg.CACHE_TTL
+        for entry_id in [i for i, it in cache.items() if _effective_ts(it, hot_map) < cutoff]:
+            cache.remove(entry_id)
+        self.cap(low, high)
+
+    def cap(self, low, high):
+        n = len(self.cache)
+        if n > high:
+            ordered = sorted(self.cache.items(), key=lambda kv: _effective_ts(kv[1], self.hot_map))
+            for entry_id, _ in ordered[:n - low]:
+                self.cache.remove(entry_id)
+
+    def insert(self, entry, now, per_cell, low, high):
+        cell = rg._cell_of(entry["lat"], entry["lon"])
+        self.cache.add(entry, cell, 0.0)
+        ids = self.cache.cell_ids(cell)
+        if len(ids) > per_cell:
+            ids.sort(key=lambda i: _effective_ts(self.cache.get(i), self.hot_map))
+            for entry_id in ids[:len(ids) - per_cell]:
+                self.cache.remove(entry_id)
+        self.cap(low, high)
+
+
+class LruMaintenance:
+    def __init__(self, entries, hot_map):
+        self.cache = GeocodeCache()
+        hot_epoch = {k: rg._epoch(v) for k, v in hot_map.items()}
+        timed = sorted(((rg._effective_epoch(it, hot_epoch), it) for it in entries), key=lambda t: t[0])
+        for ts, it in timed:
+            self.cache.add(it, rg._cell_of(it["lat"], it["lon"]), ts)
+
+    def hit(self, entry, now):
+        key = rg._hot_key(entry["lat"], entry["lon"])
+        self.cache.touch_where(
+            rg._cell_of(entry["lat"], entry["lon"]),
+            lambda it: rg._hot_key(it["lat"], it["lon"]) == key,
+            now.timestamp(),
+        )
+
+    def miss(self, now, low, high):
+        self.cache.expire((now - rg.CACHE_TTL).timestamp())
+        if len(self.cache) > high:
+            self.cache.evict_to(low)
+
+    def insert(self, entry, now, per_cell, low, high):
+        cell = rg._cell_of(entry["lat"], entry["lon"])
+        self.cache.add(entry, cell, now.timestamp())
+        self.cache.trim_cell(cell, per_cell)
+        if len(self.cache) > high:
+            self.cache.evict_to(low)
+
+
+# --------------------------------------------
+# Carga sintética
+# --------------------------------------------
+HOME_CELLS = ((40.41234, -3.70123), (40.45678, -3.68901))
+
+
+def _entry(rnd, serial, ts, home_frac=0.0):
+    if rnd.random() < home_frac:   # sitios frecuentes: celdas llenas que hay que recortar
+        lat, lon = rnd.choice(HOME_CELLS)
+        lat, lon = round(lat + rnd.uniform(0, 0.00004), 6), round(lon + rnd.uniform(0, 0.00004), 6)
+    else:
+        lat = round(40.0 + rnd.uniform(-0.5, 0.5), 6)
+        lon = round(-3.7 + rnd.uniform(-0.5, 0.5), 6)
+    return {"n": serial, "lat": lat, "lon": lon, "ts": ts.isoformat(), "lang": "es"}
+
+
+def make_state(rnd, n, hot_frac):
+    """n entradas repartidas a lo largo del TTL (van caducando según avanza el reloj) y hits recientes en hot_frac."""
+    span = rg.CACHE_TTL.total_seconds()
+    entries = [_entry(rnd, i, T0 - timedelta(seconds=span * (n - i) / n), 0.01) for i in range(n)]
+    hot_map = {}
+    for it in rnd.sample(entries, int(n * hot_frac)):
+        when = max(datetime.fromisoformat(it["ts"]), T0 - timedelta(seconds=rnd.uniform(0, 86400)))
+        hot_map[rg._hot_key(it["lat"], it["lon"])] = when.isoformat()
+    return entries, hot_map
+
+
+def make_ops(rnd, n, ops, miss_frac):
+    out = []
+    serial = n
+    for k in range(ops):
+        now = T0 + timedelta(seconds=60 * (k + 1))
+        if rnd.random() < miss_frac:
+            out.append(("miss", now, _entry(rnd, serial, now, 0.5)))
+            serial += 1
+        else:
+            out.append(("hit", now, rnd.randrange(n)))
+    return out
+
+
+def replay(impl, entries, ops, per_cell, low, high):
+    t0 = time.perf_counter()
+    for kind, now, arg in ops:
+        if kind == "hit":
+            entry = entries[arg]
+            if any(e is entry for e in impl.cache.in_cells([rg._cell_of(entry["lat"], entry["lon"])])):
+                impl.hit(entry, now)
+        else:
+            impl.miss(now, low, high)
+            impl.insert(dict(arg), now, per_cell, low, high)
+    return time.perf_counter() - t0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--entries", type=int, default=100_000)
+    ap.add_argument("--ops", type=int, default=400)
+    ap.add_argument("--miss-frac", type=float, default=0.3)
+    ap.add_argument("--hot-frac", type=float, default=0.2)
+    ap.add_argument("--per-cell", type=int, default=rg.PER_CELL_MAX)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    # tope por debajo del tamaño inicial: el primer miss desaloja hasta low
+    high = int(args.entries * 0.95)
+    low = int(high * rg.LOW_WATER / rg.MAX_ENTRIES)
+    rnd = random.Random(args.seed)
+    entries, hot_map = make_state(rnd, args.entries, args.hot_frac)
+    ops = make_ops(rnd, args.entries, args.ops, args.miss_frac)
+
+    print(f"entries={args.entries} ops={args.ops} miss_frac={args.miss_frac} "
+          f"hot_frac={args.hot_frac} cap={low}/{high} seed={args.seed}")
+    print(f"{'impl':<8} {'load_s':>8} {'ops_s':>8} {'per_op_ms':>10} {'left':>8}")
+    results = {}
+    for name, cls in (("sorted", SortedMaintenance), ("lru", LruMaintenance)):
+        t0 = time.perf_counter()
+        impl = cls(entries, hot_map)
+        t_load = time.perf_counter() - t0
+        t_ops = replay(impl, entries, ops, args.per_cell, low, high)
+        left = sorted(it["n"] for _, it in impl.cache.items())
+        results[name] = (t_ops, left)
+        print(f"{name:<8} {t_load:8.3f} {t_ops:8.3f} {t_ops * 1000.0 / max(1, len(ops)):10.3f} {len(left):8d}")
+
+    (t_old, left_old), (t_new, left_new) = results["sorted"], results["lru"]
+    speedup = t_old / t_new if t_new else float("inf")
+    print(f"speedup {speedup:.1f}x  same {'yes' if left_old == left_new else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Regresión contra salidas de referencia (golden) del pipeline de filtered_positions.
+
+benchmarks/golden/*.json.gz es un corpus congelado: cada fixture guarda los estados
+de entrada en columnas (deltas de tiempo, coordenadas, precisión, velocidad,
+batería), las zonas, los parámetros y la salida esperada (posiciones, resumen y
+filas de zonas). Las salidas esperadas salen del motor de referencia (reference.py:
+el filtered_positions.py anterior a las optimizaciones), así que el corpus congela
+el comportamiento original. El harness pasa cada entrada por un motor (por defecto
+filtered_positions._run_pipeline) y compara con tolerancias numéricas por campo;
+así un motor optimizado se puede adoptar sabiendo exactamente qué cambia.
+Funciona sin Home Assistant (ver offline.py).
+
+Las filas de zonas tienen una tolerancia propia: el reparto de tramos por zonas
+actual corta cada tramo en el cruce analítico con el círculo, y la referencia lo
+hacía por muestreo + bisección con eps de 2 m. Cada cruce de borde puede mover
+menos de 1 m de un lado al otro, así que distance_m admite 1 m por cruce (dos por
+visita; la fila de fuera de zonas, todos los cruces) y time_s +-2 s por fila,
+porque el ajuste al total del resumen reabsorbe la diferencia.
+
+    python benchmarks/golden.py                     # comprobar el motor actual
+    python benchmarks/golden.py --engine mymod:run  # otro motor (misma firma)
+    python benchmarks/golden.py --update            # regenerar las salidas esperadas (con reference:run)
+"""
+
+import argparse
+import gzip
+import importlib
+import json
+import math
+import sys
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import offline     # noqa: E402
+import synthetic   # noqa: E402
+
+fp, kernels = offline.load_api("filtered_positions", "kernels")
+
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+FIXTURE_VERSION = 1
+ATTR_COLUMNS = ("latitude", "longitude", "gps_accuracy", "speed", "velocity", "battery_level")
+POSITION_ATTRS = ("latitude", "longitude", "gps_accuracy", "speed", "battery_level")
+STOP_KEYS = ("stop", "stop_start", "stop_end", "stop_leave", "stop_duration_s", "stop_center_lat", "stop_center_lon")
+MAX_DIFFS = 20
+REFERENCE_ENGINE = "reference:run"
+ZONE_CROSSING_M = 1.0     # distancia que puede cambiar de zona en cada cruce de borde
+ZONE_TIME_S = 2           # segundos por fila de zona
+
+# Parámetros por defecto del endpoint; cada fixture puede sobrescribir algunos
+BASE_PARAMS = {
+    "max_gps_accuracy_m": fp.MAX_GPS_ACCURACY_M_FALLBACK,
+    "max_speed_kmh": fp.MAX_SPEED_KMH_FALLBACK,
+    "stop_radius_m": fp.STOP_RADIUS_M_FALLBACK,
+    "stop_time_s": fp.STOP_TIME_S_FALLBACK,
+    "reentry_gap_s": fp.REENTRY_GAP_S_FALLBACK,
+    "outside_gap_s": fp.OUTSIDE_GAP_S_FALLBACK,
+    "anti_spike_factor_k": fp.ANTI_SPIKE_FACTOR_K,
+    "anti_spike_detour_ratio": fp.ANTI_SPIKE_DETOUR_RATIO,
+    "anti_spike_radius": fp.ANTI_SPIKE_RADIUS_FALLBACK,
+    "anti_spike_time": fp.ANTI_SPIKE_TIME_S_FALLBACK,
+}
+
+# nombre -> (escenario sintético, semilla, parámetros distintos de BASE_PARAMS).
+# Solo se usa para crear un fixture que aún no existe: después la entrada queda congelada.
+CORPUS = {
+    "commute_1d_30s": (synthetic.Scenario("commute_1d_30s", 1, 30.0), 1, {}),
+    "jitter_1d_10s": (synthetic.Scenario("jitter_1d_10s", 1, 10.0, jitter_m=15.0, spike_rate=0.03), 2, {}),
+    "week_5min": (synthetic.Scenario("week_5min", 7, 300.0), 3, {}),
+    "no_stops_1d_30s": (synthetic.Scenario("no_stops_1d_30s", 1, 30.0), 4, {"stop_radius_m": 0.0}),
+    "short_gaps_2d_20s": (
+        synthetic.Scenario("short_gaps_2d_20s", 2, 20.0, spike_rate=0.02), 5,
+        {"outside_gap_s": 30, "reentry_gap_s": 0, "anti_spike_time": 0},
+    ),
+    "loose_filter_2d_60s": (
+        synthetic.Scenario("loose_filter_2d_60s", 2, 60.0, jitter_m=10.0), 6,
+        {"max_gps_accuracy_m": 100.0, "stop_time_s": 60},
+    ),
+}
+
+
+# --------------------------------------------
+# Fixtures
+# --------------------------------------------
+def _us(value: datetime) -> int:
+    return (value - synthetic.START) // timedelta(microseconds=1)
+
+
+def _at(us: int) -> datetime:
+    return synthetic.START + timedelta(microseconds=us)
+
+
+def encode_input(states):
+    """Estados -> columnas: deltas de tiempo en us y un valor (o null) por atributo."""
+    cols = {"dt_us": []}
+    cols.update({name: [] for name in ATTR_COLUMNS})
+    prev = 0
+    for st in states:
+        us = _us(st.last_updated)
+        cols["dt_us"].append(us - prev)
+        prev = us
+        for name in ATTR_COLUMNS:
+            cols[name].append(st.attributes.get(name))
+    return cols
+
+
+def decode_input(cols):
+    """Columnas -> State (los atributos ausentes no aparecen, como en el recorder)."""
+    states = []
+    us = 0
+    for k, dt_us in enumerate(cols["dt_us"]):
+        us += dt_us
+        attrs = {"source_type": "gps", "friendly_name": "Phone"}
+        for name in ATTR_COLUMNS:
+            value = cols[name][k]
+            if value is not None or name in ("latitude", "longitude"):
+                attrs[name] = value
+        ts = _at(us)
+        states.append(offline.State(synthetic.ENTITY_ID, "not_home", attrs, ts, ts))
+    return states
+
+
+def zones_of(fixture):
+    states = [offline.State(z["entity_id"], "0", z["attributes"]) for z in fixture["zones"]]
+    return fp.ZoneIndex(fp._all_zones(_Hass(states)))
+
+
+class _Hass:
+    """Solo lo que _all_zones lee de hass."""
+
+    class _States:
+        def __init__(self, zones):
+            self._zones = zones
+
+        def async_all(self, domain=None):
+            return list(self._zones)
+
+    def __init__(self, zones):
+        self.states = self._States(zones)
+
+
+def new_fixture(name):
+    scenario, seed, overrides = CORPUS[name]
+    start, end = synthetic.time_range(scenario)
+    return {
+        "version": FIXTURE_VERSION,
+        "name": name,
+        "params": {**BASE_PARAMS, **overrides},
+        "range": [_us(start), _us(end)],
+        "zones": [{"entity_id": z.entity_id, "attributes": z.attributes}
+                  for z in synthetic.zone_states(offline.State)],
+        "input": encode_input(synthetic.generate_states(scenario, offline.State, seed)),
+    }
+
+
+def fixture_path(name):
+    return GOLDEN_DIR / f"{name}.json.gz"
+
+
+def read_fixture(path):
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def write_fixture(path, fixture):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = json.dumps(fixture, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    # mtime=0: el .gz no cambia si el contenido no cambia
+    with open(path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as fh:
+        fh.write(data)
+
+
+# --------------------------------------------
+# Salida normalizada y comparación
+# --------------------------------------------
+def normalize(payload):
+    """Respuesta del motor -> lo que se congela: posiciones reducidas, resumen y zonas."""
+    positions = []
+    for pos in payload["positions"]:
+        attrs = pos.get("attributes", {})
+        row = {"last_updated": pos["last_updated"]}
+        row.update({k: attrs[k] for k in POSITION_ATTRS if k in attrs})
+        row.update({k: pos[k] for k in STOP_KEYS if k in pos})
+        positions.append(row)
+    return {"positions": positions, "summary": payload["summary"], "zones": payload["zones"]}
+
+
+def _tolerance(key, rel):
+    """Tolerancia absoluta por tipo de campo (grados, metros, segundos...)."""
+    if key in ("latitude", "longitude", "stop_center_lat", "stop_center_lon"):
+        return 1e-7            # ~1 cm
+    if key.endswith("_m"):
+        return 0.01
+    if key.endswith("_s"):
+        return 1.0             # los totales en segundos se redondean a entero
+    if key.endswith("_mps") or key == "speed":
+        return 1e-3
+    return rel
+
+
+def diff(expected, actual, rel, path="", key="", out=None):
+    """Diferencias (ruta, esperado, obtenido) fuera de tolerancia."""
+    out = [] if out is None else out
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for k in sorted(set(expected) | set(actual)):
+            if k not in expected or k not in actual:
+                out.append((f"{path}.{k}", expected.get(k, "<missing>"), actual.get(k, "<missing>")))
+            else:
+                diff(expected[k], actual[k], rel, f"{path}.{k}", k, out)
+    elif isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            out.append((f"{path}[len]", len(expected), len(actual)))
+        for i, (a, b) in enumerate(zip(expected, actual)):
+            diff(a, b, rel, f"{path}[{i}]", key, out)
+    elif (
+        isinstance(expected, (int, float)) and isinstance(actual, (int, float))
+        and not isinstance(expected, bool) and not isinstance(actual, bool)
+    ):
+        if math.isnan(expected) or math.isnan(actual):
+            if not (math.isnan(expected) and math.isnan(actual)):
+                out.append((path, expected, actual))
+        elif abs(expected - actual) > max(_tolerance(key, rel), rel * max(abs(expected), abs(actual))):
+            out.append((path, expected, actual))
+    elif expected != actual:
+        out.append((path, expected, actual))
+    return out
+
+
+def diff_zones(expected, actual, rel, out=None):
+    """Como diff para las filas de zonas, con las tolerancias del reparto por zonas (ver arriba)."""
+    out = [] if out is None else out
+    if len(expected) != len(actual):
+        out.append((".zones[len]", len(expected), len(actual)))
+    crossings = sum(2 * int(row.get("visits", 0)) for row in expected)
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        visits = int(a.get("visits", 0))
+        tol_m = ZONE_CROSSING_M * max(1, 2 * visits if visits else crossings)
+        for k in sorted(set(a) | set(b)):
+            where = f".zones[{i}].{k}"
+            if k not in a or k not in b:
+                out.append((where, a.get(k, "<missing>"), b.get(k, "<missing>")))
+            elif k == "distance_m":
+                if not abs(a[k] - b[k]) <= tol_m:
+                    out.append((where, a[k], b[k]))
+            elif k == "time_s":
+                if not abs(a[k] - b[k]) <= ZONE_TIME_S:
+                    out.append((where, a[k], b[k]))
+            else:
+                diff(a[k], b[k], rel, where, k, out)
+    return out
+
+
+def compare(expected, actual, rel):
+    """Diferencias de una salida normalizada completa."""
+    out = []
+    for key in ("positions", "summary"):
+        diff(expected[key], actual[key], rel, f".{key}", key, out)
+    return diff_zones(expected["zones"], actual["zones"], rel, out)
+
+
+def load_engine(spec):
+    """"módulo:función" (módulo de api/ o importable) -> callable(states, start, end, zones, params)."""
+    module_name, _, func = spec.partition(":")
+    try:
+        module = offline.load_api(module_name)[0]
+    except ImportError:
+        module = importlib.import_module(module_name)
+    return getattr(module, func)
+
+
+def run_engine(engine, fixture):
+    start, end = (_at(us) for us in fixture["range"])
+    payload = engine(decode_input(fixture["input"]), start, end, zones_of(fixture), dict(fixture["params"]))
+    return json.loads(json.dumps(normalize(payload), default=str))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("names", nargs="*", help="fixtures concretos (por defecto todo el corpus)")
+    ap.add_argument("--engine", help="por defecto filtered_positions:_run_pipeline, o reference:run con --update")
+    ap.add_argument("--rel", type=float, default=1e-9, help="tolerancia relativa")
+    ap.add_argument("--no-numpy", action="store_true", help="fuerza el camino sin NumPy de kernels")
+    ap.add_argument("--update", action="store_true", help="reescribe las salidas esperadas con este motor")
+    args = ap.parse_args(argv)
+
+    if args.no_numpy:
+        kernels.USE_NUMPY = False
+    engine = load_engine(args.engine or (REFERENCE_ENGINE if args.update else "filtered_positions:_run_pipeline"))
+    names = args.names or sorted(set(CORPUS) | {p.name[:-len(".json.gz")] for p in GOLDEN_DIR.glob("*.json.gz")})
+
+    failed = 0
+    for name in names:
+        path = fixture_path(name)
+        fixture = read_fixture(path) if path.exists() else new_fixture(name)
+        actual = run_engine(engine, fixture)
+        if args.update or "expected" not in fixture:
+            fixture["expected"] = actual
+            write_fixture(path, fixture)
+            print(f"{name:<22} written ({len(actual['positions'])} positions)")
+            continue
+
+        diffs = compare(fixture["expected"], actual, args.rel)
+        if not diffs:
+            print(f"{name:<22} ok ({len(actual['positions'])} positions)")
+            continue
+        failed += 1
+        print(f"{name:<22} {len(diffs)} differences")
+        for where, a, b in diffs[:MAX_DIFFS]:
+            print(f"    {where}: expected {a!r}, got {b!r}")
+
+    if failed:
+        print(f"\n{failed} of {len(names)} fixtures differ")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Carga de los módulos de api/ fuera de Home Assistant, para los benchmarks.
+
+Si homeassistant, aiohttp o sqlalchemy no están instalados se sustituyen por
+módulos mínimos: lo que el pipeline usa de verdad (homeassistant.util.dt,
+json_loads/json_bytes, callback) tiene una implementación real y todo lo demás
+(vistas HTTP, recorder, SQLAlchemy...) son clases vacías que solo sirven para que
+los imports funcionen. Los State del recorder se sustituyen por `State`.
+"""
+
+import importlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import json
+import sys
+import types
+
+from datetime import datetime, timezone
+from pathlib import Path
+
+INTEGRATION_DIR = Path(__file__).resolve().parents[1] / "custom_components" / "ha_tracker"
+STUB_ROOTS = ("homeassistant", "aiohttp", "sqlalchemy")
+
+_stubbed = None     # dependencias sustituidas (se decide una sola vez)
+
+
+class State:
+    """Lo que el pipeline lee de un State del recorder."""
+
+    __slots__ = ("entity_id", "state", "attributes", "last_updated", "last_changed")
+
+    def __init__(self, entity_id, state, attributes, last_updated=None, last_changed=None):
+        self.entity_id = entity_id
+        self.state = state
+        self.attributes = attributes
+        self.last_updated = last_updated or datetime.now(timezone.utc)
+        self.last_changed = last_changed or self.last_updated
+
+    @property
+    def name(self):
+        return self.attributes.get("friendly_name", self.entity_id)
+
+
+class _StubType(type):
+    """Clase vacía cuyos atributos desconocidos también lo son (p. ej. `from aiohttp import web; web.Response`)."""
+
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = _stub_class(name)
+        setattr(cls, name, value)
+        return value
+
+
+def _stub_class(name):
+    return _StubType(name, (), {"__init__": lambda self, *args, **kwargs: None})
+
+
+class _StubModule(types.ModuleType):
+    """Módulo cuyos atributos desconocidos son clases vacías (bases, decoradores, constantes)."""
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = _stub_class(name)
+        setattr(self, name, value)
+        return value
+
+
+class _StubFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    def __init__(self, roots):
+        self._roots = roots
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname.split(".")[0] in self._roots:
+            return importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+        return None
+
+    def create_module(self, spec):
+        module = _StubModule(spec.name)
+        module.__path__ = []
+        return module
+
+    def exec_module(self, module):
+        parent, _, child = module.__name__.rpartition(".")
+        if parent:
+            setattr(sys.modules[parent], child, module)
+
+
+def _dt_module():
+    dt = types.ModuleType("homeassistant.util.dt")
+    dt.UTC = timezone.utc
+    dt.DEFAULT_TIME_ZONE = timezone.utc
+
+    def as_utc(value):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=dt.DEFAULT_TIME_ZONE)
+        return value.astimezone(timezone.utc)
+
+    def parse_datetime(value):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+    dt.as_utc = as_utc
+    dt.parse_datetime = parse_datetime
+    dt.utcnow = lambda: datetime.now(timezone.utc)
+    dt.utc_from_timestamp = lambda ts: datetime.fromtimestamp(ts, timezone.utc)
+    return dt
+
+
+def install_stubs():
+    """Instala los stubs de las dependencias que falten; devuelve las que se sustituyeron."""
+    global _stubbed
+    if _stubbed is not None:
+        return _stubbed
+    missing = _stubbed = tuple(root for root in STUB_ROOTS if importlib.util.find_spec(root) is None)
+    if not missing:
+        return missing
+    sys.meta_path.insert(0, _StubFinder(missing))
+
+    if "homeassistant" in missing:
+        importlib.import_module("homeassistant.util").dt = sys.modules["homeassistant.util.dt"] = _dt_module()
+        importlib.import_module("homeassistant.util.json").json_loads = json.loads
+        importlib.import_module("homeassistant.helpers.json").json_bytes = (
+            lambda obj: json.dumps(obj, default=str).encode("utf-8")
+        )
+        importlib.import_module("homeassistant.helpers.storage").STORAGE_DIR = ".storage"
+        core = importlib.import_module("homeassistant.core")
+        core.State = State
+        core.callback = lambda func: func
+    if "sqlalchemy" in missing:
+        importlib.import_module("sqlalchemy.exc").SQLAlchemyError = type("SQLAlchemyError", (Exception,), {})
+    return missing
+
+
+def load_api(*names):
+    """
+    Importa api/<name> para cada nombre sin ejecutar los __init__ de la integración
+    (que registran las vistas en hass). Devuelve los módulos en el mismo orden.
+    """
+    install_stubs()
+    for pkg_name, path in (("ha_tracker", INTEGRATION_DIR), ("ha_tracker.api", INTEGRATION_DIR / "api")):
+        if pkg_name not in sys.modules:
+            pkg = types.ModuleType(pkg_name)
+            pkg.__path__ = [str(path)]
+            sys.modules[pkg_name] = pkg
+    return tuple(importlib.import_module(f"ha_tracker.api.{name}") for name in names)
+
+
+def integration_version():
+    try:
+        return json.loads((INTEGRATION_DIR / "manifest.json").read_text(encoding="utf-8")).get("version")
+    except (OSError, ValueError):
+        return None
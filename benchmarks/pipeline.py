@@ -0,0 +1,246 @@
+"""
+Benchmark: etapas del pipeline de filtered_positions sobre historiales sintéticos.
+
+Genera los estados de cada escenario (synthetic.SCENARIOS: trayectos, paradas
+largas, jitter, spikes, de 1 s a 5 min de cadencia y de 1 a 31 días), mide cada
+etapa de api/filtered_positions.py por separado y el pipeline completo, y la
+memoria pico de cada etapa (tracemalloc, en una pasada aparte). El resultado se
+escribe en JSON para comparar entre versiones con --compare.
+Funciona sin Home Assistant (ver offline.py).
+
+    python benchmarks/pipeline.py --quick --output bench.json
+    python benchmarks/pipeline.py --compare bench-0.0.33.json --output bench-0.0.34.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import offline     # noqa: E402
+import synthetic   # noqa: E402
+
+fp, kernels, track_codec = offline.load_api("filtered_positions", "kernels", "track_codec")
+
+# Mismos valores que usa el endpoint sin opciones en el config entry
+PARAMS = {
+    "max_gps_accuracy_m": fp.MAX_GPS_ACCURACY_M_FALLBACK,
+    "max_speed_kmh": fp.MAX_SPEED_KMH_FALLBACK,
+    "stop_radius_m": fp.STOP_RADIUS_M_FALLBACK,
+    "stop_time_s": fp.STOP_TIME_S_FALLBACK,
+    "reentry_gap_s": fp.REENTRY_GAP_S_FALLBACK,
+    "outside_gap_s": fp.OUTSIDE_GAP_S_FALLBACK,
+    "anti_spike_factor_k": fp.ANTI_SPIKE_FACTOR_K,
+    "anti_spike_detour_ratio": fp.ANTI_SPIKE_DETOUR_RATIO,
+    "anti_spike_radius": fp.ANTI_SPIKE_RADIUS_FALLBACK,
+    "anti_spike_time": fp.ANTI_SPIKE_TIME_S_FALLBACK,
+}
+
+STAGES = (
+    "prepare", "track", "filter", "anti_spike", "stops", "fused",
+    "segments", "summary", "zones", "to_json", "to_binary", "pipeline",
+)
+
+
+class _Hass:
+    """Solo lo que _all_zones lee de hass."""
+
+    class _States:
+        def __init__(self, zones):
+            self._zones = zones
+
+        def async_all(self, domain=None):
+            return list(self._zones)
+
+    def __init__(self, zones):
+        self.states = self._States(zones)
+
+
+def run_stages(states, start, end, zones, params, measure):
+    """
+    Ejecuta las etapas en el orden de _run_pipeline; `measure(nombre, fn)` las mide y
+    devuelve su resultado. Devuelve (puntos de entrada, posiciones de salida, paradas).
+    """
+    mx = float(params["max_gps_accuracy_m"])
+
+    def prepare():
+        sts = [s for s in states
+               if fp.dt_util.as_utc(s.last_updated) >= start and fp.dt_util.as_utc(s.last_updated) <= end]
+        sts.sort(key=lambda s: fp.dt_util.as_utc(s.last_updated))
+        return sts
+
+    sts = measure("prepare", prepare)
+    track = measure("track", lambda: fp.Track.from_states(sts))
+    sel = measure("filter", lambda: fp.filter_positions(
+        track, max_gps_accuracy_m=mx, max_speed_kmh=float(params["max_speed_kmh"]), min_distance=fp.MIN_DISTANCE
+    ))
+    sel = measure("anti_spike", lambda: fp.drop_c_spikes_relative_5pt(
+        track, sel,
+        factor_k=float(params["anti_spike_factor_k"]),
+        min_detour_ratio=float(params["anti_spike_detour_ratio"]),
+        max_bd_dt_s=int(params["anti_spike_time"]),
+        min_leg_m=max(10.0, float(params["anti_spike_radius"])),
+        max_gps_accuracy_m=mx,
+    ))
+    sel = measure("stops", lambda: fp.annotate_stops_and_collapse(
+        track, sel,
+        stop_radius_m=float(params["stop_radius_m"]),
+        stop_time_s=int(params["stop_time_s"]),
+        reentry_gap_s=int(params["reentry_gap_s"]),
+        outside_gap_s=int(params["outside_gap_s"]),
+        max_gps_accuracy_m=mx,
+    ))
+
+    # las tres etapas anteriores fusionadas (lo que usa _run_pipeline), sobre un track nuevo
+    fused_track = fp.Track.from_states(sts)
+    measure("fused", lambda: fp._fused_selection(fused_track, params))
+
+    seg = measure("segments", lambda: kernels.segment_metrics(track, sel))
+    summary = measure("summary", lambda: fp._calc_summary(track, sel, seg))
+    measure("zones", lambda: fp._calc_zone_stats(
+        track, sel, zones, expected_total_s=summary["total_time_s"], seg=seg, memo=fp.ZoneMemo(zones)
+    ))
+    measure("to_json", lambda: json.dumps(track.to_positions(sel, None), default=str))
+    measure("to_binary", lambda: track_codec.encode_binary(track_codec.EncodedTrack(track, sel), {}))
+    measure("pipeline", lambda: fp._run_pipeline(states, start, end, zones, dict(params)))
+    return len(track), len(sel), len(track.stops)
+
+
+def bench_scenario(scenario, seed, repeat):
+    states = synthetic.generate_states(scenario, offline.State, seed)
+    start, end = synthetic.time_range(scenario)
+    zones = fp.ZoneIndex(fp._all_zones(_Hass(synthetic.zone_states(offline.State))))
+
+    # tiempos: mediana de `repeat` pasadas
+    times = {name: [] for name in STAGES}
+    counts = None
+    for _ in range(repeat):
+        def timed(name, fn):
+            gc.collect()
+            t0 = time.perf_counter()
+            out = fn()
+            times[name].append(time.perf_counter() - t0)
+            return out
+        counts = run_stages(states, start, end, zones, PARAMS, timed)
+
+    # memoria pico por etapa (pasada aparte: tracemalloc ralentiza)
+    peaks = {}
+
+    def traced(name, fn):
+        gc.collect()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        out = fn()
+        peaks[name] = tracemalloc.get_traced_memory()[1] - base
+        return out
+
+    tracemalloc.start()
+    try:
+        run_stages(states, start, end, zones, PARAMS, traced)
+    finally:
+        tracemalloc.stop()
+
+    points, positions, stops = counts
+    return {
+        "name": scenario.name,
+        "days": scenario.days,
+        "cadence_s": scenario.cadence_s,
+        "states": len(states),
+        "points": points,
+        "positions": positions,
+        "stops": stops,
+        "stages": {
+            name: {"seconds": round(statistics.median(times[name]), 6), "peak_bytes": peaks.get(name, 0)}
+            for name in STAGES
+        },
+    }
+
+
+def _git_rev():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=offline.INTEGRATION_DIR,
+            capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def compare(prev, cur):
+    """Tabla de cociente nuevo/anterior (tiempo y pico) por escenario y etapa."""
+    old = {s["name"]: s for s in prev.get("scenarios", [])}
+    print(f"\ncompared with {prev.get('meta', {}).get('version')} ({prev.get('meta', {}).get('git')})")
+    print(f"{'scenario':<16} {'stage':<11} {'old_s':>9} {'new_s':>9} {'time':>7} {'mem':>7}")
+    for s in cur["scenarios"]:
+        o = old.get(s["name"])
+        if o is None:
+            continue
+        for name, st in s["stages"].items():
+            ost = o["stages"].get(name)
+            if not ost:
+                continue
+            t = st["seconds"] / ost["seconds"] if ost["seconds"] else float("inf")
+            m = st["peak_bytes"] / ost["peak_bytes"] if ost["peak_bytes"] else float("inf")
+            flag = "  <--" if t > 1.2 or m > 1.2 else ""
+            print(f"{s['name']:<16} {name:<11} {ost['seconds']:9.4f} {st['seconds']:9.4f} {t:6.2f}x {m:6.2f}x{flag}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--quick", action="store_true", help="solo synthetic.QUICK_SCENARIOS")
+    ap.add_argument("--scenario", action="append", help="escenario concreto (repetible)")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--no-numpy", action="store_true", help="fuerza el camino sin NumPy de kernels")
+    ap.add_argument("--output", default="pipeline_bench.json")
+    ap.add_argument("--compare", help="JSON de una ejecución anterior")
+    args = ap.parse_args(argv)
+
+    if args.no_numpy:
+        kernels.USE_NUMPY = False
+    names = set(args.scenario or (synthetic.QUICK_SCENARIOS if args.quick else ()))
+    scenarios = [s for s in synthetic.SCENARIOS if not names or s.name in names]
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "version": offline.integration_version(),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": bool(kernels.USE_NUMPY),
+            "stubbed": list(offline.install_stubs()),
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "params": PARAMS,
+        },
+        "scenarios": [],
+    }
+
+    print(f"{'scenario':<16} {'states':>7} {'out':>6} {'stops':>5} " + " ".join(f"{n[:9]:>9}" for n in STAGES))
+    for scenario in scenarios:
+        row = bench_scenario(scenario, args.seed, max(1, args.repeat))
+        result["scenarios"].append(row)
+        print(f"{row['name']:<16} {row['states']:>7} {row['positions']:>6} {row['stops']:>5} "
+              + " ".join(f"{row['stages'][n]['seconds']:9.4f}" for n in STAGES))
+
+    Path(args.output).write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(f"\nwritten {args.output}")
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Motor de referencia para los golden: filtered_positions.py tal como estaba antes de
+las optimizaciones (commit BASELINE_REV), leído del historial de git y ejecutado
+fuera de Home Assistant (ver offline.py).
+
+Las salidas esperadas de benchmarks/golden/ se generan con este motor, de modo que
+el corpus congela el comportamiento original y no el del motor que se quiere
+comprobar:
+
+    python benchmarks/golden.py --update            # usa reference:run por defecto
+"""
+
+import subprocess
+import sys
+import types
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import offline     # noqa: E402
+
+BASELINE_REV = "031a16a6e0716d0c87cd6709545118b8f5a022ee"
+SOURCE_PATH = "custom_components/ha_tracker/api/filtered_positions.py"
+REPO_DIR = Path(__file__).resolve().parents[1]
+
+_module = None
+
+
+def load(rev=BASELINE_REV):
+    """Módulo filtered_positions de `rev` (se carga una sola vez por proceso)."""
+    global _module
+    if _module is not None:
+        return _module
+    try:
+        source = subprocess.run(
+            ["git", "show", f"{rev}:{SOURCE_PATH}"],
+            cwd=REPO_DIR, check=True, capture_output=True, text=True, encoding="utf-8",
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise ImportError(f"No se puede leer {SOURCE_PATH} de {rev}: {e}") from e
+
+    offline.load_api()
+    name = "ha_tracker.api._reference_filtered_positions"
+    module = types.ModuleType(name)
+    module.__package__ = "ha_tracker.api"
+    module.__file__ = f"{rev[:7]}:{SOURCE_PATH}"
+    sys.modules[name] = module
+    exec(compile(source, module.__file__, "exec"), module.__dict__)
+    _module = module
+    return module
+
+
+def run(states, start_utc, end_utc, zones, params):
+    """Mismos pasos que FilteredPositionsEndpoint.get en BASELINE_REV, sin recorder ni HTTP."""
+    fp = load()
+    zones = list(getattr(zones, "zones", zones))
+    states = [s for s in states if start_utc <= fp.dt_util.as_utc(s.last_updated) <= end_utc]
+    states.sort(key=lambda s: fp.dt_util.as_utc(s.last_updated))
+
+    positions = fp.filter_positions(
+        states,
+        max_gps_accuracy_m=params["max_gps_accuracy_m"],
+        max_speed_kmh=params["max_speed_kmh"],
+        min_distance=fp.MIN_DISTANCE,
+    )
+    if params["anti_spike_radius"] > 0 and params["anti_spike_time"] > 0:
+        positions = fp.drop_c_spikes_relative_5pt(
+            positions,
+            factor_k=float(params["anti_spike_factor_k"]),
+            min_detour_ratio=float(params["anti_spike_detour_ratio"]),
+            max_bd_dt_s=int(params["anti_spike_time"]),
+            min_leg_m=max(10.0, params["anti_spike_radius"]),
+            max_gps_accuracy_m=params["max_gps_accuracy_m"],
+        )
+    if params["stop_radius_m"] > 0 and params["stop_time_s"] > 0:
+        positions = fp.annotate_stops_and_collapse(
+            positions,
+            stop_radius_m=float(params["stop_radius_m"]),
+            stop_time_s=int(params["stop_time_s"]),
+            reentry_gap_s=int(params["reentry_gap_s"]),
+            outside_gap_s=int(params["outside_gap_s"]),
+            max_gps_accuracy_m=float(params["max_gps_accuracy_m"]),
+            require_good_acc=fp.REQUIRE_GOOD_ACC,
+        )
+
+    summary = fp._calc_summary(positions)
+    return {
+        "positions": positions,
+        "summary": summary,
+        "zones": fp._calc_zone_stats(positions, zones, expected_total_s=summary["total_time_s"]),
+    }
@@ -0,0 +1,275 @@
+"""
+Benchmark: ventana outside_gap del detector de paradas.
+
+Compara la búsqueda lineal que usaba antes _collapse_stops (cada punto fuera del
+radio vuelve a recorrer toda la ventana outside_gap) con api/stops.iter_collapse_stops
+(ventana deslizante indexada por celdas) sobre patrones sintéticos a 1 Hz pensados
+para el peor caso de la versión lineal. Comprueba que el resultado es idéntico y
+cuenta las distancias calculadas por posición: con la ventana no deben crecer con
+outside_gap (con la búsqueda lineal crecen en proporción).
+No necesita Home Assistant (ver offline.py).
+
+    python benchmarks/stop_lookahead.py --points 20000 --outside-gap 300
+    python benchmarks/stop_lookahead.py --points 20000 --outside-gap 1200 --patterns moving,drift
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import offline     # noqa: E402
+
+kernels, track_mod, stops = offline.load_api("kernels", "track", "stops")
+US_PER_S = track_mod.US_PER_S
+Stop = track_mod.Stop
+
+EVALS = [0]     # distancias calculadas (ambas versiones)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    EVALS[0] += 1
+    return kernels.haversine(lat1, lon1, lat2, lon2)
+
+
+stops.haversine = haversine
+
+
+# --------------------------------------------
+# Implementación anterior (búsqueda lineal en la ventana), como referencia
+# --------------------------------------------
+def linear_collapse(track, sel, stop_radius_m, stop_time_s, outside_gap_s, max_gps_accuracy_m, require_good_acc=True):
+    n = len(sel)
+    track.stops_annotated = True
+    lat_col, lon_col, acc_col, ts_col = track.lat, track.lon, track.acc, track.ts
+    outside_gap_us = int(outside_gap_s) * US_PER_S
+
+    def acc_ok(idx):
+        return not require_good_acc or not (acc_col[sel[idx]] > max_gps_accuracy_m)
+
+    out = []
+    i = 0
+    while i < n:
+        if not acc_ok(i):
+            out.append(sel[i])
+            i += 1
+            continue
+        c_lat, c_lon = lat_col[sel[i]], lon_col[sel[i]]
+        count = 1
+        t_start = ts_col[sel[i]]
+        last_in = i
+        j = i
+
+        def close_group(t_next):
+            t_last_in = ts_col[sel[last_in]]
+            leave_us = t_next if t_next is not None else t_last_in
+            dwell_s = (leave_us - t_start) / US_PER_S
+            if dwell_s >= stop_time_s:
+                out.append(track.add_stop(sel[i], Stop(t_start, t_last_in, leave_us, dwell_s, c_lat, c_lon)))
+            else:
+                out.extend(sel[i:last_in + 1])
+
+        while j + 1 < n:
+            nxt = sel[j + 1]
+            if not acc_ok(j + 1):
+                j += 1
+                continue
+            if haversine(c_lat, c_lon, lat_col[nxt], lon_col[nxt]) <= stop_radius_m:
+                j += 1
+                count += 1
+                last_in = j
+                c_lat = (c_lat * (count - 1) + lat_col[nxt]) / count
+                c_lon = (c_lon * (count - 1) + lon_col[nxt]) / count
+                continue
+            t_next = ts_col[nxt]
+            persist_until = t_next + outside_gap_us
+            k = j + 1
+            returned_inside = False
+            while k < n:
+                rk = sel[k]
+                if ts_col[rk] > persist_until:
+                    break
+                if acc_ok(k) and haversine(c_lat, c_lon, lat_col[rk], lon_col[rk]) <= stop_radius_m:
+                    returned_inside = True
+                    break
+                k += 1
+            if returned_inside:
+                j = k
+                count += 1
+                last_in = j
+                c_lat = (c_lat * (count - 1) + lat_col[sel[k]]) / count
+                c_lon = (c_lon * (count - 1) + lon_col[sel[k]]) / count
+                continue
+            close_group(t_next)
+            i = j + 1
+            break
+        else:
+            close_group(None)
+            i = last_in + 1
+    return out
+
+
+# --------------------------------------------
+# Patrones sintéticos (1 punto por segundo)
+# --------------------------------------------
+M_LAT = 111_320.0
+
+
+def _offset(lat0, lon0, north_m, east_m):
+    return lat0 + north_m / M_LAT, lon0 + east_m / (M_LAT * math.cos(math.radians(lat0)))
+
+
+def pattern_moving(rng, n, radius_m):
+    """Conducción continua: cada punto sale del radio del anterior y no vuelve."""
+    heading, north, east = 0.0, 0.0, 0.0
+    for _ in range(n):
+        heading += rng.gauss(0.0, 0.05)
+        step = radius_m * rng.uniform(1.2, 2.0)
+        north += step * math.cos(heading)
+        east += step * math.sin(heading)
+        yield north, east, rng.choice((5.0, 8.0, 10.0))
+
+
+def pattern_edge(rng, n, radius_m):
+    """Jitter en el borde: el punto salta dentro/fuera del radio sin irse nunca."""
+    for _ in range(n):
+        r = radius_m * (rng.uniform(0.0, 0.9) if rng.random() < 0.5 else rng.uniform(1.05, 1.6))
+        a = rng.uniform(0.0, 2.0 * math.pi)
+        yield r * math.cos(a), r * math.sin(a), rng.choice((5.0, 8.0, 10.0, 40.0))
+
+
+def pattern_orbit(rng, n, radius_m):
+    """Vueltas a 1.5 radios de un punto fijo, lo bastante rápido para que cada grupo se cierre."""
+    a = 0.0
+    for _ in range(n):
+        a += rng.uniform(1.2, 1.8)
+        r = radius_m * rng.uniform(1.4, 1.6)
+        yield r * math.cos(a), r * math.sin(a), 5.0
+
+
+def pattern_commute(rng, n, radius_m):
+    """Tramos de conducción alternados con paradas largas con jitter."""
+    north = east = 0.0
+    left, moving = 0, True
+    for _ in range(n):
+        if left <= 0:
+            moving, left = not moving, rng.randint(300, 1800)
+        left -= 1
+        if moving:
+            north += radius_m * rng.uniform(0.5, 1.5)
+            yield north, east, 8.0
+        else:
+            yield north + rng.gauss(0.0, radius_m / 3), east + rng.gauss(0.0, radius_m / 3), rng.choice((5.0, 40.0))
+
+
+def pattern_drift(rng, n, radius_m):
+    """
+    Paseo lento con jitter lateral: los puntos siguientes quedan a 1-3 radios de cada
+    centroide nuevo sin volver a entrar. Cada grupo se cierra tras pocos puntos y la
+    búsqueda lineal recorre entera la ventana outside_gap cada vez.
+    """
+    for k in range(n):
+        yield 0.35 * radius_m * k, rng.uniform(-0.6, 0.6) * radius_m, rng.choice((5.0, 8.0))
+
+
+def pattern_arrival(rng, n, radius_m, leg=300):
+    """
+    Llegada en línea recta a un sitio donde los fijos alternan entre el centro y un
+    anillo a 1.1-2 radios. La ventana de la llegada indexa el anillo, y cada salida al
+    anillo pregunta por un retorno con todo él en las celdas vecinas.
+    """
+    k = 0
+    while k < n:
+        for q in range(min(leg, n - k)):
+            yield -((leg - q) * 1.5 + 3.0) * radius_m, 0.0, 5.0
+        k += leg
+        for q in range(min(leg, n - k)):
+            r = radius_m * (rng.uniform(0.0, 0.3) if q % 2 == 0 else rng.uniform(1.1, 2.0))
+            a = rng.uniform(0.0, 2.0 * math.pi)
+            yield r * math.cos(a), r * math.sin(a), 5.0
+        k += leg
+
+
+PATTERNS = {
+    "moving": pattern_moving,
+    "edge": pattern_edge,
+    "orbit": pattern_orbit,
+    "commute": pattern_commute,
+    "drift": pattern_drift,
+    "arrival": pattern_arrival,
+}
+
+
+def make_track(points):
+    lat0, lon0 = 40.4168, -3.7038
+    t = track_mod.Track()
+    for k, (north, east, acc) in enumerate(points):
+        lat, lon = _offset(lat0, lon0, north, east)
+        t.lat.append(lat)
+        t.lon.append(lon)
+        t.acc.append(acc)
+        t.speed.append(math.nan)
+        t.ts.append((1_750_000_000 + k) * US_PER_S)
+        t.origin.append(k)
+    return t
+
+
+# --------------------------------------------
+# Medición
+# --------------------------------------------
+def _stops_of(track, out):
+    return [(r, vars_of(track.stops[r])) if r in track.stops else (r, None) for r in out]
+
+
+def vars_of(stop):
+    return tuple(getattr(stop, k) for k in Stop.__slots__)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--points", type=int, default=20_000)
+    ap.add_argument("--radius", type=float, default=25.0)
+    ap.add_argument("--stop-time", type=int, default=300)
+    ap.add_argument("--outside-gap", type=int, default=300)
+    ap.add_argument("--max-acc", type=float, default=15.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--patterns", default=",".join(PATTERNS), help="lista separada por comas")
+    args = ap.parse_args(argv)
+
+    print(f"points={args.points} radius={args.radius} stop_time={args.stop_time} "
+          f"outside_gap={args.outside_gap} seed={args.seed}")
+    print(f"{'pattern':<10} {'linear_s':>10} {'window_s':>10} {'speedup':>8} "
+          f"{'linear/pt':>10} {'window/pt':>10} {'out':>7}  same")
+    for name in args.patterns.split(","):
+        pts = list(PATTERNS[name](random.Random(args.seed), args.points, args.radius))
+        sel = list(range(len(pts)))
+
+        old_track = make_track(pts)
+        EVALS[0] = 0
+        t0 = time.perf_counter()
+        old = linear_collapse(old_track, sel, args.radius, args.stop_time, args.outside_gap, args.max_acc)
+        t_old = time.perf_counter() - t0
+        e_old = EVALS[0] / len(pts)
+
+        new_track = make_track(pts)
+        EVALS[0] = 0
+        t0 = time.perf_counter()
+        new = list(stops.iter_collapse_stops(
+            new_track, iter(sel), args.radius, args.stop_time, args.outside_gap, args.max_acc, True
+        ))
+        t_new = time.perf_counter() - t0
+        e_new = EVALS[0] / len(pts)
+
+        same = _stops_of(old_track, old) == _stops_of(new_track, new)
+        speedup = t_old / t_new if t_new else float("inf")
+        print(f"{name:<10} {t_old:10.3f} {t_new:10.3f} {speedup:7.1f}x "
+              f"{e_old:10.1f} {e_new:10.1f} {len(new):7d}  {'yes' if same else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Historiales sintéticos de device_tracker para los benchmarks.
+
+Una persona con casa, trabajo y algunos sitios habituales: noches en casa, trayectos
+de ida y vuelta con recados, paradas largas con jitter GPS, precisión variable,
+spikes (saltos de cientos de metros), duplicados en el mismo segundo y algún estado
+sin coordenadas. La cadencia va de 1 s a varios minutos y el rango de 1 a 31 días.
+Todo es determinista a partir de la semilla.
+"""
+
+import math
+import random
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple
+
+ENTITY_ID = "device_tracker.phone"
+M_PER_DEG_LAT = 111_320.0
+ORIGIN = (40.4168, -3.7038)
+START = datetime(2025, 3, 3, 0, 0, tzinfo=timezone.utc)   # lunes
+
+
+class Scenario(NamedTuple):
+    name: str
+    days: int
+    cadence_s: float        # intervalo medio entre estados
+    jitter_m: float = 6.0   # desviación del ruido GPS en reposo
+    spike_rate: float = 0.01
+
+
+# Matriz por defecto; --quick usa solo las marcadas en QUICK_SCENARIOS
+SCENARIOS = (
+    Scenario("commute_1d_1s", 1, 1.0),
+    Scenario("commute_1d_10s", 1, 10.0),
+    Scenario("jitter_3d_5s", 3, 5.0, jitter_m=15.0, spike_rate=0.03),
+    Scenario("week_30s", 7, 30.0),
+    Scenario("month_60s", 31, 60.0),
+    Scenario("month_5min", 31, 300.0),
+)
+QUICK_SCENARIOS = ("commute_1d_10s", "jitter_3d_5s", "month_5min")
+
+
+class Place(NamedTuple):
+    name: str
+    north_m: float
+    east_m: float
+    radius_m: float
+
+
+PLACES = (
+    Place("Home", 0.0, 0.0, 100.0),
+    Place("Work", 6200.0, 9100.0, 150.0),
+    Place("Gym", 1400.0, -900.0, 60.0),
+    Place("Market", -700.0, 1600.0, 80.0),
+    Place("School", 900.0, 2300.0, 120.0),
+)
+
+
+def to_latlon(north_m: float, east_m: float) -> Tuple[float, float]:
+    lat0, lon0 = ORIGIN
+    return lat0 + north_m / M_PER_DEG_LAT, lon0 + east_m / (M_PER_DEG_LAT * math.cos(math.radians(lat0)))
+
+
+def zone_states(state_cls) -> List[Any]:
+    """Zonas de PLACES como State de zone.* (lo que lee _all_zones)."""
+    out = []
+    for place in PLACES:
+        lat, lon = to_latlon(place.north_m, place.east_m)
+        out.append(state_cls(
+            f"zone.{place.name.lower()}", "0",
+            {"latitude": lat, "longitude": lon, "radius": place.radius_m, "friendly_name": place.name},
+        ))
+    return out
+
+
+def _day_plan(rng: random.Random, weekday: int) -> List[Tuple[float, Place]]:
+    """(hora de salida, destino) del día; se empieza y se acaba en casa."""
+    home, work, gym, market, school = PLACES
+    if weekday < 5:
+        plan = [(rng.gauss(7.8, 0.3), school), (rng.gauss(8.3, 0.2), work)]
+        if rng.random() < 0.4:
+            plan.append((rng.gauss(13.5, 0.3), market))
+            plan.append((rng.gauss(14.3, 0.2), work))
+        plan.append((rng.gauss(17.5, 0.5), gym if rng.random() < 0.5 else market))
+        plan.append((rng.gauss(19.0, 0.4), home))
+    else:
+        plan = [(rng.gauss(11.0, 1.0), market), (rng.gauss(12.5, 0.5), home)]
+        if rng.random() < 0.6:
+            plan.append((rng.gauss(18.0, 1.0), gym))
+            plan.append((rng.gauss(19.5, 0.5), home))
+    # horas crecientes aunque el ruido las cruce
+    hour = 0.0
+    out = []
+    for h, place in plan:
+        hour = max(hour + 0.25, h)
+        out.append((hour, place))
+    return out
+
+
+def _route(rng: random.Random, a: Place, b: Place) -> List[Tuple[float, float]]:
+    """Polilínea tipo callejero (tramos en L con algo de ruido) de a a b."""
+    pts = [(a.north_m, a.east_m)]
+    n_legs = rng.randint(2, 5)
+    for k in range(1, n_legs):
+        t = k / n_legs
+        north = a.north_m + (b.north_m - a.north_m) * t + rng.gauss(0.0, 300.0)
+        east = a.east_m + (b.east_m - a.east_m) * t + rng.gauss(0.0, 300.0)
+        pts.append((north, pts[-1][1]))
+        pts.append((north, east))
+    pts.append((b.north_m, pts[-1][1]))
+    pts.append((b.north_m, b.east_m))
+    return pts
+
+
+def _drive(rng: random.Random, route, t_s: float, cadence_s: float):
+    """Recorre la polilínea a velocidad urbana: (t, norte, este, velocidad m/s)."""
+    speed = rng.uniform(7.0, 16.0)
+    for (n1, e1), (n2, e2) in zip(route, route[1:]):
+        seg = math.hypot(n2 - n1, e2 - e1)
+        pos = 0.0
+        while pos < seg:
+            step = cadence_s * rng.uniform(0.8, 1.2)
+            speed = min(25.0, max(2.0, speed + rng.gauss(0.0, 1.0)))
+            pos += speed * step
+            t_s += step
+            f = min(1.0, pos / seg) if seg > 0 else 1.0
+            yield t_s, n1 + (n2 - n1) * f, e1 + (e2 - e1) * f, speed
+
+
+def iter_fixes(scenario: Scenario, seed: int = 0) -> Iterator[Tuple[float, float, float, float, float]]:
+    """(segundos desde START, norte, este, velocidad, precisión) de todo el rango."""
+    rng = random.Random(seed)
+    cadence = scenario.cadence_s
+    here = PLACES[0]
+    t_s = 0.0
+    for day in range(scenario.days):
+        day_s = day * 86_400.0
+        for hour, dest in _day_plan(rng, (START + timedelta(days=day)).weekday()) + [(24.0, None)]:
+            depart = day_s + hour * 3600.0
+            # parada (con jitter) hasta la hora de salida
+            while t_s + cadence <= depart:
+                t_s += cadence * rng.uniform(0.8, 1.2)
+                acc = rng.choice((5.0, 8.0, 10.0, 12.0, 20.0)) if rng.random() > 0.05 else rng.uniform(30.0, 90.0)
+                sigma = scenario.jitter_m * (acc / 10.0)
+                yield t_s, here.north_m + rng.gauss(0.0, sigma), here.east_m + rng.gauss(0.0, sigma), 0.0, acc
+            if dest is None:
+                break
+            for t_s, north, east, speed in _drive(rng, _route(rng, here, dest), t_s, cadence):
+                yield t_s, north, east, speed, rng.choice((4.0, 6.0, 8.0, 10.0))
+            here = dest
+
+
+def generate_states(scenario: Scenario, state_cls, seed: int = 0) -> List[Any]:
+    """Estados del recorder (instancias de `state_cls`) en orden temporal."""
+    rng = random.Random(seed + 1)
+    out = []
+    battery = 100.0
+    for t_s, north, east, speed, acc in iter_fixes(scenario, seed):
+        if rng.random() < scenario.spike_rate:
+            ang = rng.uniform(0.0, 2.0 * math.pi)
+            jump = rng.uniform(200.0, 1500.0)
+            north += jump * math.cos(ang)
+            east += jump * math.sin(ang)
+        lat, lon = to_latlon(north, east)
+        battery = battery - 0.002 * scenario.cadence_s if battery > 15 else 100.0
+        attrs: Dict[str, Any] = {
+            "source_type": "gps",
+            "latitude": lat,
+            "longitude": lon,
+            "gps_accuracy": acc,
+            "battery_level": round(battery),
+            "friendly_name": "Phone",
+        }
+        r = rng.random()
+        if r < 0.3:
+            attrs["velocity"] = speed * 3.6
+        elif r < 0.8:
+            attrs["speed"] = speed
+        if rng.random() < 0.002:
+            attrs["latitude"] = None
+        ts = START + timedelta(seconds=t_s)
+        out.append(state_cls(ENTITY_ID, "not_home", attrs, ts, ts))
+        if rng.random() < 0.005:
+            # duplicado en el mismo segundo
+            dup = ts + timedelta(microseconds=1) if ts.microsecond < 999_999 else ts
+            out.append(state_cls(ENTITY_ID, "not_home", dict(attrs), dup, dup))
+    return out
+
+
+def time_range(scenario: Scenario) -> Tuple[datetime, datetime]:
+    return START, START + timedelta(days=scenario.days)
@@ -0,0 +1,183 @@
+"""
+Benchmark: reparto de tramos por zonas.
+
+Compara el cruce analítico tramo-círculo (api/zone_index.split_segment_by_zones)
+con el muestreo + bisección que usaba antes _calc_zone_stats, sobre un track
+sintético. No necesita Home Assistant: solo carga kernels.py y zone_index.py.
+
+    python benchmarks/zone_split.py --points 100000 --zones 12
+"""
+
+import argparse
+import importlib
+import math
+import random
+import sys
+import time
+import types
+
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parents[1] / "custom_components" / "ha_tracker" / "api"
+
+
+def _load_api():
+    """Importa los módulos puros de api/ sin ejecutar el __init__ de la integración."""
+    pkg = types.ModuleType("ha_tracker_api")
+    pkg.__path__ = [str(API_DIR)]
+    sys.modules.setdefault("ha_tracker_api", pkg)
+    kernels = importlib.import_module("ha_tracker_api.kernels")
+    zone_index = importlib.import_module("ha_tracker_api.zone_index")
+    return kernels, zone_index
+
+
+kernels, zone_index = _load_api()
+haversine = kernels.haversine
+
+
+# --------------------------------------------
+# Implementación anterior (muestreo + bisección), como referencia
+# --------------------------------------------
+STEPS = 32
+
+
+def _zone_of(lat, lon, zones):
+    best = None
+    for z in zones:
+        if not (z["lat_min"] <= lat <= z["lat_max"] and z["lon_min"] <= lon <= z["lon_max"]):
+            continue
+        d = haversine(lat, lon, z["latitude"], z["longitude"])
+        if d <= z["radius_m"]:
+            if best is None or d < best[0]:
+                best = (d, z["name"])
+    return best[1] if best else ''
+
+
+def _interp_latlon(lat1, lon1, lat2, lon2, t):
+    return lat1 + (lat2 - lat1) * t, lon1 + (lon2 - lon1) * t
+
+
+def _refine_boundary(lat1, lon1, lat2, lon2, t0, t1, zoneA, zones, max_iter=25, eps_m=2.0):
+    lo, hi = t0, t1
+    for _ in range(max_iter):
+        mid = (lo + hi) / 2.0
+        if _zone_of(*_interp_latlon(lat1, lon1, lat2, lon2, mid), zones) == zoneA:
+            lo = mid
+        else:
+            hi = mid
+        Alat, Alon = _interp_latlon(lat1, lon1, lat2, lon2, lo)
+        Blat, Blon = _interp_latlon(lat1, lon1, lat2, lon2, hi)
+        if haversine(Alat, Alon, Blat, Blon) < eps_m:
+            break
+    return (lo + hi) / 2.0
+
+
+def sampled_split(lat1, lon1, lat2, lon2, zones):
+    seg_len_m = haversine(lat1, lon1, lat2, lon2)
+    steps = max(STEPS, max(4, min(64, int(max(1.0, seg_len_m / 10.0)))))
+
+    segs = []
+    prev_t = 0.0
+    prev_zone = _zone_of(lat1, lon1, zones)
+    for i in range(1, steps + 1):
+        t = i / float(steps)
+        z = _zone_of(*_interp_latlon(lat1, lon1, lat2, lon2, t), zones)
+        if z != prev_zone:
+            t_cross = _refine_boundary(lat1, lon1, lat2, lon2, prev_t, t, prev_zone, zones)
+            if t_cross - prev_t > 1e-9:
+                segs.append((prev_zone, prev_t, t_cross))
+            prev_t = t_cross
+            prev_zone = _zone_of(*_interp_latlon(lat1, lon1, lat2, lon2, prev_t), zones)
+    if 1.0 - prev_t > 1e-9:
+        segs.append((prev_zone, prev_t, 1.0))
+    return segs
+
+
+# --------------------------------------------
+# Datos sintéticos
+# --------------------------------------------
+def make_zones(rng, n, lat0, lon0, spread_m):
+    """Zonas circulares (mismo dict que _all_zones), algunas solapadas."""
+    zones = []
+    for k in range(n):
+        r_m = rng.choice((50.0, 100.0, 150.0, 300.0, 800.0, 2000.0))
+        lat = lat0 + rng.uniform(-spread_m, spread_m) / 111_320.0
+        lon = lon0 + rng.uniform(-spread_m, spread_m) / (111_320.0 * math.cos(math.radians(lat0)))
+        dlat = r_m / 111_320.0
+        dlon = r_m / (111_320.0 * math.cos(math.radians(lat)))
+        zones.append({
+            "id": f"z{k}", "name": f"Zone {k}",
+            "latitude": lat, "longitude": lon, "radius_m": r_m,
+            "lat_min": lat - dlat, "lat_max": lat + dlat,
+            "lon_min": lon - dlon, "lon_max": lon + dlon,
+        })
+    return zones
+
+
+def make_track(rng, n, zones, lat0, lon0, spread_m):
+    """Paseo aleatorio con rumbo suave que va visitando zonas al azar."""
+    m_lat = 111_320.0
+    m_lon = 111_320.0 * math.cos(math.radians(lat0))
+    lat, lon = lat0, lon0
+    target = rng.choice(zones)
+    pts = []
+    for _ in range(n):
+        if rng.random() < 0.002:
+            target = rng.choice(zones)
+        dy = (target["latitude"] - lat) * m_lat
+        dx = (target["longitude"] - lon) * m_lon
+        heading = math.atan2(dy, dx) + rng.gauss(0.0, 0.6)
+        step = rng.uniform(2.0, 250.0)        # 1 s .. 30 s a 1..30 m/s
+        lat += step * math.sin(heading) / m_lat
+        lon += step * math.cos(heading) / m_lon
+        if abs((lat - lat0) * m_lat) > spread_m * 1.5 or abs((lon - lon0) * m_lon) > spread_m * 1.5:
+            lat, lon = lat0, lon0
+        pts.append((lat, lon))
+    return pts
+
+
+# --------------------------------------------
+# Medición
+# --------------------------------------------
+def run(split, pts, zones):
+    """Distancia por zona (misma aritmética que _calc_zone_stats) y tiempo total."""
+    per_zone = {}
+    t0 = time.perf_counter()
+    for (lat1, lon1), (lat2, lon2) in zip(pts, pts[1:]):
+        if haversine(lat1, lon1, lat2, lon2) < 0.5:
+            continue
+        for zn, ta, tb in split(lat1, lon1, lat2, lon2, zones):
+            aLat, aLon = _interp_latlon(lat1, lon1, lat2, lon2, ta)
+            bLat, bLon = _interp_latlon(lat1, lon1, lat2, lon2, tb)
+            per_zone[zn] = per_zone.get(zn, 0.0) + haversine(aLat, aLon, bLat, bLon)
+    return time.perf_counter() - t0, per_zone
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--points", type=int, default=100_000)
+    ap.add_argument("--zones", type=int, default=12)
+    ap.add_argument("--spread-m", type=float, default=5000.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    lat0, lon0 = 40.4168, -3.7038
+    zones = make_zones(rng, args.zones, lat0, lon0, args.spread_m)
+    pts = make_track(rng, args.points, zones, lat0, lon0, args.spread_m)
+    index = zone_index.ZoneIndex(zones)
+
+    t_old, d_old = run(sampled_split, pts, zones)
+    t_new, d_new = run(zone_index.split_segment_by_zones, pts, index)
+
+    print(f"points={args.points} zones={args.zones} seed={args.seed}")
+    print(f"sampler   {t_old:8.3f} s")
+    print(f"analytic  {t_new:8.3f} s   x{t_old / t_new if t_new else float('inf'):.1f}")
+    print(f"{'zone':<10} {'sampler_m':>14} {'analytic_m':>14} {'diff_m':>10}")
+    for name in sorted(set(d_old) | set(d_new)):
+        a, b = d_old.get(name, 0.0), d_new.get(name, 0.0)
+        print(f"{name or '(none)':<10} {a:14.1f} {b:14.1f} {b - a:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
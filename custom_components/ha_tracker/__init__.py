@@ -28,7 +28,8 @@ from homeassistant.const import EVENT_HOMEASSISTANT_STARTED
 
 from .api import register_api_views
 from .api.zones import register_zones, unregister_zones
-from .api.reverse_geocode import async_init_reverse_cache
+from .api.reverse_geocode import async_init_reverse_cache, async_unload_reverse_cache
+from .api.filtered_positions import async_remove_day_cache, async_setup_day_cache, async_track_zone_changes
 
 
 # --------------------------------------------------------------------------- #
@@ -140,8 +141,14 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     # Escuchar cambios de opciones
     entry.async_on_unload(entry.add_update_listener(async_reload_entry))
 
+    # Invalidar el índice de zonas del filtro cuando cambie alguna zona
+    entry.async_on_unload(async_track_zone_changes(hass))
+
+    # Caché por días cerrados del recorder para el filtro
+    entry.async_on_unload(async_setup_day_cache(hass))
+
     # ------------------------------------------------------------------ #
-    #  8. Pre-cargar la caché de reverse geocode                         #
+    #  8. Caché de reverse geocode (se carga en background al arrancar)  #
     # ------------------------------------------------------------------ #
     await async_init_reverse_cache(hass)
 
@@ -171,11 +178,21 @@ async def async_unload_entry(hass: HomeAssistant, _entry: ConfigEntry) -> bool:
     # Quitar recurso de Lovelace
     await _remove_lovelace_resource(hass, CARD_URL)
 
+    # Parar la caché de reverse geocode (tareas, listeners y diario pendiente) antes de soltar sus datos
+    await async_unload_reverse_cache(hass)
+
     # Limpiar datos
     hass.data.pop(DOMAIN, None)
 
     return True
 
+
+async def async_remove_entry(hass: HomeAssistant, _entry: ConfigEntry) -> None:
+    """Borrar los datos que la integración guarda en disco al eliminarla."""
+
+    # Caché por días del historial del recorder (.storage/ha_tracker_days.db)
+    await async_remove_day_cache(hass)
+
 # --------------------------------------------------------------------------- #
 #  MANEJO DEL RECURSO LOVELACE                                                #
 # --------------------------------------------------------------------------- #
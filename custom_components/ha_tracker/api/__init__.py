@@ -1,11 +1,12 @@
 from .config import ConfigEndpoint
 from .devices import DevicesEndpoint
-from .filtered_positions import FilteredPositionsEndpoint
+from .filtered_positions import FilteredPositionsBatchEndpoint, FilteredPositionsEndpoint
 from .nearest_position import NearestPositionEndpoint
 from .is_admin import IsAdminEndpoint
+from .metrics import MetricsEndpoint
 from .persons import PersonsEndpoint
 from .zones import ZonesAPI
-from .reverse_geocode import ReverseGeocodeEndpoint
+from .reverse_geocode import ReverseGeocodeBatchEndpoint, ReverseGeocodeEndpoint
 
 _VIEWS_REGISTERED = False
 
@@ -18,8 +19,11 @@ def register_api_views(hass):
     hass.http.register_view(DevicesEndpoint())
     hass.http.register_view(PersonsEndpoint())
     hass.http.register_view(FilteredPositionsEndpoint())
+    hass.http.register_view(FilteredPositionsBatchEndpoint())
     hass.http.register_view(NearestPositionEndpoint())
     hass.http.register_view(IsAdminEndpoint())
     hass.http.register_view(ZonesAPI())
     hass.http.register_view(ReverseGeocodeEndpoint())
+    hass.http.register_view(ReverseGeocodeBatchEndpoint())
+    hass.http.register_view(MetricsEndpoint())
     _VIEWS_REGISTERED = True
@@ -4,6 +4,8 @@ import logging
 
 from homeassistant.components.http import HomeAssistantView
 
+from .metrics import instrumented
+
 DOMAIN = __package__.split(".")[-2]
 
 _LOGGER = logging.getLogger(__name__)
@@ -16,6 +18,7 @@ class ConfigEndpoint(HomeAssistantView):
     name = "api:ha_tracker/config"
     requires_auth = True
 
+    @instrumented("config")
     async def get(self, request):
         """Devuelve la configuración almacenada en config_entries."""
 
@@ -0,0 +1,203 @@
+"""Caché persistente (SQLite en .storage) de los estados del recorder por dispositivo y día UTC"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from .track import EPOCH, dt_to_us
+
+_LOGGER = logging.getLogger(__name__)
+
+DAY_CACHE_FILE = "ha_tracker_days.db"   # dentro de .storage
+DAY_CACHE_VERSION = 1                    # subir si cambia el formato de las filas
+DAY_SETTLE_S = 900                       # un día UTC se da por cerrado 15 min después de acabar
+DAY_ZLIB_LEVEL = 6
+DAY_CACHE_SUFFIXES = ("", "-wal", "-shm")  # la BD y los ficheros del modo WAL
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS days (
+    entity_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (entity_id, day)
+)
+"""
+
+
+class CachedState:
+    """State mínimo reconstruido desde la caché (lo que usan Track y el JSON de salida)."""
+
+    __slots__ = ("entity_id", "state", "attributes", "last_updated", "last_changed")
+
+    def __init__(self, entity_id: str, state: str, attributes: Dict[str, Any], last_updated: datetime, last_changed: datetime) -> None:
+        self.entity_id = entity_id
+        self.state = state
+        self.attributes = attributes
+        self.last_updated = last_updated
+        self.last_changed = last_changed
+
+
+# ----------------------------
+# Días UTC
+# ----------------------------
+def day_start(day: date) -> datetime:
+    """Inicio (00:00 UTC) del día."""
+    return EPOCH + timedelta(days=(day - EPOCH.date()).days)
+
+
+def days_between(start_utc: datetime, end_utc: datetime) -> List[date]:
+    """Días UTC que toca el rango [start, end]."""
+    first, last = start_utc.date(), end_utc.date()
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def first_open_day(now_utc: datetime) -> date:
+    """Primer día que todavía puede recibir estados (los anteriores ya no cambian)."""
+    return (now_utc - timedelta(seconds=DAY_SETTLE_S)).date()
+
+
+# ----------------------------
+# Codificación compacta: JSON de listas + zlib
+# ----------------------------
+def _encode(states: Iterable[Any]) -> bytes:
+    rows = []
+    for s in states:
+        lu = dt_to_us(s.last_updated)
+        # last_changed como delta respecto a last_updated (casi siempre 0)
+        rows.append([lu, dt_to_us(s.last_changed) - lu, s.state, dict(s.attributes)])
+    raw = json.dumps(rows, separators=(",", ":"), ensure_ascii=False, default=str)
+    return zlib.compress(raw.encode("utf-8"), DAY_ZLIB_LEVEL)
+
+
+def _decode(entity_id: str, blob: bytes) -> List[CachedState]:
+    rows = json.loads(zlib.decompress(blob).decode("utf-8"))
+    out = []
+    for lu, dlc, state, attributes in rows:
+        out.append(CachedState(
+            entity_id,
+            state,
+            attributes,
+            EPOCH + timedelta(microseconds=lu),
+            EPOCH + timedelta(microseconds=lu + dlc),
+        ))
+    return out
+
+
+class DayCache:
+    """
+    Estados crudos del recorder por (entity_id, día UTC) para días ya cerrados.
+
+    Se guarda la entrada del pipeline y no su salida: el filtro, el anti-spike y las
+    paradas arrastran estado de un día al siguiente (una parada puede cruzar la
+    medianoche), así que coser salidas diarias no daría el mismo resultado que
+    filtrar el rango entero. Con la entrada cacheada el pipeline se re-ejecuta
+    igual que antes y solo el día en curso se pide al recorder.
+
+    Síncrona: se usa desde el executor del recorder. Cualquier error de SQLite se
+    trata como fallo de caché (nunca rompe la petición).
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self.hits = 0       # días pedidos que estaban en la caché
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._closed:
+            # Tras close() no se reabre (ni se vuelve a crear el fichero)
+            raise sqlite3.OperationalError("day cache closed")
+        if self._conn is None:
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def get(self, entity_id: str, days: List[date]) -> Dict[date, List[CachedState]]:
+        """Días presentes en la caché (los ausentes o corruptos no aparecen en el dict)."""
+        if not days:
+            return {}
+        keys = {d.isoformat(): d for d in days}
+        out: Dict[date, List[CachedState]] = {}
+        try:
+            with self._lock:
+                cur = self._db().execute(
+                    "SELECT day, data FROM days WHERE entity_id = ? AND version = ? AND day BETWEEN ? AND ?",
+                    (entity_id, DAY_CACHE_VERSION, min(keys), max(keys)),
+                )
+                found = cur.fetchall()
+        except sqlite3.Error as e:
+            _LOGGER.warning("Day cache read failed (%s): %s", self._path, e)
+            with self._lock:
+                self.misses += len(keys)
+            return {}
+
+        for day, blob in found:
+            d = keys.get(day)
+            if d is None:
+                continue
+            try:
+                out[d] = _decode(entity_id, blob)
+            except (zlib.error, ValueError, TypeError) as e:
+                _LOGGER.debug("Day cache entry %s/%s discarded: %s", entity_id, day, e)
+        with self._lock:
+            self.hits += len(out)
+            self.misses += len(keys) - len(out)
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def put(self, entity_id: str, days: Dict[date, List[Any]]) -> None:
+        """Guarda (o reemplaza) días completos y cerrados."""
+        if not days:
+            return
+        rows = [(entity_id, d.isoformat(), DAY_CACHE_VERSION, len(states), _encode(states)) for d, states in days.items()]
+        try:
+            with self._lock, self._db() as db:
+                db.executemany("INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            _LOGGER.warning("Day cache write failed (%s): %s", self._path, e)
+
+    def purge_before(self, day: date) -> None:
+        """Borra los días anteriores a `day` (p. ej. los que el recorder ya purgó)."""
+        if self._conn is None and not os.path.exists(self._path):
+            return
+        try:
+            with self._lock, self._db() as db:
+                db.execute("DELETE FROM days WHERE day < ?", (day.isoformat(),))
+        except sqlite3.Error as e:
+            _LOGGER.warning("Day cache purge failed (%s): %s", self._path, e)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except sqlite3.Error:
+                    pass
+                self._conn = None
+
+
+def remove_day_cache(path: str) -> None:
+    """Borra la BD de la caché y sus ficheros WAL (al eliminar la integración)."""
+    for suffix in DAY_CACHE_SUFFIXES:
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            _LOGGER.warning("Could not remove day cache file %s: %s", path + suffix, e)
@@ -6,6 +6,8 @@ import unicodedata
 
 from homeassistant.components.http import HomeAssistantView
 
+from .metrics import instrumented
+
 DOMAIN = __package__.split(".")[-2]
 
 _LOGGER = logging.getLogger(__name__)
@@ -53,6 +55,7 @@ class DevicesEndpoint(HomeAssistantView):
     name = "api:ha_tracker/devices"
     requires_auth = True
 
+    @instrumented("devices")
     async def get(self, request):
         """Devuelve la lista de device_tracker con lat/lon válidas (dentro de rango) y excluyendo (0,0)"""
 
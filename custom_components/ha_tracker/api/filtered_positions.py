@@ -1,21 +1,70 @@
+import asyncio
 import logging
 import math
+import threading
+import time
 
-from typing import List, Tuple, Optional
-from dateutil.parser import isoparse
+from array import array
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Optional
 from datetime import timedelta, datetime
 from functools import partial
 
+from aiohttp import web
+
 from homeassistant.components.http import HomeAssistantView
 from homeassistant.components.recorder import get_instance as get_recorder_instance
 from homeassistant.components.recorder.history import get_significant_states
+from homeassistant.core import callback
+from homeassistant.helpers.event import TrackStates, async_track_state_change_filtered, async_track_time_interval
+from homeassistant.helpers.json import json_bytes
+from homeassistant.helpers.storage import STORAGE_DIR
 from homeassistant.util import dt as dt_util
 
+from .day_cache import DAY_CACHE_FILE, DayCache, day_start, days_between, first_open_day, remove_day_cache
+from .incremental import INCREMENTAL_SETTLE_S, FilterState, IncrementalSession, SessionStore, parse_cursor
+try:  # el lector SQL directo usa internos del recorder (db_schema, session_scope) que pueden cambiar
+    from .recorder_reader import LITE_ATTRIBUTES, AttributesMemo, read_states
+except ImportError as err:  # pragma: no cover - depende de la versión de Home Assistant
+    logging.getLogger(__name__).warning("Direct recorder reader unavailable, using get_significant_states: %s", err)
+    LITE_ATTRIBUTES, AttributesMemo, read_states = (), None, None
+from .kernels import Segments, haversine, segment_metrics, segment_speeds
+from .metrics import MetricFamily, collector, instrumented, observe_stages
+from .simplify import SIMPLIFY_MAX_ZOOM, douglas_peucker
+from .stops import iter_collapse_stops, iter_keep_first_stop, iter_settled_stops
+from .timing import StageTimer, TimingStats, timed
+from .track import COMPACT_FIELDS, Projection, Track, US_PER_S, us_to_iso
+from .track_codec import BINARY_CONTENT_TYPE, ENCODINGS, POLYLINE_CONTENT_TYPE, EncodedTrack, encode_payload
+from .zone_index import ZoneIndex, split_segment_by_zones
+
 DOMAIN = __package__.split(".")[-2]
 
 _LOGGER = logging.getLogger(__name__)
 
 MAX_DAYS_FOR_FILTER = 31
+MAX_BATCH_PERSONS = 16              # personas por petición en filtered_positions/batch
+
+# ----------------------------
+# EJECUCIÓN DEL PIPELINE (fuera del event loop)
+# ----------------------------
+PIPELINE_MAX_CONCURRENCY = 2        # trabajos de filtrado simultáneos (override: options["filter_max_concurrency"])
+PIPELINE_SEMAPHORE_KEY = "filtered_positions_semaphore"   # (límite, asyncio.Semaphore)
+DISCONNECT_POLL_S = 0.5             # cada cuánto se comprueba si el cliente sigue conectado
+
+ZONE_INDEX_KEY = "filtered_positions_zone_index"
+DAY_CACHE_KEY = "filtered_positions_day_cache"   # override: options["filter_day_cache"] = False la desactiva
+DAY_CACHE_PURGE_INTERVAL = timedelta(hours=6)     # recorte periódico a purge_keep_days del recorder
+# Lectura SQL directa del recorder cuando basta con LITE_ATTRIBUTES; override: options["filter_sql_reader"] = False
+_sql_reader_ok = read_states is not None           # False: no se pudo importar o falló una vez (hasta reiniciar)
+ATTRS_MEMO_KEY = "filtered_positions_attrs_memo"  # atributos decodificados por attributes_id (entre lecturas)
+INCREMENTAL_SESSIONS_KEY = "filtered_positions_sessions"
+TIMING_STATS_KEY = "filtered_positions_timing"     # percentiles por etapa (?timings=1, solo admin)
+FUSED_STAGES = ("filter", "anti_spike", "stops")   # desglose de "select" con debug=1
+
+FUSED_CANCEL_ROWS = 4096           # filas crudas entre comprobaciones de `cancel` en el pipeline fusionado
+
+STREAM_CHUNK_POSITIONS = 500        # posiciones por bloque en la respuesta NDJSON (stream=1)
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
 
 # ----------------------------
 # UMBRALES DE FILTRO (ajustables)
@@ -44,62 +93,15 @@ ANTI_SPIKE_RADIUS_FALLBACK = 30.0   # m (float)
 ANTI_SPIKE_TIME_S_FALLBACK = 600    # s (int)
 
 # ----------------------------
-# Haversine
+# Cancelación cooperativa del pipeline
 # ----------------------------
-def haversine(lat1, lon1, lat2, lon2) -> float:
-    """Calcula la distancia en metros entre dos puntos geográficos."""
-    earth_radius_m = 6371000.0
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlmb = math.radians(lon2 - lon1)
-    a = (
-        math.sin(dphi / 2.0) ** 2
-        + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2.0) ** 2
-    )
-    # clamp por estabilidad numérica
-    a = min(1.0, max(0.0, a))
-    return earth_radius_m * (2.0 * math.atan2(math.sqrt(a), math.sqrt(1.0 - a)))
+class PipelineCancelled(Exception):
+    """El cliente se desconectó: se aborta el trabajo en el ejecutor."""
 
-# ----------------------------
-# Helpers para posiciones ya serializadas (dict)
-# ----------------------------
-def _latlon_from_pos(pos) -> Optional[Tuple[float, float]]:
-    try:
-        a = pos.get("attributes", {})
-        return float(a["latitude"]), float(a["longitude"])
-    except Exception:
-        return None
 
-def _acc_from_pos(pos) -> Optional[float]:
-    a = pos.get("attributes", {})
-    acc = a.get("gps_accuracy", a.get("accuracy"))
-    try:
-        return float(acc) if acc is not None else None
-    except Exception:
-        return None
-
-def _dt_from_pos(pos):
-    v = pos.get("last_updated")
-    if isinstance(v, datetime):
-        return dt_util.as_utc(v) if v.tzinfo else dt_util.as_utc(v.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE))
-    if v is None:
-        return None
-    try:
-        dt = isoparse(v if isinstance(v, str) else str(v))
-        return dt_util.as_utc(dt if dt.tzinfo else dt.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE))
-    except Exception:
-        return None
-
-def _as_dt(v):
-    if isinstance(v, datetime):
-        return dt_util.as_utc(v) if v.tzinfo else dt_util.as_utc(v.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE))
-    if v is None:
-        return None
-    try:
-        dt = isoparse(v if isinstance(v, str) else str(v))
-        return dt_util.as_utc(dt if dt.tzinfo else dt.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE))
-    except Exception:
-        return None
+def _check_cancel(cancel: Optional[threading.Event]) -> None:
+    if cancel is not None and cancel.is_set():
+        raise PipelineCancelled()
 
 # ----------------------------
 # Validaciones de query/persona/fechas
@@ -114,6 +116,22 @@ def validate_query_params(query):
 
     return person_id, start_date, end_date, None
 
+def validate_batch_params(query):
+    """person_id repetido y/o person_ids=a,b,c más el rango común."""
+    persons: List[str] = []
+    for value in list(query.getall("person_id", [])) + [query.get("person_ids") or ""]:
+        persons.extend(p.strip() for p in value.split(","))
+    persons = list(dict.fromkeys(p for p in persons if p))
+    start_date = query.get("start_date")
+    end_date = query.get("end_date")
+
+    if not all([persons, start_date, end_date]):
+        return None, None, None, {"error": "Missing parameters", "status_code": 400}
+    if len(persons) > MAX_BATCH_PERSONS:
+        return None, None, None, {"error": f"At most {MAX_BATCH_PERSONS} persons per request", "status_code": 400}
+
+    return persons, start_date, end_date, None
+
 def validate_person(hass, person_id):
     person_state = hass.states.get(person_id)
     if not person_state:
@@ -162,92 +180,106 @@ def validate_dates(start_date, end_date):
 
     return start_utc, end_utc, None
 
+def validate_simplify(query):
+    """simplify= (tolerancia en m) o zoom= (nivel de mapa) -> (tolerance_m, zoom, error)."""
+    simplify = query.get("simplify")
+    zoom = query.get("zoom")
+    try:
+        tolerance_m = float(simplify) if simplify not in (None, "") else None
+        zoom_level = float(zoom) if zoom not in (None, "") else None
+    except ValueError:
+        return None, None, {"error": "simplify and zoom must be numbers", "status_code": 400}
+
+    if tolerance_m is not None and not (math.isfinite(tolerance_m) and tolerance_m >= 0):
+        return None, None, {"error": "simplify must be >= 0", "status_code": 400}
+    if zoom_level is not None and not (0 <= zoom_level <= SIMPLIFY_MAX_ZOOM):
+        return None, None, {"error": f"zoom must be between 0 and {SIMPLIFY_MAX_ZOOM}", "status_code": 400}
+
+    return tolerance_m, zoom_level, None
+
 # ----------------------------
 # Filtro base (precisión, velocidad, distancia/tiempo)
 # ----------------------------
 def filter_positions(
-    history,
+    track: Track,
     max_gps_accuracy_m: float,
     max_speed_kmh: float,
     min_distance=MIN_DISTANCE,
-    min_time_s=MIN_TIME,   
-):
+    min_time_s=MIN_TIME,
+    rows=None,
+    state: Optional[FilterState] = None,
+    upto: Optional[int] = None,
+) -> array:
     """
-    Filtra estados de device_tracker aplicando:
+    Filtra las filas del track aplicando:
       1) Precisión GPS máxima
       2) Tope de velocidad respecto al último punto aceptado
       3) Distancia mínima entre puntos aceptados
       4) Tiempo mínimo entre puntos aceptados (+ deduplicación por segundo)
-    """
-    positions = []
-    last_lat, last_lon = None, None
-    last_seen_dt_rounded = None  # último aceptado, redondeado a segundo
-    last_seen_dt_real = None     # último aceptado, datetime real
-    last_position = None         # último candidato, para 'asegurar última posición'
-
-    for state in history:
-        latitude = state.attributes.get("latitude")
-        longitude = state.attributes.get("longitude")
-        if latitude is None or longitude is None:
-            continue
+    Devuelve la selección de filas aceptadas (array('l')).
 
-        try:
-            latitude = float(latitude)
-            longitude = float(longitude)
-        except (TypeError, ValueError):
-            continue
+    Reanudable: `rows` son las filas crudas en orden (por defecto todas) y `state`
+    continúa desde state.next actualizándolo. Con `upto` se procesa solo hasta ahí,
+    sin la regla de la última posición, y se devuelve la selección confirmada.
+    """
+    if rows is None:
+        rows = range(len(track.ts))
+    st = state if state is not None else FilterState()
+    stop_at = len(rows) if upto is None else upto
+    st.sel.extend(_accepted_rows(
+        track, rows, st, stop_at, max_gps_accuracy_m, max_speed_kmh, min_distance, min_time_s
+    ))
+    sel = st.sel
+    if upto is not None:
+        return sel
+    if state is not None:
+        # la regla final depende de dónde acaba el rango: no se guarda en el estado
+        sel = array("l", sel)
+
+    last = rows[-1] if len(rows) else -1
+    if (
+        last >= 0
+        and (not sel or track.ts[sel[-1]] != track.ts[last])
+        and _keeps_last(track, last, st, max_gps_accuracy_m, max_speed_kmh, min_time_s)
+    ):
+        sel.append(last)
 
-        attrs = dict(state.attributes)
+    return sel
 
-        # speedMps / velocity -> speed (m/s)
-        if "speed" not in attrs:
-            # Prioridad: speedMps (ya viene en m/s)
-            if "speedMps" in attrs:
-                try:
-                    attrs["speed"] = round(float(attrs["speedMps"]), 2)
-                except (TypeError, ValueError):
-                    pass
-            # Alternativa: OwnTracks "velocity" (km/h -> m/s)
-            elif "velocity" in attrs:
-                try:
-                    attrs["speed"] = round(float(attrs.pop("velocity")) / 3.6, 2)
-                except (TypeError, ValueError):
-                    pass
 
-       # Normaliza speed: si es numérica y < 0 -> 0.0
-        try:
-            spd = float(attrs.get("speed"))
-            if math.isfinite(spd) and spd < 0:
-                attrs["speed"] = 0.0
-        except (TypeError, ValueError):
-            pass
-            
-        current_datetime = dt_util.as_utc(state.last_updated)
-        current_datetime_rounded = current_datetime.replace(microsecond=0)
+def _accepted_rows(
+    track: Track,
+    rows,
+    st: FilterState,
+    stop_at: int,
+    max_gps_accuracy_m: float,
+    max_speed_kmh: float,
+    min_distance,
+    min_time_s,
+) -> Iterator[int]:
+    """
+    Núcleo de filter_positions: produce las filas de rows[st.next:stop_at] que se
+    aceptan y, al terminar, deja `st` apuntando a stop_at (st.sel no se toca).
+    """
+    lat_col, lon_col, acc_col, ts_col = track.lat, track.lon, track.acc, track.ts
+    last_lat, last_lon = st.last_lat, st.last_lon
+    last_seen_s = st.last_seen_s    # último aceptado, redondeado a segundo
+    last_seen_us = st.last_seen_us  # último aceptado, instante real (us)
 
-        # Precisión GPS
-        accuracy_raw = attrs.get("gps_accuracy", attrs.get("accuracy"))
-        try:
-            accuracy_m = float(accuracy_raw) if accuracy_raw is not None else None
-        except (TypeError, ValueError):
-            accuracy_m = None
-
-        candidate = {
-            "entity_id": state.entity_id,
-            "state": state.state,
-            "attributes": attrs,
-            "last_updated": state.last_updated.isoformat(),
-            "last_changed": state.last_changed.isoformat(),
-        }
-        last_position = candidate
+    for row in rows[st.next:stop_at]:
+        latitude = lat_col[row]
+        longitude = lon_col[row]
+        current_us = ts_col[row]
+        current_s = current_us // US_PER_S
 
         # 1) Precisión
-        if accuracy_m is not None and accuracy_m > max_gps_accuracy_m:
+        accuracy_m = acc_col[row]
+        if accuracy_m > max_gps_accuracy_m:
             continue
 
         # 2) Velocidad respecto al último aceptado
-        if last_lat is not None and last_lon is not None and last_seen_dt_real is not None:
-            dt_real_s = (current_datetime - last_seen_dt_real).total_seconds()
+        if last_lat is not None and last_seen_us is not None:
+            dt_real_s = (current_us - last_seen_us) / US_PER_S
             if dt_real_s > 0:
                 dist_m = haversine(last_lat, last_lon, latitude, longitude)
                 speed_kmh = (dist_m / dt_real_s) * 3.6
@@ -255,400 +287,439 @@ def filter_positions(
                     continue
 
         # 3) Distancia mínima entre aceptados
-        if last_lat is not None and last_lon is not None:
-            dist_m_for_min = haversine(last_lat, last_lon, latitude, longitude)
-        else:
-            dist_m_for_min = None
-
         is_distance_ok = (
             last_lat is None
-            or last_lon is None
-            or (dist_m_for_min is not None and dist_m_for_min > min_distance)
+            or haversine(last_lat, last_lon, latitude, longitude) > min_distance
         )
 
         # 4) Tiempo mínimo + deduplicación por segundo
-        if last_seen_dt_real is not None:
-            dt_since_last = (current_datetime - last_seen_dt_real).total_seconds()
-        else:
-            dt_since_last = None
-
         is_time_ok = (
-            last_seen_dt_real is None
+            last_seen_us is None
             or (
                 # respeta el umbral de tiempo mínimo si está activo
-                (min_time_s <= 0 or (dt_since_last is not None and dt_since_last >= float(min_time_s)))
+                (min_time_s <= 0 or (current_us - last_seen_us) / US_PER_S >= float(min_time_s))
                 # y evita duplicados exactamente en el mismo segundo
-                and (current_datetime_rounded != last_seen_dt_rounded)
+                and (current_s != last_seen_s)
             )
         )
 
         if is_distance_ok and is_time_ok:
-            positions.append(candidate)
+            yield row
             last_lat, last_lon = latitude, longitude
-            last_seen_dt_rounded = current_datetime_rounded
-            last_seen_dt_real = current_datetime
+            last_seen_s = current_s
+            last_seen_us = current_us
 
-    # Asegurar última posición (respetando filtros y datos mínimos)
-    if last_position and (not positions or positions[-1]["last_updated"] != last_position["last_updated"]):
-        attrs_last = last_position.get("attributes", {})
-        accuracy_raw = attrs_last.get("gps_accuracy", attrs_last.get("accuracy"))
-        try:
-            accuracy_m = float(accuracy_raw) if accuracy_raw is not None else None
-        except Exception:
-            accuracy_m = None
+    st.next = stop_at
+    st.last_lat, st.last_lon = last_lat, last_lon
+    st.last_seen_s, st.last_seen_us = last_seen_s, last_seen_us
+
+
+def _keeps_last(
+    track: Track,
+    last: int,
+    st: FilterState,
+    max_gps_accuracy_m: float,
+    max_speed_kmh: float,
+    min_time_s,
+) -> bool:
+    """Asegurar última posición (respetando filtros y datos mínimos) tras el último aceptado de `st`."""
+    lat2, lon2 = track.lat[last], track.lon[last]
+    latlon_ok = math.isfinite(lat2) and math.isfinite(lon2)
 
-        # Requiere lat/lon válidos
+    ok_by_speed = True
+    ok_by_time = True
+
+    if st.last_seen_us is not None:
         try:
-            lat2 = float(attrs_last.get("latitude"))
-            lon2 = float(attrs_last.get("longitude"))
-            latlon_ok = math.isfinite(lat2) and math.isfinite(lon2)
-        except Exception:
-            latlon_ok = False
+            t2_us = track.ts[last]
+            dt_s = (t2_us - st.last_seen_us) / US_PER_S
 
-        ok_by_speed = True
-        ok_by_time = True
+            # tiempo mínimo entre aceptados
+            if min_time_s > 0 and dt_s < float(min_time_s):
+                ok_by_time = False
 
-        if last_seen_dt_real is not None:
-            try:
-                t2 = dt_util.as_utc(isoparse(last_position["last_updated"]))
-                dt_s = (t2 - last_seen_dt_real).total_seconds()
-
-                # tiempo mínimo entre aceptados
-                if min_time_s > 0 and dt_s is not None and dt_s < float(min_time_s):
-                    ok_by_time = False
-
-                # deduplicación exacta por segundo
-                if ok_by_time and t2.replace(microsecond=0) == last_seen_dt_rounded:
-                    ok_by_time = False
-
-                # velocidad respecto al último aceptado
-                if dt_s > 0 and latlon_ok and last_lat is not None and last_lon is not None:
-                    dist_m = haversine(last_lat, last_lon, lat2, lon2)
-                    speed_kmh = (dist_m / dt_s) * 3.6
-                    if speed_kmh > max_speed_kmh:
-                        ok_by_speed = False
-            except Exception:
-                ok_by_speed = True
-                ok_by_time = True
-
-        if (
-            latlon_ok
-            and ok_by_speed
-            and ok_by_time
-            and not (accuracy_m is not None and accuracy_m > max_gps_accuracy_m)
-        ):
-            positions.append(last_position)
+            # deduplicación exacta por segundo
+            if ok_by_time and t2_us // US_PER_S == st.last_seen_s:
+                ok_by_time = False
 
-    return positions
+            # velocidad respecto al último aceptado
+            if dt_s > 0 and latlon_ok and st.last_lat is not None:
+                dist_m = haversine(st.last_lat, st.last_lon, lat2, lon2)
+                speed_kmh = (dist_m / dt_s) * 3.6
+                if speed_kmh > max_speed_kmh:
+                    ok_by_speed = False
+        except Exception:
+            ok_by_speed = True
+            ok_by_time = True
+
+    return (
+        latlon_ok
+        and ok_by_speed
+        and ok_by_time
+        and not (track.acc[last] > max_gps_accuracy_m)
+    )
 
 
 #------------------------------
 # Anti-spike 5 puntos por velocidad relativa (A→B, B→C→D, D→E)
 #------------------------------
 def drop_c_spikes_relative_5pt(
-    positions: List[dict],
+    track: Track,
+    sel: array,
     max_gps_accuracy_m: float = MAX_GPS_ACCURACY_M_FALLBACK,
     factor_k: float = 3.0,          # v_detour debe superar k·v1 y k·v2
     min_detour_ratio: float = 1.7,   # (dBC + dCD) / dBD > R => hay ida-vuelta clara
     max_bd_dt_s: int = 180,          # B→D debe suceder “rápido”
     min_leg_m: float = 15.0,         # cada pierna (BC y CD) al menos X m
-    require_good_acc: bool = REQUIRE_GOOD_ACC,    
-) -> List[dict]:
+    require_good_acc: bool = REQUIRE_GOOD_ACC,
+) -> array:
     """
     Elimina el punto central C cuando el tramo B→C→D es anormalmente rápido
     frente a las velocidades de contexto A→B y D→E, y además forma un desvío
     (ida-vuelta) claro en un tiempo corto.
     """
-    n = len(positions)
-    if n < 5:
-        return positions
+    drop_idx = _spike_drops(
+        track, sel, max_gps_accuracy_m, factor_k, min_detour_ratio, max_bd_dt_s, min_leg_m, require_good_acc
+    )
+    if not drop_idx:
+        return sel
+
+    return array("l", (r for j, r in enumerate(sel) if j not in drop_idx))
 
-    def _t(i): return _dt_from_pos(positions[i])
-    def _ll(i): return _latlon_from_pos(positions[i])
 
-    drop_idx = set()
+def _spike_test(
+    track: Track,
+    max_gps_accuracy_m: float,
+    factor_k: float,
+    min_detour_ratio: float,
+    max_bd_dt_s: int,
+    min_leg_m: float,
+    require_good_acc: bool,
+):
+    """
+    Regla del anti-spike para una ventana A..E: devuelve is_spike(B, C, D, dBC, dCD,
+    dtAB, dtDE, v1, v2) con las métricas de los tramos ya calculadas.
+    """
+    lat_col, lon_col, acc_col, ts_col = track.lat, track.lon, track.acc, track.ts
     eps_v = 1e-6
     eps_d = 1e-6
 
-    for i in range(2, n - 2):
-        A, B, C, D, E = positions[i-2], positions[i-1], positions[i], positions[i+1], positions[i+2]
-
+    def is_spike(B, C, D, dBC, dCD, dtAB, dtDE, v1, v2) -> bool:
         # Precisión opcional (al menos en C; puedes ampliar a B y D si quieres)
-        if require_good_acc:
-            accC = _acc_from_pos(C)
-            if accC is not None and accC > max_gps_accuracy_m:
-                continue
-
-        tA, tB, tC, tD, tE = _t(i-2), _t(i-1), _t(i), _t(i+1), _t(i+2)
-        llA, llB, llC, llD, llE = _ll(i-2), _ll(i-1), _ll(i), _ll(i+1), _ll(i+2)
-        if not all([tA, tB, tC, tD, tE, llA, llB, llC, llD, llE]):
-            continue
+        if require_good_acc and acc_col[C] > max_gps_accuracy_m:
+            return False
 
-        dtAB = (tB - tA).total_seconds()
-        dtDE = (tE - tD).total_seconds()
-        dtBD = (tD - tB).total_seconds()
+        dtBD = (ts_col[D] - ts_col[B]) / US_PER_S
         if dtAB <= 0 or dtDE <= 0 or dtBD <= 0 or dtBD > max_bd_dt_s:
-            continue
-
-        dAB = haversine(llA[0], llA[1], llB[0], llB[1])
-        dBC = haversine(llB[0], llB[1], llC[0], llC[1])
-        dCD = haversine(llC[0], llC[1], llD[0], llD[1])
-        dDE = haversine(llD[0], llD[1], llE[0], llE[1])
-        dBD = haversine(llB[0], llB[1], llD[0], llD[1])
+            return False
 
         # Evitar borrar microvariaciones por debajo de la precisión/ruido
         if dBC < min_leg_m or dCD < min_leg_m:
-            continue
+            return False
+
+        dBD = haversine(lat_col[B], lon_col[B], lat_col[D], lon_col[D])
 
-        v1 = dAB / max(dtAB, eps_v)
-        v2 = dDE / max(dtDE, eps_v)
+        # Δt >= 1 us > eps_v, así que la velocidad del tramo ya es d/Δt
         v_detour = (dBC + dCD) / max(dtBD, eps_v)
 
         detour_ratio = (dBC + dCD) / max(dBD, eps_d)
 
         # Condición principal: v_detour mucho mayor que velocidades “de contexto”
         # y además desvío geométrico claro.
-        if (v_detour > factor_k * max(v1, v2, eps_v)) and (detour_ratio > min_detour_ratio):
-            # Marca C para borrado
-            # _LOGGER.debug("drop_c_spikes_relative_5pt: drop C idx=%d v_detour=%.2f v1=%.2f v2=%.2f ratio=%.2f", i, v_detour, v1, v2, detour_ratio)
-            drop_idx.add(i)
+        return (v_detour > factor_k * max(v1, v2, eps_v)) and (detour_ratio > min_detour_ratio)
 
-    if not drop_idx:
-        return positions
+    return is_spike
+
+
+def _spike_drops(
+    track: Track,
+    sel,
+    max_gps_accuracy_m: float,
+    factor_k: float,
+    min_detour_ratio: float,
+    max_bd_dt_s: int,
+    min_leg_m: float,
+    require_good_acc: bool,
+) -> set:
+    """
+    Posiciones de `sel` que drop_c_spikes_relative_5pt elimina. La decisión sobre la
+    posición i solo depende de sel[i-2 .. i+2] (sobre la selección de entrada, no sobre
+    la ya depurada): se puede evaluar por tramos solapando 2 posiciones.
+    """
+    n = len(sel)
+    if n < 5:
+        return set()
+
+    is_spike = _spike_test(
+        track, max_gps_accuracy_m, factor_k, min_detour_ratio, max_bd_dt_s, min_leg_m, require_good_acc
+    )
+
+    # distancias/velocidades de tramos consecutivos calculadas una sola vez
+    seg = segment_metrics(track, sel)
+    dist, dts = seg.dist_m, seg.dt_s
+    speeds = segment_speeds(seg)
+
+    # Marca C para borrado
+    return {
+        i for i in range(2, n - 2)
+        if is_spike(sel[i-1], sel[i], sel[i+1], dist[i-1], dist[i], dts[i-2], dts[i+1], speeds[i-2], speeds[i+1])
+    }
 
-    out = [p for j, p in enumerate(positions) if j not in drop_idx]
-    return out
+
+def _iter_drop_spikes(
+    track: Track,
+    rows: Iterator[int],
+    max_gps_accuracy_m: float,
+    factor_k: float,
+    min_detour_ratio: float,
+    max_bd_dt_s: int,
+    min_leg_m: float,
+    require_good_acc: bool,
+) -> Iterator[int]:
+    """
+    drop_c_spikes_relative_5pt como etapa en flujo: ventana deslizante de 5 posiciones
+    (A..E) y de las métricas de sus 4 tramos; cada posición sale con 2 de retraso.
+    Las métricas se calculan tramo a tramo (haversine), como segment_metrics sin NumPy.
+    """
+    is_spike = _spike_test(
+        track, max_gps_accuracy_m, factor_k, min_detour_ratio, max_bd_dt_s, min_leg_m, require_good_acc
+    )
+    lat_col, lon_col, ts_col = track.lat, track.lon, track.ts
+
+    win: deque = deque(maxlen=5)
+    legs: deque = deque(maxlen=4)   # (distancia, Δt, velocidad) entre posiciones seguidas de win
+    seen = 0
+    for row in rows:
+        if win:
+            prev = win[-1]
+            d = haversine(lat_col[prev], lon_col[prev], lat_col[row], lon_col[row])
+            dt = (ts_col[row] - ts_col[prev]) / US_PER_S
+            legs.append((d, dt, d / dt if dt > 0 else 0.0))
+        win.append(row)
+        seen += 1
+        if seen < 3:
+            continue
+        if seen < 5:
+            # las dos primeras posiciones no tienen contexto A→B: se conservan
+            yield win[-3]
+            continue
+        (_, dtAB, v1), (dBC, _, _), (dCD, _, _), (_, dtDE, v2) = legs
+        if not is_spike(win[1], win[2], win[3], dBC, dCD, dtAB, dtDE, v1, v2):
+            yield win[2]
+
+    # las dos últimas tampoco tienen contexto D→E
+    yield from list(win)[-2:]
 
 # ----------------------------
 # Stops + colapso de jitter (unificado)
 # ----------------------------
 def keep_first_stop_in_same_radius(
-    positions: List[dict],
+    track: Track,
+    sel: array,
     same_radius_m: float,
     reentry_gap_s: int = 0,
-) -> List[dict]:
-    out = []
-    prev_stop = None
-
-    for pos in positions:
-        if not pos.get("stop"):
-            out.append(pos)
-            continue
+) -> array:
+    """Fusiona paradas consecutivas dentro del mismo radio si la salida entre ellas fue breve."""
+    return array("l", iter_keep_first_stop(track, sel, same_radius_m, reentry_gap_s))
 
-        keep = True
-        if prev_stop is not None:
-            ll_prev = _stop_center_latlon(prev_stop)
-            ll_cur  = _stop_center_latlon(pos)
-            if ll_prev and ll_cur:
-                d = haversine(ll_prev[0], ll_prev[1], ll_cur[0], ll_cur[1])
-                if d <= same_radius_m:
-                    t_leave_prev = _as_dt(prev_stop.get("stop_leave") or prev_stop.get("stop_end") or prev_stop.get("last_updated"))
-                    t_start_cur  = _as_dt(pos.get("stop_start")  or pos.get("last_updated"))
-                    gap_s = (t_start_cur - t_leave_prev).total_seconds() if (t_leave_prev and t_start_cur) else None
-
-                    if gap_s is None or gap_s < float(reentry_gap_s):
-                        # --- FUSIÓN: extender la parada anterior con los tiempos de la actual ---
-                        # stop_end: máximo de ambos
-                        t_end_prev = _as_dt(prev_stop.get("stop_end") or prev_stop.get("last_updated"))
-                        t_end_cur  = _as_dt(pos.get("stop_end") or pos.get("last_updated"))
-                        if t_end_prev and t_end_cur and t_end_cur > t_end_prev:
-                            prev_stop["stop_end"] = t_end_cur.isoformat()
-
-                        # stop_leave: máximo de ambos
-                        t_leave_cur = _as_dt(pos.get("stop_leave") or pos.get("stop_end") or pos.get("last_updated"))
-                        if t_leave_prev and t_leave_cur and t_leave_cur > t_leave_prev:
-                            prev_stop["stop_leave"] = t_leave_cur.isoformat()
-
-                        # Recalcular duración desde su stop_start original
-                        t_start_prev = _as_dt(prev_stop.get("stop_start") or prev_stop.get("last_updated"))
-                        t_leave_new  = _as_dt(prev_stop.get("stop_leave") or prev_stop.get("stop_end") or prev_stop.get("last_updated"))
-                        if t_start_prev and t_leave_new and t_leave_new >= t_start_prev:
-                            prev_stop["stop_duration_s"] = int((t_leave_new - t_start_prev).total_seconds())
-
-                        keep = False  # descartamos 'pos' porque ya fue fusionada
-
-        if keep:
-            out.append(pos)
-            prev_stop = pos
-
-    return out
-
-
-def _stop_center_latlon(pos) -> Optional[Tuple[float, float]]:
-    lat = pos.get("stop_center_lat")
-    lon = pos.get("stop_center_lon")
-    if lat is not None and lon is not None:
-        try:
-            return float(lat), float(lon)
-        except Exception:
-            pass
-    return _latlon_from_pos(pos)
 
 def annotate_stops_and_collapse(
-    positions: List[dict],
+    track: Track,
+    sel: array,
     stop_radius_m: float,
     stop_time_s: int,
     reentry_gap_s: int,
-    outside_gap_s: int,   
+    outside_gap_s: int,
     max_gps_accuracy_m: float,
-    require_good_acc: bool = REQUIRE_GOOD_ACC,    
-) -> List[dict]:
+    require_good_acc: bool = REQUIRE_GOOD_ACC,
+) -> array:
     """
     Detección de paradas por radio + cálculo del dwell hasta el primer punto FUERA.
     Si no es parada (dwell < stop_time_s), NO se colapsa el grupo.
     Sin 'fallback' de gap: el dwell usa directamente t_next (si existe).
+    Cada parada se añade al track como fila derivada (Track.add_stop).
     """
-    n = len(positions)
+    n = len(sel)
     if n == 0 or stop_radius_m <= 0:
-        return positions
+        return sel
 
     if stop_time_s <= 0:
-        return positions
-
-    # limpiar marcas previas
-    for p in positions:
-        p["stop"] = False
-        p.pop("stop_start", None)
-        p.pop("stop_end", None)
-        p.pop("stop_leave", None)
-        p.pop("stop_duration_s", None)
-        p.pop("stop_center_lat", None)
-        p.pop("stop_center_lon", None)
-
-    def latlon(idx):
-        try:
-            a = positions[idx]["attributes"]
-            return float(a["latitude"]), float(a["longitude"])
-        except Exception:
-            return None
+        return sel
 
-    def t(idx):
-        try:
-            return _dt_from_pos(positions[idx])
-        except Exception:
-            return None
-
-    def acc_ok(idx):
-        if not require_good_acc:
-            return True
-        a = _acc_from_pos(positions[idx])
-        return (a is None) or (a <= max_gps_accuracy_m)
-
-    out = []
-    i = 0
-
-    while i < n:
-        anchor = latlon(i)
-        if not anchor or not acc_ok(i):
-            out.append(positions[i])
-            i += 1
-            continue
+    out = _collapse_stops(track, sel, stop_radius_m, stop_time_s, outside_gap_s, max_gps_accuracy_m, require_good_acc)
+    return keep_first_stop_in_same_radius(track, out, same_radius_m=stop_radius_m, reentry_gap_s=reentry_gap_s)
 
-        # Grupo por radio con centroide incremental
-        c_lat, c_lon = anchor
-        count = 1
-        t_start = t(i)
-        last_in = i
-        j = i
-
-        def close_group(t_next):
-            """
-            Cierra el grupo actual calculando el dwell desde t_start hasta:
-              - t_next, si existe y es el primer punto fuera del radio
-              - t_last_in, si no hay siguiente (fin de lista)
-            """
-            t_last_in = t(last_in) or t_start
-            leave_dt = t_next if t_next else t_last_in
-            dwell_s = (leave_dt - t_start).total_seconds() if (t_start and leave_dt) else 0
-
-            if dwell_s >= stop_time_s:
-                rep = positions[i].copy()
-                attrs_src = positions[i].get("attributes", {})
-                rep["attributes"] = dict(attrs_src)  # <- copia del dict para no mutar el original
-                rep["stop"] = True
-                rep["stop_start"] = t_start.isoformat() if t_start else None
-                rep["stop_end"] = t_last_in.isoformat() if t_last_in else None
-                rep["stop_leave"] = leave_dt.isoformat() if leave_dt else None
-                rep["stop_duration_s"] = dwell_s
-                rep["stop_center_lat"] = c_lat
-                rep["stop_center_lon"] = c_lon
-                # coords visibles al centroide
-                rep["attributes"]["latitude"] = c_lat
-                rep["attributes"]["longitude"] = c_lon   
-                rep["attributes"]["speed"] = 0.0
-                
-                out.append(rep)
-            else:
-                # NO colapsar: conservar puntos originales "dentro"
-                out.extend(positions[i:last_in + 1])
 
-        while j + 1 < n:
-            t_next = t(j + 1)
-            nxt_ll = latlon(j + 1)
+def _collapse_stops(
+    track: Track,
+    sel,
+    stop_radius_m: float,
+    stop_time_s: int,
+    outside_gap_s: int,
+    max_gps_accuracy_m: float,
+    require_good_acc: bool,
+    checkpoints: Optional[list] = None,
+) -> array:
+    """
+    Recorrido de annotate_stops_and_collapse (stops.iter_collapse_stops), antes de
+    fusionar paradas.
 
-            # Siguiente inválido o mala precisión -> ignorar y seguir
-            if (nxt_ll is None) or (not acc_ok(j + 1)):
-                j += 1
-                continue
+    `checkpoints` (opcional) recibe (i, len(out), horizonte) cada vez que el recorrido
+    empieza en la posición i: todo lo emitido antes solo depende de sel[:horizonte]
+    (math.inf si la decisión dependió del final de la lista).
+    """
+    return array("l", iter_collapse_stops(
+        track, iter(sel), stop_radius_m, stop_time_s, outside_gap_s, max_gps_accuracy_m, require_good_acc, checkpoints
+    ))
 
-            # Distancia al centroide
-            dist_to_center = haversine(c_lat, c_lon, nxt_ll[0], nxt_ll[1])
 
-            if dist_to_center <= stop_radius_m:
-                j += 1
-                count += 1
-                last_in = j
-                # actualizar centroide incremental
-                c_lat = (c_lat * (count - 1) + nxt_ll[0]) / count
-                c_lon = (c_lon * (count - 1) + nxt_ll[1]) / count
-                continue
+def _fused_selection(
+    track: Track,
+    params: Dict[str, Any],
+    cancel: Optional[threading.Event] = None,
+    timer: Optional[StageTimer] = None,
+) -> array:
+    """
+    Filtro base, anti-spike y paradas en una sola pasada (_fused_rows). Mismo resultado
+    que encadenar filter_positions, drop_c_spikes_relative_5pt y
+    annotate_stops_and_collapse.
+    Con un `timer` en modo debug se mide además el tiempo propio de cada etapa (FUSED_STAGES).
+    """
+    sel = array("l", _fused_rows(track, params, cancel, timer))
+    if timer is not None and timer.debug:
+        timer.exclusive(FUSED_STAGES)
+    _check_cancel(cancel)
+    return sel
+
+
+def _fused_rows(
+    track: Track,
+    params: Dict[str, Any],
+    cancel: Optional[threading.Event] = None,
+    timer: Optional[StageTimer] = None,
+) -> Iterator[int]:
+    """
+    Filas seleccionadas de _fused_selection según salen: cada etapa es un generador que
+    consume la anterior, así que las selecciones intermedias no se materializan
+    (memoria O(ventana): 5 posiciones del anti-spike más el grupo/outside_gap de las
+    paradas). Los campos de una parada ya emitida pueden cambiar hasta que se agota
+    (iter_keep_first_stop); iter_settled_stops retiene lo justo para que no.
+    """
+    detail = timer is not None and timer.debug
+    max_gps_accuracy_m = float(params["max_gps_accuracy_m"])
+    rows = _iter_filter(
+        track,
+        max_gps_accuracy_m=max_gps_accuracy_m,
+        max_speed_kmh=float(params["max_speed_kmh"]),
+        min_distance=MIN_DISTANCE,
+        cancel=cancel,
+    )
+    if detail:
+        rows = timer.iter_timed("filter", rows)
+
+    # Anti-spike 5 puntos por velocidad relativa (A→B, B→C→D, D→E)
+    anti_spike_radius = float(params["anti_spike_radius"])
+    anti_spike_time = int(params["anti_spike_time"])
+    if anti_spike_radius > 0 and anti_spike_time > 0:
+        rows = _iter_drop_spikes(
+            track,
+            rows,
+            max_gps_accuracy_m=max_gps_accuracy_m,
+            factor_k=float(params["anti_spike_factor_k"]),
+            min_detour_ratio=float(params["anti_spike_detour_ratio"]),
+            max_bd_dt_s=anti_spike_time,
+            min_leg_m=max(10.0, anti_spike_radius),
+            require_good_acc=REQUIRE_GOOD_ACC,
+        )
+        if detail:
+            rows = timer.iter_timed("anti_spike", rows)
+
+    # Paradas
+    stop_radius_m = float(params["stop_radius_m"])
+    stop_time_s = int(params["stop_time_s"])
+    if stop_radius_m > 0 and stop_time_s > 0:
+        rows = iter_collapse_stops(
+            track,
+            rows,
+            stop_radius_m=stop_radius_m,
+            stop_time_s=stop_time_s,
+            outside_gap_s=int(params["outside_gap_s"]),
+            max_gps_accuracy_m=max_gps_accuracy_m,
+            require_good_acc=REQUIRE_GOOD_ACC,
+        )
+        rows = iter_keep_first_stop(
+            track, rows, same_radius_m=stop_radius_m, reentry_gap_s=int(params["reentry_gap_s"])
+        )
+        if detail:
+            rows = timer.iter_timed("stops", rows)
+    return rows
 
-            # Siguiente está FUERA del radio -> comprobar si la salida persiste al menos outside_gap_s
-            persist_until = t_next + timedelta(seconds=int(outside_gap_s))
-            k = j + 1
-            returned_inside = False
-            ret_ll = None
-
-            while k < n:
-                tk = t(k)
-                if not tk or tk > persist_until:
-                    break
-                llk = latlon(k)
-                if llk and acc_ok(k):
-                    if haversine(c_lat, c_lon, llk[0], llk[1]) <= stop_radius_m:
-                        returned_inside = True
-                        ret_ll = llk
-                        break
-                k += 1
-
-            if returned_inside:
-                # Ignorar la mini-excursión: continúa el grupo desde el retorno
-                j = k
-                count += 1
-                last_in = j
-                # (opcional) actualiza centroide con el punto de retorno
-                if ret_ll:
-                    c_lat = (c_lat * (count - 1) + ret_ll[0]) / count
-                    c_lon = (c_lon * (count - 1) + ret_ll[1]) / count
-                continue
 
-            # Si no volvió dentro del margen, sí cerramos
-            close_group(t_next)
-            i = j + 1
-            break
+def _iter_filter(
+    track: Track,
+    max_gps_accuracy_m: float,
+    max_speed_kmh: float,
+    min_distance=MIN_DISTANCE,
+    min_time_s=MIN_TIME,
+    cancel: Optional[threading.Event] = None,
+) -> Iterator[int]:
+    """filter_positions sobre todo el track como generador (comprueba `cancel` cada FUSED_CANCEL_ROWS filas)."""
+    n = len(track.ts)
+    rows = range(n)
+    st = FilterState()
+    prev = -1
+    for lo in range(0, n, FUSED_CANCEL_ROWS):
+        _check_cancel(cancel)
+        for row in _accepted_rows(
+            track, rows, st, min(n, lo + FUSED_CANCEL_ROWS), max_gps_accuracy_m, max_speed_kmh, min_distance, min_time_s
+        ):
+            prev = row
+            yield row
 
-        else:
-            # Fin de lista -> cerrar sin t_next (leave_dt = t_last_in)
-            close_group(None)
-            i = last_in + 1
+    last = n - 1
+    if (
+        last >= 0
+        and (prev < 0 or track.ts[prev] != track.ts[last])
+        and _keeps_last(track, last, st, max_gps_accuracy_m, max_speed_kmh, min_time_s)
+    ):
+        yield last
 
-    return keep_first_stop_in_same_radius(out, same_radius_m=stop_radius_m, reentry_gap_s=reentry_gap_s)
+
+def _stop_cut(track: Track, sel, out, checkpoints, limit: int, same_radius_m: float, reentry_gap_s: int) -> Tuple[int, int]:
+    """
+    Último checkpoint de _collapse_stops que ya no puede cambiar: su horizonte cae en
+    sel[:limit] y ninguna parada posterior puede fusionarse (keep_first_stop_in_same_radius)
+    con la última parada conservada antes del corte. Devuelve (i, len(out)) del corte.
+    """
+    ts_col, stops = track.ts, track.stops
+    # stop_leave efectivo de la última parada conservada tras out[:k], sin mutar las paradas
+    leave_at = [None]
+    prev = None
+    for row in out:
+        stop = stops.get(row)
+        if stop is not None:
+            if (
+                prev is not None
+                and haversine(prev[0], prev[1], stop.center_lat, stop.center_lon) <= same_radius_m
+                and (stop.start - prev[2]) / US_PER_S < float(reentry_gap_s)
+            ):
+                prev = (prev[0], prev[1], max(prev[2], stop.leave))
+            else:
+                prev = (stop.center_lat, stop.center_lon, stop.leave)
+        leave_at.append(prev[2] if prev is not None else None)
+
+    for i, k, horizon in reversed(checkpoints):
+        if horizon > limit:
+            continue
+        leave = leave_at[k]
+        # cualquier parada futura empieza en sel[i] o después (sel[limit:] aún puede cambiar)
+        if leave is None or (ts_col[sel[min(i, limit - 1)]] - leave) / US_PER_S >= float(reentry_gap_s):
+            return i, k
+    return 0, 0
 
 # --------------------------------------------
 # ESTADISTICAS
 # --------------------------------------------
-STEPS = 32  # muestreo base por tramo para refinar zonas
-
 # --- utilidades de conversión aprox. m -> grados ---
 def _deg_lat(m: float) -> float:
     return m / 111_320.0
@@ -693,10 +764,46 @@ def _all_zones(hass):
     return zones
 
 
+def _zone_index(hass) -> ZoneIndex:
+    """Índice de zonas cacheado en hass.data; se invalida al cambiar alguna zona (ver async_track_zone_changes)."""
+    dd = hass.data.setdefault(DOMAIN, {})
+    index = dd.get(ZONE_INDEX_KEY)
+    if index is None:
+        index = dd[ZONE_INDEX_KEY] = ZoneIndex(_all_zones(hass))
+    return index
+
+
+def async_track_zone_changes(hass):
+    """
+    Invalida el índice de zonas cuando se crea, borra o modifica una zona.
+    Los cambios solo de estado (número de personas dentro) no afectan a la geometría.
+    Devuelve la función para cancelar la escucha.
+    """
+    @callback
+    def _on_zone_change(event) -> None:
+        old = event.data.get("old_state")
+        new = event.data.get("new_state")
+        if old is not None and new is not None and old.attributes == new.attributes:
+            return
+        dd = hass.data.get(DOMAIN)
+        if dd is not None:
+            dd.pop(ZONE_INDEX_KEY, None)
+
+    tracker = async_track_state_change_filtered(
+        hass, TrackStates(False, set(), {"zone"}), _on_zone_change
+    )
+    return tracker.async_remove
+
+
 def _zone_of(lat, lon, zones):
-    """Devuelve el nombre de la zona que contiene el punto, o '' si ninguna. Usa bbox previa para minimizar Haversine."""
+    """
+    Devuelve el nombre de la zona que contiene el punto, o '' si ninguna. Usa bbox previa para minimizar Haversine.
+    Con un ZoneIndex solo se recorren las zonas de la celda del punto (mismo orden => mismo desempate).
+    """
     if not zones:
         return ''
+    if isinstance(zones, ZoneIndex):
+        zones = zones.candidates(lat, lon)
     best = None
     for z in zones:
         if not (z["lat_min"] <= lat <= z["lat_max"] and z["lon_min"] <= lon <= z["lon_max"]):
@@ -713,240 +820,196 @@ def _lerp(a, b, t):
 def _interp_latlon(lat1, lon1, lat2, lon2, t):
     return _lerp(lat1, lat2, t), _lerp(lon1, lon2, t)
 
-def _refine_boundary(lat1, lon1, lat2, lon2, t0, t1, zoneA, zones, max_iter=25, eps_m=2.0):
-    lo, hi = t0, t1
-    for _ in range(max_iter):
-        mid = (lo + hi) / 2.0
-        mlat, mlon = _interp_latlon(lat1, lon1, lat2, lon2, mid)
-        zmid = _zone_of(mlat, mlon, zones)
-        if zmid == zoneA:
-            lo = mid
-        else:
-            hi = mid
-        Alat, Alon = _interp_latlon(lat1, lon1, lat2, lon2, lo)
-        Blat, Blon = _interp_latlon(lat1, lon1, lat2, lon2, hi)
-        if haversine(Alat, Alon, Blat, Blon) < eps_m:
-            break
-    return (lo + hi) / 2.0
-
-def _split_segment_by_zones(lat1, lon1, lat2, lon2, steps, zones):
-    """Divide el segmento en subtramos homogéneos por zona. Ajusta steps de forma adaptativa."""
-    # steps adaptativos (~cada 10 m, cap 4..64)
-    seg_len_m = haversine(lat1, lon1, lat2, lon2)
-    steps_local = max(4, min(64, int(max(1.0, seg_len_m / 10.0))))
-    steps = max(steps, steps_local)
-
-    segs = []
-    prev_t = 0.0
-    prev_zone = _zone_of(lat1, lon1, zones)
-    for i in range(1, max(2, steps) + 1):
-        t = i / float(steps)
-        la, lo = _interp_latlon(lat1, lon1, lat2, lon2, t)
-        z = _zone_of(la, lo, zones)
-        if z != prev_zone:
-            t_cross = _refine_boundary(lat1, lon1, lat2, lon2, prev_t, t, prev_zone, zones)
-            if t_cross - prev_t > 1e-9:
-                segs.append({"zone": prev_zone, "t0": prev_t, "t1": t_cross})
-            prev_t = t_cross
-            prev_zone = _zone_of(*_interp_latlon(lat1, lon1, lat2, lon2, prev_t), zones)
-    if 1.0 - prev_t > 1e-9:
-        segs.append({"zone": prev_zone, "t0": prev_t, "t1": 1.0})
-    return segs
-
 # --- resumen global ---
-def _calc_summary(positions):
+def _eff_seg_times(track: Track, a: int, b: int) -> Tuple[int, int]:
+    """Devuelve (tA, tB) en us excluyendo tiempo parado en los extremos."""
+    tA = track.ts[a]
+    tB = track.ts[b]
+    stop_a = track.stops.get(a)
+    if stop_a is not None:
+        tA = stop_a.leave
+    stop_b = track.stops.get(b)
+    if stop_b is not None:
+        tB = stop_b.start
+    return tA, tB
+
+
+class SummaryAcc:
     """
-    Resumen robusto:
-      - t0 = mínimo entre last_updated y stop_start (si hubiese).
-      - tn = máximo entre last_updated y stop_end.
+    Acumuladores de _calc_summary. `feed` procesa las posiciones [lo, hi) de `sel` (y los
+    tramos que terminan en ellas) en el mismo orden que el cálculo completo, así que
+    continuar una copia desde un prefijo da exactamente el mismo resumen.
     """
-    def _collect_times_for_start(ps):
-        times = []
-        for p in ps:
-            t = _as_dt(p.get("last_updated"))
-            if t: times.append(t)
-            if p.get("stop"):
-                ts = _as_dt(p.get("stop_start"))
-                if ts: times.append(ts)
-        return times
-
-    def _collect_times_for_end(ps):
-        times = []
-        for p in ps:
-            t = _as_dt(p.get("last_updated"))
-            if t: times.append(t)
-            if p.get("stop"):
-                te = _as_dt(p.get("stop_end"))
-                if te: times.append(te)
-        return times
-
-    if not positions:
-        return {
-            "positions_count": 0,
-            "start_utc": None,
-            "end_utc": None,
-            "total_time_s": 0,
-            "distance_m": 0.0,
-            "max_speed_mps": 0.0,
-            "average_speed_mps": 0.0,
-            "stops_count": 0,
-            "stopped_time_s": 0
-        }
-
-    start_candidates = _collect_times_for_start(positions)
-    end_candidates   = _collect_times_for_end(positions)
-
-    if not start_candidates or not end_candidates:
-        # Fallback coherente si algo raro pasó con fechas
-        return {
-            "positions_count": len(positions),
-            "start_utc": None,
-            "end_utc": None,
-            "total_time_s": 0,
-            "distance_m": 0.0,
-            "max_speed_mps": 0.0,
-            "average_speed_mps": 0.0,
-            "stops_count": len([p for p in positions if p.get("stop")]),
-            "stopped_time_s": 0
-        }
 
-    t0 = min(start_candidates)
-    tn = max(end_candidates)
-
-    total_time_s = max(0, int(round((tn - t0).total_seconds())))
+    __slots__ = ("n", "t0", "tn", "distance_m", "max_speed", "tw_sum", "tw_total",
+                 "stops_count", "stopped_s", "fallback_s")
+
+    def __init__(self) -> None:
+        self.n = 0
+        self.t0: Optional[int] = None
+        self.tn: Optional[int] = None
+        self.distance_m = 0.0
+        self.max_speed: Optional[float] = None
+        self.tw_sum = 0.0
+        self.tw_total = 0.0
+        self.stops_count = 0
+        self.stopped_s = 0
+        self.fallback_s = 0
+
+    def copy(self) -> "SummaryAcc":
+        other = SummaryAcc()
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
+
+    def feed(self, track: Track, sel, seg: Segments, lo: int, hi: int) -> None:
+        speed_col, ts_col, stops = track.speed, track.ts, track.stops
+        seg_dist, seg_dt = seg.dist_m, seg.dt_s
+        for i in range(lo, hi):
+            r = sel[i]
+            t = ts_col[r]
+            stop = stops.get(r)
+            t0 = t if stop is None or stop.start >= t else stop.start
+            tn = t if stop is None or stop.end <= t else stop.end
+            if self.t0 is None or t0 < self.t0:
+                self.t0 = t0
+            if self.tn is None or tn > self.tn:
+                self.tn = tn
+
+            # Velocidad máxima desde atributos (m/s)
+            v = speed_col[r]
+            if math.isfinite(v) and v >= 0 and (self.max_speed is None or v > self.max_speed):
+                self.max_speed = v
+
+            # Paradas (sumar siempre stop_leave - stop_start)
+            if stop is not None:
+                self.stops_count += 1
+                if stop.leave >= stop.start:
+                    self.stopped_s += int((stop.leave - stop.start) / US_PER_S)
+                else:
+                    # Fallback por si las marcas no son coherentes
+                    try:
+                        self.stopped_s += int(round(float(stop.duration or 0)))
+                    except Exception:
+                        pass
+
+            if i == 0:
+                continue
+            a = sel[i - 1]
+
+            # Distancia (solo tramos con tiempo creciente)
+            if seg_dt[i - 1] > 0:
+                self.distance_m += seg_dist[i - 1]
+
+            if a in stops:
+                # Fallback adicional (solo se usa si no se sumó nada con las paradas)
+                tA = ts_col[a]
+                if t > tA:
+                    self.fallback_s += int((t - tA) / US_PER_S)
+                # Velocidad media: omitir segmentos cuyo punto A es una parada
+                continue
 
-    # Distancia (sin cambios)
-    distance_m = 0.0
-    for i in range(1, len(positions)):
-        a, b = positions[i-1], positions[i]
-        try:
-            tA = _as_dt(a.get("last_updated"))
-            tB = _as_dt(b.get("last_updated"))
-            if not (tA and tB and tB > tA):
+            # Velocidad media ponderada por tiempo (solo en movimiento y sin stops)
+            vA = speed_col[a]
+            if not math.isfinite(vA) or vA < 0:
                 continue
-            
-            lat1 = float(a["attributes"]["latitude"]); lon1 = float(a["attributes"]["longitude"])
-            lat2 = float(b["attributes"]["latitude"]); lon2 = float(b["attributes"]["longitude"])
-            distance_m += haversine(lat1, lon1, lat2, lon2)
-        except Exception:
-            pass
+            tA, tB = _eff_seg_times(track, a, r)
+            if tB > tA:
+                dt = (tB - tA) / US_PER_S
+                self.tw_sum += vA * dt
+                self.tw_total += dt
+        self.n += max(0, hi - lo)
+
+    def result(self) -> Dict[str, Any]:
+        if not self.n:
+            return {
+                "positions_count": 0,
+                "start_utc": None,
+                "end_utc": None,
+                "total_time_s": 0,
+                "distance_m": 0.0,
+                "max_speed_mps": 0.0,
+                "average_speed_mps": 0.0,
+                "stops_count": 0,
+                "stopped_time_s": 0
+            }
 
-    # Velocidad máxima desde atributos (m/s)
-    speeds = []
-    for p in positions:
-        a = p.get("attributes", {}) or {}
-        v = a.get("speed", a.get("speedMps"))  # fallback a speedMps
-        try:
-            v = float(v)
-            if math.isfinite(v) and v >= 0:
-                speeds.append(v)
-        except Exception:
-            pass
-    max_speed_mps = max(speeds) if speeds else 0.0
-
-    # Velocidad media ponderada por tiempo (solo en movimiento y sin stops)
-    def _eff_seg_times(A, B):
-        """Devuelve (tA, tB) excluyendo tiempo parado en los extremos."""
-        tA = _as_dt(A.get("last_updated"))
-        tB = _as_dt(B.get("last_updated"))
-        if A.get("stop"):
-            tA = _as_dt(A.get("stop_leave")) or _as_dt(A.get("stop_end")) or tA
-        if B.get("stop"):
-            tB = _as_dt(B.get("stop_start")) or tB
-        return tA, tB
-
-    time_weighted_sum = 0.0
-    time_total = 0.0
-    for i in range(1, len(positions)):
-        A = positions[i - 1]
-        B = positions[i]
-
-        # Omitir segmentos cuyo punto A es una parada
-        if A.get("stop"):
-            continue
+        total_time_s = max(0, int(round((self.tn - self.t0) / US_PER_S)))
+        stopped_time_s = self.stopped_s if self.stopped_s != 0 else self.fallback_s
+        if stopped_time_s > total_time_s:
+            stopped_time_s = total_time_s
 
-        # velocidad en A (si existe y es válida)
-        try:
-            vA = float(A.get("attributes", {}).get("speed"))
-            if not math.isfinite(vA) or vA < 0:
-                vA = None
-        except Exception:
-            vA = None
+        return {
+            "positions_count": self.n,
+            "start_utc": us_to_iso(self.t0),
+            "end_utc": us_to_iso(self.tn),
+            "total_time_s": total_time_s,
+            "distance_m": self.distance_m,
+            "max_speed_mps": self.max_speed if self.max_speed is not None else 0.0,
+            "average_speed_mps": (self.tw_sum / self.tw_total) if self.tw_total > 0 else 0.0,
+            "stops_count": self.stops_count,
+            "stopped_time_s": int(round(stopped_time_s))
+        }
 
-        tA, tB = _eff_seg_times(A, B)
-        if vA is not None and tA and tB and tB > tA:
-            dt = (tB - tA).total_seconds()
-            if dt > 0:
-                time_weighted_sum += vA * dt
-                time_total += dt
-    average_speed_mps = (time_weighted_sum / time_total) if time_total > 0 else 0.0
-
-    # Paradas (sumar siempre stop_leave - stop_start si existen)
-    stops = [p for p in positions if p.get("stop")]
-    stopped_time_s = 0
-
-    for p in stops:
-        t_start = _as_dt(p.get("stop_start")) or _as_dt(p.get("last_updated"))
-        t_leave = _as_dt(p.get("stop_leave")) or _as_dt(p.get("stop_end"))
-        if t_start and t_leave and t_leave >= t_start:
-            stopped_time_s += int((t_leave - t_start).total_seconds())
-        elif "stop_duration_s" in p:
-            # Fallback por si faltan marcas explícitas
-            try:
-                stopped_time_s += int(round(float(p["stop_duration_s"] or 0)))
-            except Exception:
-                pass
-
-    # Fallback adicional si no se sumó nada (p.ej. sin campos de parada)
-    if stopped_time_s == 0:
-        for i, p in enumerate(positions[:-1]):
-            if p.get("stop"):
-                tA = _as_dt(p.get("last_updated"))
-                tB = _as_dt(positions[i+1].get("last_updated"))
-                if tA and tB and tB > tA:
-                    stopped_time_s += int((tB - tA).total_seconds())
-
-    if stopped_time_s > total_time_s:
-        stopped_time_s = total_time_s
 
-    return {
-        "positions_count": len(positions),
-        "start_utc": t0.isoformat(),
-        "end_utc": tn.isoformat(),
-        "total_time_s": total_time_s,
-        "distance_m": distance_m,
-        "max_speed_mps": max_speed_mps,
-        "average_speed_mps": average_speed_mps,
-        "stops_count": len(stops),
-        "stopped_time_s": int(round(stopped_time_s))
-    }
+def _calc_summary(track: Optional[Track], sel, seg: Optional[Segments] = None):
+    """
+    Resumen robusto:
+      - t0 = mínimo entre last_updated y stop_start (si hubiese).
+      - tn = máximo entre last_updated y stop_end.
+    `seg` (opcional) reutiliza las métricas por tramo ya calculadas para `sel`.
+    """
+    acc = SummaryAcc()
+    if sel:
+        if seg is None:
+            seg = segment_metrics(track, sel)
+        acc.feed(track, sel, seg, 0, len(sel))
+    return acc.result()
 
 
-def _count_zone_visits_by_runs(positions, zones):
+def _count_zone_visits_by_runs(track: Track, sel, zones, labels=None):
     """
     Cuenta 1 visita cada vez que entramos en una zona desde fuera (o desde otra).
     Varias posiciones seguidas en la misma zona => 1 sola visita.
     Salgo y reentro => otra visita.
     """
+    if labels is None:
+        lat_col, lon_col = track.lat, track.lon
+        labels = [_zone_of(lat_col[r], lon_col[r], zones) or '' for r in sel]
     visits = {}
     prev_zone = ''
-    for p in positions:
-        ll = _stop_center_latlon(p) or _latlon_from_pos(p)
-        if not ll:
-            continue
-        z = _zone_of(float(ll[0]), float(ll[1]), zones) or ''
+    for z in labels:
         if z and z != prev_zone:
             visits[z] = visits.get(z, 0) + 1
         prev_zone = z
     return visits
 
+class ZoneMemo:
+    """
+    Zona de cada posición y reparto por zonas de cada tramo (None si el tramo es corto).
+    Válido mientras el prefijo de `sel` y las zonas no cambien: en modo incremental se
+    conserva para las posiciones definitivas y solo se calculan las nuevas.
+    """
+
+    __slots__ = ("zones", "labels", "pieces")
+
+    def __init__(self, zones) -> None:
+        self.zones = zones
+        self.labels: List[str] = []
+        self.pieces: List[Optional[tuple]] = []
+
+    def truncate(self, n_positions: int) -> None:
+        del self.labels[n_positions:]
+        del self.pieces[max(0, n_positions - 1):]
+
+
 # --- estadísticas por zona ---
-def _calc_zone_stats(positions, zones, expected_total_s=None):
+def _calc_zone_stats(track: Track, sel, zones, expected_total_s=None, seg: Optional[Segments] = None, memo: Optional[ZoneMemo] = None):
     out = {}
-    
+
     # Índice rápido de zonas por nombre para resolver el id
     zones_by_name = {str(z.get("name")): z for z in (zones or [])}
-    
+
     def _ensure(name):
         if name not in out:
             zinfo = zones_by_name.get(name) or {}
@@ -960,31 +1023,30 @@ def _calc_zone_stats(positions, zones, expected_total_s=None):
             }
         return out[name]
 
-    def _eff_seg_times(A, B):
-        """Devuelve (tA_eff, tB_eff) excluyendo tiempo parado en los extremos."""
-        tA = _as_dt(A.get("last_updated"))
-        tB = _as_dt(B.get("last_updated"))
-        if A.get("stop"):
-            tA = _as_dt(A.get("stop_leave")) or _as_dt(A.get("stop_end")) or tA
-        if B.get("stop"):
-            tB = _as_dt(B.get("stop_start")) or tB
-        return tA, tB
-
-    if not positions:
+    if not sel:
         return []
 
+    lat_col, lon_col, stops = track.lat, track.lon, track.stops
+    if seg is None:
+        seg = segment_metrics(track, sel)
+    seg_dist = seg.dist_m
+
+    if memo is None:
+        memo = ZoneMemo(zones)
+    labels, pieces = memo.labels, memo.pieces
+    for r in sel[len(labels):]:
+        labels.append(_zone_of(lat_col[r], lon_col[r], zones) or '')
+
     # 1) Paradas: sumar SOLO aquí el tiempo parado a su zona
-    for p in positions:
-        if not p.get("stop"):
-            continue
-        ll = _stop_center_latlon(p) or _latlon_from_pos(p)
-        if not ll:
+    for i, r in enumerate(sel):
+        stop = stops.get(r)
+        if stop is None:
             continue
-        zn = _zone_of(float(ll[0]), float(ll[1]), zones) or ''
+        zn = labels[i]
         row = _ensure(zn)
         row["stops"] += 1
 
-        dur = p.get("stop_duration_s")
+        dur = stop.duration
         try:
             dur = float(dur) if dur is not None else 0.0
         except Exception:
@@ -992,43 +1054,46 @@ def _calc_zone_stats(positions, zones, expected_total_s=None):
         row["time_s"] += dur
 
     # 2) Movimiento: repartir SOLO el tiempo en movimiento por zonas
-    for i in range(1, len(positions)):
-        A, B = positions[i - 1], positions[i]
-        tA, tB = _eff_seg_times(A, B)
-        if not tA or not tB:
-            continue
+    for i in range(1, len(sel)):
+        a, b = sel[i - 1], sel[i]
+        tA, tB = _eff_seg_times(track, a, b)
 
-        dt = (tB - tA).total_seconds()
-        llA, llB = _latlon_from_pos(A), _latlon_from_pos(B)
+        dt = (tB - tA) / US_PER_S
+        lat1, lon1 = lat_col[a], lon_col[a]
+        lat2, lon2 = lat_col[b], lon_col[b]
 
-        if not llA or not llB:
-            continue
-        lat1, lon1 = float(llA[0]), float(llA[1])
-        lat2, lon2 = float(llB[0]), float(llB[1])
+        seg_len = seg_dist[i - 1]
 
-        seg_len = haversine(lat1, lon1, lat2, lon2)
-
-        if seg_len < 0.5:
+        if i - 1 < len(pieces):
+            segs = pieces[i - 1]
+        elif seg_len < 0.5:
+            segs = None
+            pieces.append(segs)
+        else:
+            segs = []
+            for zn, t0, t1 in split_segment_by_zones(lat1, lon1, lat2, lon2, zones):
+                aLat, aLon = _interp_latlon(lat1, lon1, lat2, lon2, t0)
+                bLat, bLon = _interp_latlon(lat1, lon1, lat2, lon2, t1)
+                segs.append((zn or '', max(0.0, haversine(aLat, aLon, bLat, bLon))))
+            segs = tuple(segs)
+            pieces.append(segs)
+
+        if segs is None:
             # Siempre asigna distancia; asigna tiempo solo si dt > 0
-            zn = _zone_of(lat1, lon1, zones) or (_zone_of(lat2, lon2, zones) or '')
+            zn = labels[i - 1] or labels[i]
             row = _ensure(zn)
             if dt > 0:
                 row["time_s"] += dt
             row["distance_m"] += seg_len
             continue
 
-        segs = _split_segment_by_zones(lat1, lon1, lat2, lon2, STEPS, zones)
         total_assigned_dt = 0.0
         total_assigned_len = 0.0
 
-        for s in segs:
-            aLat, aLon = _interp_latlon(lat1, lon1, lat2, lon2, s["t0"])
-            bLat, bLon = _interp_latlon(lat1, lon1, lat2, lon2, s["t1"])
-            sub_len = max(0.0, haversine(aLat, aLon, bLat, bLon))
+        for zn, sub_len in segs:
             share = sub_len / seg_len if seg_len > 0 else 0.0
             sub_dt = (dt * share) if dt > 0 else 0.0
 
-            zn = s["zone"] or ''
             row = _ensure(zn)
             if dt > 0:
                 row["time_s"] += sub_dt
@@ -1041,17 +1106,17 @@ def _calc_zone_stats(positions, zones, expected_total_s=None):
         if dt > 0:
             resid_dt = dt - total_assigned_dt
             if abs(resid_dt) > 1e-6:
-                zn_last = (segs[-1]["zone"] or '') if segs else (_zone_of(lat2, lon2, zones) or '')
-                _ensure(zn_last)["time_s"] += resid_dt            
+                zn_last = segs[-1][0] if segs else labels[i]
+                _ensure(zn_last)["time_s"] += resid_dt
 
         resid_len = seg_len - total_assigned_len
         if abs(resid_len) > 1e-6:
-            zn_last = (segs[-1]["zone"] or '') if segs else (_zone_of(lat2, lon2, zones) or '')
-            _ensure(zn_last)["distance_m"] += resid_len            
+            zn_last = segs[-1][0] if segs else labels[i]
+            _ensure(zn_last)["distance_m"] += resid_len
 
 
     # 3) Visitas por “runs”
-    visits_map = _count_zone_visits_by_runs(positions, zones)
+    visits_map = _count_zone_visits_by_runs(track, sel, zones, labels)
     for name, cnt in visits_map.items():
         _ensure(name)["visits"] = int(cnt)
 
@@ -1081,9 +1146,884 @@ def _calc_zone_stats(positions, zones, expected_total_s=None):
     return rows
 
 
+def _simplify_anchors(track: Track, sel, memo: ZoneMemo) -> List[int]:
+    """Posiciones que la simplificación no puede quitar: paradas y extremos de cada cambio de zona."""
+    stops, labels, pieces = track.stops, memo.labels, memo.pieces
+    keep = [i for i, r in enumerate(sel) if r in stops]
+    for i in range(1, len(sel)):
+        segs = pieces[i - 1] if i - 1 < len(pieces) else None
+        if labels[i] != labels[i - 1] or (segs is not None and len(segs) > 1):
+            keep.append(i - 1)
+            keep.append(i)
+    return keep
+
+
 # --- payload vacío coherente ---
-def _empty_payload():
-    return { "positions": [], "summary": _calc_summary([]), "zones": [] }
+def _empty_payload(proj: Optional[Projection] = None, encoding: Optional[str] = None):
+    if encoding is not None:
+        return encode_payload(encoding, EncodedTrack(None, ()), {"summary": _calc_summary(None, ()), "zones": []})
+    payload = { "positions": [], "summary": _calc_summary(None, ()), "zones": [] }
+    if proj is not None:
+        payload = {"header": proj.header(None, ()), **payload}
+    return payload
+
+# ----------------------------
+# Configuración (config entry -> parámetros del pipeline)
+# ----------------------------
+def _load_filter_config(hass) -> Tuple[bool, Dict[str, Any]]:
+    """Devuelve (only_admin, params) leyendo options/data del config entry con fallbacks."""
+
+    # Devuelve solo si es administrador o only_admin es false
+    only_admin = False
+
+    # valores por defecto (radios float, tiempos int)
+    stop_radius_m: float = float(STOP_RADIUS_M_FALLBACK)
+    stop_time_s: int = int(STOP_TIME_S_FALLBACK)
+    anti_spike_factor_k: float = float(ANTI_SPIKE_FACTOR_K)
+    anti_spike_detour_ratio: float = float(ANTI_SPIKE_DETOUR_RATIO)
+    anti_spike_radius: float = float(ANTI_SPIKE_RADIUS_FALLBACK)
+    anti_spike_time: int = int(ANTI_SPIKE_TIME_S_FALLBACK)
+    reentry_gap_s: int = int(REENTRY_GAP_S_FALLBACK)
+    outside_gap_s: int = int(OUTSIDE_GAP_S_FALLBACK)
+    max_gps_accuracy_m: float = float(MAX_GPS_ACCURACY_M_FALLBACK)
+    max_speed_kmh: float = float(MAX_SPEED_KMH_FALLBACK)
+    max_concurrency: int = int(PIPELINE_MAX_CONCURRENCY)
+    day_cache: bool = True
+    sql_reader: bool = _sql_reader_ok
+
+    entries = hass.config_entries.async_entries(DOMAIN)
+    if entries:
+        entry = entries[0]
+        only_admin = entry.options.get("only_admin", entry.data.get("only_admin", False))
+
+        # stop_radius (float >= 0)
+        try:
+            stop_radius_m = float(entry.options.get("stop_radius", entry.data.get("stop_radius", stop_radius_m)))
+            if stop_radius_m < 0:
+                stop_radius_m = 0.0
+        except (TypeError, ValueError):
+            pass
+
+        # stop_time (int >= 0)
+        try:
+            stop_time_s = int(entry.options.get("stop_time", entry.data.get("stop_time", stop_time_s)))
+            if stop_time_s < 0:
+                stop_time_s = 0
+        except (TypeError, ValueError):
+            pass
+
+        # reentry_gap (int >= 0)
+        try:
+            reentry_gap_s = int(entry.options.get("reentry_gap", entry.data.get("reentry_gap", reentry_gap_s)))
+            if reentry_gap_s < 0:
+                reentry_gap_s = 0
+        except (TypeError, ValueError):
+            pass
+
+        # outside_gap (int >= 0)
+        try:
+            outside_gap_s = int(entry.options.get("outside_gap", entry.data.get("outside_gap", outside_gap_s)))
+            if outside_gap_s < 0:
+                outside_gap_s = 0
+        except (TypeError, ValueError):
+            pass
+
+        # gps_accuracy (float >= 0)
+        try:
+            max_gps_accuracy_m = float(entry.options.get("gps_accuracy", entry.data.get("gps_accuracy", max_gps_accuracy_m)))
+            if max_gps_accuracy_m < 0:
+                max_gps_accuracy_m = 0
+        except (TypeError, ValueError):
+            pass
+
+        # max_speed (float >= 0)
+        try:
+            max_speed_kmh = float(entry.options.get("max_speed", entry.data.get("max_speed", max_speed_kmh)))
+            if max_speed_kmh < 0:
+                max_speed_kmh = 0
+        except (TypeError, ValueError):
+            pass
+
+        # anti_spike_factor_k (float >= 0)
+        try:
+            anti_spike_factor_k = float(entry.options.get("anti_spike_factor_k", entry.data.get("anti_spike_factor_k", anti_spike_factor_k)))
+            if anti_spike_factor_k < 0:
+                anti_spike_factor_k = 0.0
+        except (TypeError, ValueError):
+            pass
+
+        # anti_spike_detour_ratio (float >= 0)
+        try:
+            anti_spike_detour_ratio = float(entry.options.get("anti_spike_detour_ratio", entry.data.get("anti_spike_detour_ratio", anti_spike_detour_ratio)))
+            if anti_spike_detour_ratio < 0:
+                anti_spike_detour_ratio = 0.0
+        except (TypeError, ValueError):
+            pass
+
+        # anti_spike_radius (float >= 0)
+        try:
+            anti_spike_radius = float(entry.options.get("anti_spike_radius", entry.data.get("anti_spike_radius", anti_spike_radius)))
+            if anti_spike_radius < 0:
+                anti_spike_radius = 0.0
+        except (TypeError, ValueError):
+            pass
+
+        # anti_spike_time (int >= 0)
+        try:
+            anti_spike_time = int(entry.options.get("anti_spike_time", entry.data.get("anti_spike_time", anti_spike_time)))
+            if anti_spike_time < 0:
+                anti_spike_time = 0
+        except (TypeError, ValueError):
+            pass
+
+        # filter_max_concurrency (int >= 1, solo via options)
+        try:
+            max_concurrency = max(1, int(entry.options.get("filter_max_concurrency", max_concurrency)))
+        except (TypeError, ValueError):
+            pass
+
+        # filter_day_cache (bool, solo via options)
+        day_cache = bool(entry.options.get("filter_day_cache", day_cache))
+
+        # filter_sql_reader (bool, solo via options)
+        sql_reader = bool(entry.options.get("filter_sql_reader", sql_reader)) and _sql_reader_ok
+
+    params = {
+        "stop_radius_m": stop_radius_m,
+        "stop_time_s": stop_time_s,
+        "reentry_gap_s": reentry_gap_s,
+        "outside_gap_s": outside_gap_s,
+        "max_gps_accuracy_m": max_gps_accuracy_m,
+        "max_speed_kmh": max_speed_kmh,
+        "anti_spike_factor_k": anti_spike_factor_k,
+        "anti_spike_detour_ratio": anti_spike_detour_ratio,
+        "anti_spike_radius": anti_spike_radius,
+        "anti_spike_time": anti_spike_time,
+        "max_concurrency": max_concurrency,
+        "day_cache": day_cache,
+        "sql_reader": sql_reader,
+    }
+    return only_admin, params
+
+# ----------------------------
+# Lectura del recorder (con caché por días cerrados)
+# ----------------------------
+def _day_cache_path(hass) -> str:
+    return hass.config.path(STORAGE_DIR, DAY_CACHE_FILE)
+
+
+def _retention_start(keep_days: int, now: datetime):
+    """Primer día UTC que el recorder conserva entero con purge_keep_days = keep_days."""
+    return (now - timedelta(days=int(keep_days))).date() + timedelta(days=1)
+
+
+def async_setup_day_cache(hass):
+    """
+    Crea la caché por días (la BD se abre al primer uso, en el executor) y devuelve su cierre.
+    Al arrancar y cada DAY_CACHE_PURGE_INTERVAL se borran los días que el recorder ya
+    no conserva, aunque no llegue ninguna petición: la caché nunca guarda más
+    historial que el propio recorder.
+    """
+    cache = DayCache(_day_cache_path(hass))
+    hass.data.setdefault(DOMAIN, {})[DAY_CACHE_KEY] = cache
+
+    @callback
+    def _purge(_now=None) -> None:
+        try:
+            keep_days = getattr(get_recorder_instance(hass), "keep_days", None)
+        except KeyError:
+            return
+        if keep_days is not None:
+            hass.async_add_executor_job(cache.purge_before, _retention_start(keep_days, dt_util.utcnow()))
+
+    _purge()
+    cancel_purge = async_track_time_interval(hass, _purge, DAY_CACHE_PURGE_INTERVAL)
+
+    @callback
+    def _close() -> None:
+        cancel_purge()
+        dd = hass.data.get(DOMAIN)
+        if dd is not None and dd.get(DAY_CACHE_KEY) is cache:
+            dd.pop(DAY_CACHE_KEY, None)
+        hass.async_add_executor_job(cache.close)
+
+    return _close
+
+
+async def async_remove_day_cache(hass) -> None:
+    """Borra la BD de la caché por días (la integración se ha eliminado)."""
+    await hass.async_add_executor_job(remove_day_cache, _day_cache_path(hass))
+
+
+def _attrs_memo(hass) -> AttributesMemo:
+    """Memo compartido de atributos del lector SQL (se crea en la primera lectura)."""
+    dd = hass.data.setdefault(DOMAIN, {})
+    memo = dd.get(ATTRS_MEMO_KEY)
+    if memo is None:
+        memo = dd.setdefault(ATTRS_MEMO_KEY, AttributesMemo())
+    return memo
+
+
+def _fetch_histories(hass, entity_ids: List[str], start_utc: datetime, end_utc: datetime, lite: bool = False) -> Dict[str, List[Any]]:
+    """
+    Una sola consulta al recorder para varias entidades: estados con start < last_updated < end.
+    Con `lite`, lectura SQL directa con solo LITE_ATTRIBUTES. Si falla por lo que sea (también
+    un esquema del recorder distinto del esperado: AttributeError, TypeError...) se usa la
+    consulta normal y el lector directo queda desactivado hasta reiniciar.
+    """
+    global _sql_reader_ok
+    if lite and _sql_reader_ok:
+        try:
+            return read_states(hass, list(entity_ids), start_utc, end_utc, _attrs_memo(hass))
+        except Exception:  # noqa: BLE001
+            if _sql_reader_ok:  # otra lectura en paralelo puede haberlo desactivado ya
+                _sql_reader_ok = False
+                _LOGGER.exception("Direct recorder read failed, using get_significant_states from now on")
+
+    history = get_significant_states(
+        hass,
+        start_utc,
+        end_utc,
+        list(entity_ids),
+        include_start_time_state=False,
+        significant_changes_only=False,
+        minimal_response=False,
+        no_attributes=False,
+    ) or {}
+    return {entity_id: history.get(entity_id) or [] for entity_id in entity_ids}
+
+
+def _fetch_history(hass, entity_id: str, start_utc: datetime, end_utc: datetime, lite: bool = False) -> List[Any]:
+    """Consulta directa al recorder: estados con start < last_updated < end."""
+    return _fetch_histories(hass, [entity_id], start_utc, end_utc, lite)[entity_id]
+
+
+def _day_runs(days: List[Any]) -> List[Tuple[Any, Any]]:
+    """Días ordenados -> tramos contiguos (primero, último)."""
+    runs: List[List[Any]] = []
+    for d in days:
+        if runs and d == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = d
+        else:
+            runs.append([d, d])
+    return [(lo, hi) for lo, hi in runs]
+
+
+def _load_states(
+    hass,
+    entity_id: str,
+    start_utc: datetime,
+    end_utc: datetime,
+    cache: Optional[DayCache],
+    keep_days: Optional[int],
+    lite: bool = False,
+) -> List[Any]:
+    """
+    Estados de `entity_id` entre start y end, los mismos que devolvería una única
+    consulta al recorder. Con caché, los días UTC ya cerrados salen de la caché (o se
+    piden completos una vez y se guardan) y solo los días abiertos van al recorder.
+    Con `lite`, lo que no sale de la caché se lee con los atributos reducidos
+    (la caché siempre guarda los estados completos).
+    Se ejecuta en el executor del recorder.
+    """
+    return _load_states_many(hass, [entity_id], start_utc, end_utc, cache, keep_days, lite)[entity_id]
+
+
+def _load_states_many(
+    hass,
+    entity_ids: List[str],
+    start_utc: datetime,
+    end_utc: datetime,
+    cache: Optional[DayCache],
+    keep_days: Optional[int],
+    lite: bool = False,
+) -> Dict[str, List[Any]]:
+    """
+    _load_states para varias entidades compartiendo las consultas al recorder: una para
+    los días abiertos (o para todo el rango sin caché) y una por cada tramo de días
+    cerrados que falte en la caché, con todas las entidades que lo necesitan.
+    """
+    entity_ids = list(dict.fromkeys(entity_ids))
+    if cache is None or start_utc >= end_utc:
+        return _fetch_histories(hass, entity_ids, start_utc, end_utc, lite)
+
+    now = dt_util.utcnow()
+    open_day = first_open_day(now)
+    days = days_between(start_utc, end_utc)
+
+    # Días que el recorder puede haber purgado (total o parcialmente): sin caché
+    horizon = None
+    if keep_days is not None:
+        horizon = (now - timedelta(days=int(keep_days))).date()
+        if days[0] <= horizon:
+            return _fetch_histories(hass, entity_ids, start_utc, end_utc, lite)
+
+    closed = [d for d in days if d < open_day]
+    by_entity = {entity_id: cache.get(entity_id, closed) for entity_id in entity_ids}
+
+    # Tramos contiguos de días ausentes -> entidades que los necesitan
+    wanted: Dict[Tuple[Any, Any], List[str]] = {}
+    for entity_id, by_day in by_entity.items():
+        for run in _day_runs([d for d in closed if d not in by_day]):
+            wanted.setdefault(run, []).append(entity_id)
+
+    for (lo, hi), run_ids in wanted.items():
+        lo_dt = day_start(lo)
+        fresh: Dict[str, Dict[Any, List[Any]]] = {
+            entity_id: {lo + timedelta(days=i): [] for i in range((hi - lo).days + 1)} for entity_id in run_ids
+        }
+        # -1 ms: el recorder excluye el instante inicial y queremos [00:00, 24:00)
+        history = _fetch_histories(hass, run_ids, lo_dt - timedelta(milliseconds=1), day_start(hi + timedelta(days=1)))
+        for entity_id in run_ids:
+            for st in history[entity_id]:
+                lu = dt_util.as_utc(st.last_updated)
+                bucket = fresh[entity_id].get(lu.date())
+                if bucket is not None and lu >= lo_dt:
+                    bucket.append(st)
+            cache.put(entity_id, fresh[entity_id])
+            by_entity[entity_id].update(fresh[entity_id])
+    if wanted and keep_days is not None:
+        cache.purge_before(_retention_start(keep_days, now))
+
+    out: Dict[str, List[Any]] = {}
+    for entity_id, by_day in by_entity.items():
+        states: List[Any] = []
+        for d in closed:
+            states.extend(by_day[d])
+        # Recorte al rango exacto (mismo criterio exclusivo que el recorder)
+        if closed:
+            states = [st for st in states if start_utc < dt_util.as_utc(st.last_updated) < end_utc]
+        out[entity_id] = states
+
+    # Días abiertos: siempre al recorder, una consulta para todas
+    if days[-1] >= open_day:
+        tail_start = max(start_utc, day_start(open_day))
+        if tail_start == start_utc:
+            history = _fetch_histories(hass, entity_ids, start_utc, end_utc, lite)
+            for entity_id in entity_ids:
+                out[entity_id].extend(history[entity_id])
+        else:
+            history = _fetch_histories(hass, entity_ids, tail_start - timedelta(milliseconds=1), end_utc, lite)
+            for entity_id in entity_ids:
+                out[entity_id].extend(st for st in history[entity_id] if dt_util.as_utc(st.last_updated) >= tail_start)
+
+    return out
+
+
+# ----------------------------
+# Pipeline completo (se ejecuta en el executor, nunca en el event loop)
+# ----------------------------
+def _run_pipeline(
+    states,
+    start_utc: datetime,
+    end_utc: datetime,
+    zones: List[dict],
+    params: Dict[str, Any],
+    cancel: Optional[threading.Event] = None,
+    lazy: bool = False,
+    proj: Optional[Projection] = None,
+    encoding: Optional[str] = None,
+    simplify_m: Optional[float] = None,
+    zoom: Optional[float] = None,
+    timer: Optional[StageTimer] = None,
+):
+    """
+    Recorte por rango + orden, filtro, anti-spike, paradas, resumen y zonas.
+    Función pura y síncrona: no toca hass (las zonas llegan ya leídas desde el loop).
+    Los State se convierten una sola vez a un Track columnar; todas las etapas
+    trabajan sobre selecciones de filas y el JSON se construye solo al final.
+    Filtro, anti-spike y paradas van fusionados (_fused_selection).
+    Entre etapas comprueba `cancel` y lanza PipelineCancelled si el cliente se fue.
+    Con `lazy`, "positions" es un generador (los dicts se crean al serializar).
+    Con `proj`, cada posición lleva solo esos campos y se añade la cabecera "header".
+    Con `encoding` (ENCODINGS), las posiciones van en columnas compactas (track_codec).
+    Con `simplify_m` o `zoom`, las posiciones se simplifican para dibujar (Douglas-Peucker)
+    DESPUÉS de calcular el resumen y las zonas, que siguen usando el track completo.
+    Con `timer`, cada etapa se mide en él (StageTimer).
+    """
+    with timed(timer, "prepare"):
+        states = [s for s in states
+                  if dt_util.as_utc(s.last_updated) >= start_utc
+                  and dt_util.as_utc(s.last_updated) <= end_utc]
+        states.sort(key=lambda s: dt_util.as_utc(s.last_updated))
+    with timed(timer, "track"):
+        track = Track.from_states(states)
+    _check_cancel(cancel)
+
+    # Filtro, anti-spike y paradas en una sola pasada
+    with timed(timer, "select"):
+        sel = _fused_selection(track, params, cancel, timer)
+
+    # --- calcular resumen y zonas ---
+    with timed(timer, "summary"):
+        seg = segment_metrics(track, sel)
+        summary = _calc_summary(track, sel, seg)
+    _check_cancel(cancel)
+    with timed(timer, "zone_stats"):
+        memo = ZoneMemo(zones)
+        zones_rows = _calc_zone_stats(track, sel, zones, expected_total_s=summary["total_time_s"], seg=seg, memo=memo)
+
+    # Simplificación (solo afecta a las posiciones enviadas)
+    if simplify_m is not None or zoom is not None:
+        _check_cancel(cancel)
+        with timed(timer, "simplify"):
+            sel = douglas_peucker(track, sel, simplify_m, zoom, keep=_simplify_anchors(track, sel, memo))
+
+    if encoding is not None:
+        with timed(timer, "encode"):
+            return encode_payload(encoding, EncodedTrack(track, sel), {"summary": summary, "zones": zones_rows})
+
+    with timed(timer, "positions"):
+        payload = {
+            "positions": track.iter_positions(sel, proj) if lazy else track.to_positions(sel, proj),
+            "summary": summary,
+            "zones": zones_rows
+        }
+    if proj is not None:
+        payload = {"header": proj.header(track, sel), **payload}
+    return payload
+
+
+def _stream_pipeline(
+    states,
+    start_utc: datetime,
+    end_utc: datetime,
+    zones: List[dict],
+    params: Dict[str, Any],
+    cancel: Optional[threading.Event] = None,
+    proj: Optional[Projection] = None,
+    timer: Optional[StageTimer] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    _run_pipeline para stream=1 sin simplificación, como registros NDJSON: la cabecera,
+    cada posición en cuanto sale de la pasada fusionada y, cuando se agota, el resumen y
+    las zonas (que necesitan la selección completa). Se consume desde el executor.
+    La cabecera sale antes que la selección, así que solo sube los atributos que valen
+    lo mismo en todo el rango (el cliente reconstruye las mismas posiciones).
+    """
+    with timed(timer, "prepare"):
+        states = [s for s in states
+                  if dt_util.as_utc(s.last_updated) >= start_utc
+                  and dt_util.as_utc(s.last_updated) <= end_utc]
+        states.sort(key=lambda s: dt_util.as_utc(s.last_updated))
+    with timed(timer, "track"):
+        track = Track.from_states(states)
+    _check_cancel(cancel)
+    if proj is not None:
+        yield {"header": proj.header(track, range(len(track)))}
+
+    rows = _fused_rows(track, params, cancel, timer)
+    if float(params["stop_radius_m"]) > 0 and int(params["stop_time_s"]) > 0:
+        rows = iter_settled_stops(track, rows, int(params["reentry_gap_s"]))
+    sel = array("l")
+    for row in rows:
+        sel.append(row)
+        yield track.position(row, proj)
+    if timer is not None and timer.debug:
+        timer.exclusive(FUSED_STAGES)
+
+    with timed(timer, "summary"):
+        seg = segment_metrics(track, sel)
+        summary = _calc_summary(track, sel, seg)
+    yield {"summary": summary}
+    with timed(timer, "zone_stats"):
+        zones_rows = _calc_zone_stats(track, sel, zones, expected_total_s=summary["total_time_s"], seg=seg,
+                                      memo=ZoneMemo(zones))
+    yield {"zones": zones_rows}
+    if timer is not None and timer.debug:
+        yield {"debug": {"timings_ms": timer.ms()}}
+
+
+# ----------------------------
+# Modo incremental (rango que termina en "ahora")
+# ----------------------------
+def _session_store(hass) -> SessionStore:
+    dd = hass.data.setdefault(DOMAIN, {})
+    store = dd.get(INCREMENTAL_SESSIONS_KEY)
+    if store is None:
+        store = dd[INCREMENTAL_SESSIONS_KEY] = SessionStore()
+    return store
+
+
+def _session_key(person_id: str, entity_id: str, start_utc: datetime, params: Dict[str, Any], lite: bool = False) -> Tuple:
+    """Una sesión solo sirve para la misma persona, inicio y parámetros del pipeline (y tipo de lectura)."""
+    fingerprint = tuple(sorted((k, v) for k, v in params.items() if k not in ("max_concurrency", "day_cache", "sql_reader")))
+    return (person_id, entity_id, start_utc, fingerprint, lite)
+
+
+def _load_new_states(
+    hass,
+    session: IncrementalSession,
+    start_utc: datetime,
+    end_utc: datetime,
+    cache: Optional[DayCache],
+    keep_days: Optional[int],
+    lite: bool = False,
+) -> List[Any]:
+    """Estados que la sesión todavía no tiene asentados (todos en la primera petición)."""
+    if session.seq == 0:
+        return _load_states(hass, session.entity_id, start_utc, end_utc, cache, keep_days, lite)
+    wm = session.watermark
+    return [
+        st for st in _fetch_history(hass, session.entity_id, wm - timedelta(milliseconds=1), end_utc, lite)
+        if dt_util.as_utc(st.last_updated) >= wm and dt_util.as_utc(st.last_updated) > start_utc
+    ]
+
+
+def _run_incremental(
+    session: IncrementalSession,
+    states,
+    start_utc: datetime,
+    end_utc: datetime,
+    zones,
+    params: Dict[str, Any],
+    client_seq: Optional[int],
+    cancel: Optional[threading.Event] = None,
+    proj: Optional[Projection] = None,
+    encoding: Optional[str] = None,
+    timer: Optional[StageTimer] = None,
+):
+    """
+    Mismo resultado que _run_pipeline sobre [start, end], reutilizando lo ya calculado.
+
+    Los estados con más de INCREMENTAL_SETTLE_S se asientan en la sesión; el resto se
+    añade al track solo durante esta petición. Cada etapa avanza su parte definitiva
+    (la que ningún punto posterior puede cambiar) y recalcula únicamente la cola:
+      - filtro base: reanuda su estado; la regla de la última posición va aparte
+      - anti-spike: la decisión sobre la posición i solo mira i-2 .. i+2
+      - paradas: se reanuda en un checkpoint cuyo horizonte ya es definitivo y
+        tras el que ninguna parada puede fusionarse con la anterior
+      - resumen y zonas: acumuladores / memo de la parte definitiva + la cola
+    Devuelve solo las posiciones a partir de `base` (lo que el cliente de la respuesta
+    `client_seq` ya tiene y no puede cambiar), más el resumen y las zonas completos.
+    La sesión debe estar bloqueada por el llamante; si algo falla hay que descartarla.
+    Con `timer`, cada etapa se mide en él (StageTimer).
+    """
+    track = session.track
+    settle_end = max(session.watermark, end_utc - timedelta(seconds=INCREMENTAL_SETTLE_S))
+
+    with timed(timer, "prepare"):
+        states = [s for s in states
+                  if dt_util.as_utc(s.last_updated) >= max(start_utc, session.watermark)
+                  and dt_util.as_utc(s.last_updated) <= end_utc]
+        states.sort(key=lambda s: dt_util.as_utc(s.last_updated))
+        settled = [s for s in states if dt_util.as_utc(s.last_updated) < settle_end]
+        fresh = states[len(settled):]
+
+    # Asentar lo nuevo y avanzar el filtro base sobre ello
+    with timed(timer, "track"):
+        n0 = len(track)
+        track.extend(settled)
+        session.raw.extend(range(n0, len(track)))
+        session.watermark = settle_end
+
+    max_gps_accuracy_m = float(params["max_gps_accuracy_m"])
+    max_speed_kmh = float(params["max_speed_kmh"])
+    with timed(timer, "filter"):
+        committed = filter_positions(
+            track,
+            max_gps_accuracy_m=max_gps_accuracy_m,
+            max_speed_kmh=max_speed_kmh,
+            min_distance=MIN_DISTANCE,
+            rows=session.raw,
+            state=session.filter,
+            upto=len(session.raw),
+        )
+
+        # Cola provisional: filas que se descartan al final de la petición
+        mark = track.mark()
+        track.extend(fresh)
+        sel = filter_positions(
+            track,
+            max_gps_accuracy_m=max_gps_accuracy_m,
+            max_speed_kmh=max_speed_kmh,
+            min_distance=MIN_DISTANCE,
+            rows=session.raw + array("l", range(mark[0], len(track))),
+            state=session.filter.copy(),
+        )
+    _check_cancel(cancel)
+
+    # Anti-spike: definitivo hasta 2 posiciones antes del final del filtro confirmado
+    with timed(timer, "anti_spike"):
+        done = session.spike_done
+        anti_spike_radius = float(params["anti_spike_radius"])
+        anti_spike_time = int(params["anti_spike_time"])
+        if anti_spike_radius > 0 and anti_spike_time > 0:
+            lo = max(0, done - 2)
+            drops = _spike_drops(
+                track,
+                sel[lo:],
+                max_gps_accuracy_m,
+                float(params["anti_spike_factor_k"]),
+                float(params["anti_spike_detour_ratio"]),
+                anti_spike_time,
+                max(10.0, anti_spike_radius),
+                REQUIRE_GOOD_ACC,
+            )
+            new_done = max(done, len(committed) - 2)
+            spike_head = array("l", (sel[p] for p in range(done, new_done) if p - lo not in drops))
+            spike_tail = array("l", (sel[p] for p in range(new_done, len(sel)) if p - lo not in drops))
+        else:
+            new_done = len(committed)
+            spike_head = sel[done:new_done]
+            spike_tail = sel[new_done:]
+        session.spike_done = new_done
+        session.spike_keep.extend(spike_head)
+    _check_cancel(cancel)
+
+    # Paradas: se reanuda en stop_from y se corta en el último checkpoint definitivo
+    with timed(timer, "stops"):
+        stop_radius_m = float(params["stop_radius_m"])
+        stop_time_s = int(params["stop_time_s"])
+        if stop_radius_m > 0 and stop_time_s > 0:
+            reentry_gap_s = int(params["reentry_gap_s"])
+            local = session.spike_keep[session.stop_from:] + spike_tail
+            checkpoints: List[Tuple[int, int, float]] = []
+            out = _collapse_stops(
+                track,
+                local,
+                stop_radius_m,
+                stop_time_s,
+                int(params["outside_gap_s"]),
+                max_gps_accuracy_m,
+                REQUIRE_GOOD_ACC,
+                checkpoints,
+            )
+            cut_i, cut_k = _stop_cut(
+                track, local, out, checkpoints, len(session.spike_keep) - session.stop_from, stop_radius_m, reentry_gap_s
+            )
+            head = keep_first_stop_in_same_radius(track, out[:cut_k], same_radius_m=stop_radius_m, reentry_gap_s=reentry_gap_s)
+            tail = keep_first_stop_in_same_radius(track, out[cut_k:], same_radius_m=stop_radius_m, reentry_gap_s=reentry_gap_s)
+            session.stop_from += cut_i
+        else:
+            head, tail = spike_head, spike_tail
+    _check_cancel(cancel)
+
+    # Resumen y zonas: parte definitiva acumulada + cola
+    final = session.final
+    nf = len(final)
+    sel = final + head + tail
+    with timed(timer, "summary"):
+        tail_seg = segment_metrics(track, sel[nf - 1:] if nf else sel)
+        seg = Segments(session.seg_dist + tail_seg.dist_m, session.seg_dt + tail_seg.dt_s)
+
+        if session.summary is None:
+            session.summary = SummaryAcc()
+        acc = session.summary.copy()
+        acc.feed(track, sel, seg, nf, len(sel))
+        summary = acc.result()
+
+    with timed(timer, "zone_stats"):
+        memo = session.zone_memo
+        if memo is None or memo.zones is not zones:
+            memo = session.zone_memo = ZoneMemo(zones)
+        zones_rows = _calc_zone_stats(track, sel, zones, expected_total_s=summary["total_time_s"], seg=seg, memo=memo)
+    _check_cancel(cancel)
+
+    base = session.base_for(client_seq)
+    with timed(timer, "positions"):
+        header = proj.header(track, sel[base:]) if proj is not None and encoding is None else None
+        if encoding is not None:
+            positions = EncodedTrack(track, sel[base:])
+        else:
+            positions = track.to_positions(sel[base:], proj)
+
+    # Consolidar la parte definitiva y descartar la cola provisional
+    nf2 = nf + len(head)
+    session.summary.feed(track, sel, seg, nf, nf2)
+    session.seg_dist = seg.dist_m[:max(0, nf2 - 1)]
+    session.seg_dt = seg.dt_s[:max(0, nf2 - 1)]
+    memo.truncate(nf2)
+    moved = track.truncate(mark, keep=[r for r in head if r >= mark[0]])
+    final.extend(moved.get(r, r) for r in head)
+    session.seq += 1
+    session.remember_cut()
+
+    if encoding is not None:
+        extra = {"summary": summary, "zones": zones_rows, "cursor": session.cursor(), "base": base}
+        with timed(timer, "encode"):
+            return encode_payload(encoding, positions, extra)
+
+    payload = {
+        "positions": positions,
+        "summary": summary,
+        "zones": zones_rows,
+        "cursor": session.cursor(),
+        "base": base,
+    }
+    if header is not None:
+        payload = {"header": header, **payload}
+    return payload
+
+
+def _wants_stream(query) -> bool:
+    return query.get("stream") in ("1", "true", "ndjson")
+
+
+def _encoding(request) -> Optional[str]:
+    """
+    Codificación compacta pedida con format=polyline|binary o, sin format=, por la
+    cabecera Accept. None = JSON de posiciones (fields= y stream= solo aplican entonces).
+    """
+    fmt = (request.query.get("format") or "").strip().lower()
+    if fmt:
+        return fmt if fmt in ENCODINGS else None
+    accept = request.headers.get("Accept", "")
+    if BINARY_CONTENT_TYPE in accept:
+        return "binary"
+    if POLYLINE_CONTENT_TYPE in accept:
+        return "polyline"
+    return None
+
+
+def _use_lite_reader(params: Dict[str, Any], proj: Optional[Projection], encoding: Optional[str]) -> bool:
+    """Lectura SQL directa (recorder_reader) si la respuesta solo usa atributos de LITE_ATTRIBUTES."""
+    if not (params["sql_reader"] and _sql_reader_ok):
+        return False
+    if encoding is not None:
+        return True
+    return proj is not None and set(proj.attrs) <= set(LITE_ATTRIBUTES)
+
+
+def _projection(query) -> Optional[Projection]:
+    """
+    fields= de la petición. Sin él, perfil compacto (COMPACT_FIELDS); "all" devuelve las
+    posiciones completas de siempre. Si no, lista separada por comas de atributos (y/o
+    "state", "last_changed"); "compact" dentro de la lista se expande al perfil.
+    """
+    raw = (query.get("fields") or "compact").strip()
+    if raw in ("all", "full"):
+        return None
+    fields: List[str] = []
+    for name in raw.split(","):
+        name = name.strip()
+        if name == "compact":
+            fields.extend(COMPACT_FIELDS)
+        elif name:
+            fields.append(name)
+    return Projection(fields)
+
+
+def _payload_records(payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Registros NDJSON de un payload ya calculado: la cabecera ({"header": ...}) si la hay,
+    una línea por posición (mismo dict que en el JSON normal) y, al final, el resto del
+    payload como registros de una sola clave ({"summary": ...}, {"zones": [...]}, ...).
+    """
+    if "header" in payload:
+        yield {"header": payload["header"]}
+    yield from payload["positions"]
+    for key, value in payload.items():
+        if key not in ("header", "positions"):
+            yield {key: value}
+
+
+def _ndjson_chunks(records: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Respuesta NDJSON: una línea por registro, por bloques de STREAM_CHUNK_POSITIONS,
+    y {"end": true} al final. Se consume por bloques desde el executor.
+    """
+    buf = []
+    for rec in records:
+        buf.append(json_bytes(rec))
+        if len(buf) >= STREAM_CHUNK_POSITIONS:
+            yield b"\n".join(buf) + b"\n"
+            buf = []
+    buf.append(json_bytes({"end": True}))
+    yield b"\n".join(buf) + b"\n"
+
+
+def _release_session(store: SessionStore, session: IncrementalSession, fut) -> None:
+    """Fin del trabajo sobre una sesión: si falló o se canceló a medias, no se puede reutilizar."""
+    if fut.cancelled() or fut.exception() is not None:
+        store.drop(session)
+    session.lock.release()
+
+
+def _pipeline_semaphore(hass, max_concurrency: int) -> asyncio.Semaphore:
+    """
+    Semáforo compartido que limita cuántos pipelines ocupan el executor a la vez.
+    Vive en hass.data (el unload lo descarta) junto con su límite: si
+    filter_max_concurrency cambia se crea otro con el nuevo límite, y los trabajos
+    que aún tienen el anterior lo liberan al acabar sin afectar al nuevo.
+    """
+    limit = max(1, int(max_concurrency))
+    dd = hass.data.setdefault(DOMAIN, {})
+    current = dd.get(PIPELINE_SEMAPHORE_KEY)
+    if current is None or current[0] != limit:
+        current = dd[PIPELINE_SEMAPHORE_KEY] = (limit, asyncio.Semaphore(limit))
+    return current[1]
+
+
+def _timing_stats(hass) -> TimingStats:
+    """Percentiles móviles por etapa de filtered_positions (se crean con la primera petición)."""
+    dd = hass.data.setdefault(DOMAIN, {})
+    stats = dd.get(TIMING_STATS_KEY)
+    if stats is None:
+        stats = dd[TIMING_STATS_KEY] = TimingStats()
+    return stats
+
+
+def _record_timings(hass, stats: TimingStats, kind: str, timer: StageTimer) -> None:
+    """Tiempos de una petición ya respondida -> percentiles móviles y métricas."""
+    stats.record(kind, timer)
+    observe_stages(hass, kind, timer.stages)
+
+
+@collector
+def _collect_metrics(hass):
+    """Cachés del pipeline: memo de atributos, caché por días y sesiones incrementales."""
+    dd = hass.data.get(DOMAIN, {})
+    hits = MetricFamily("cache_hits_total", "counter", "Cache hits by cache")
+    misses = MetricFamily("cache_misses_total", "counter", "Cache misses by cache")
+    ratio = MetricFamily("cache_hit_ratio", "gauge", "hits / (hits + misses) since start, by cache")
+    entries = MetricFamily("cache_entries", "gauge", "Entries held in memory, by cache")
+    caches = []
+    memo = dd.get(ATTRS_MEMO_KEY)
+    if memo is not None:
+        st = memo.stats()
+        caches.append(("recorder_attributes", st["hits"], st["misses"], st["entries"]))
+    day_cache = dd.get(DAY_CACHE_KEY)
+    if day_cache is not None:
+        st = day_cache.stats()
+        caches.append(("day_cache", st["hits"], st["misses"], None))
+    for name, h, m, n in caches:
+        hits.add(h, cache=name)
+        misses.add(m, cache=name)
+        ratio.add(h / max(1, h + m), cache=name)
+        if n is not None:
+            entries.add(n, cache=name)
+    store = dd.get(INCREMENTAL_SESSIONS_KEY)
+    if store is not None:
+        entries.add(store.stats()["sessions"], cache="incremental_sessions")
+    return [hits, misses, ratio, entries]
+
+
+def _client_gone(request) -> bool:
+    transport = request.transport
+    return transport is None or transport.is_closing()
+
+
+async def _await_unless_disconnected(request, fut, cancel: threading.Event):
+    """
+    Espera el resultado del executor vigilando la conexión.
+    Si el cliente se desconecta (o la petición se cancela) marca `cancel` para que
+    el pipeline aborte en la siguiente etapa y devuelve None.
+    """
+    try:
+        while True:
+            done, _ = await asyncio.wait({fut}, timeout=DISCONNECT_POLL_S)
+            if done:
+                return fut.result()
+            if _client_gone(request):
+                cancel.set()
+                # consumir la excepción PipelineCancelled cuando termine el hilo
+                fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+                return None
+    except asyncio.CancelledError:
+        cancel.set()
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        raise
 
 # ----------------------------
 # Endpoint
@@ -1095,196 +2035,403 @@ class FilteredPositionsEndpoint(HomeAssistantView):
     name = "api:ha_tracker/filtered_positions"
     requires_auth = True
 
+    @instrumented("filtered_positions")
     async def get(self, request):
-        """Devuelve posiciones filtradas de un usuario entre fechas"""
+        """
+        Devuelve posiciones filtradas de un usuario entre fechas.
+        Cada respuesta lleva la cabecera Server-Timing con el tiempo de cada etapa;
+        con debug=1 (solo admin) también un bloque "debug" con esos tiempos y el
+        desglose de la etapa fusionada. timings=1 (solo admin) devuelve los percentiles
+        móviles por etapa y timings=reset los borra.
+        """
 
         hass = request.app["hass"]
 
-        # Devuelve solo si es administrador o only_admin es false
-        only_admin = False
-
-        # valores por defecto (radios float, tiempos int)
-        stop_radius_m: float = float(STOP_RADIUS_M_FALLBACK)
-        stop_time_s: int = int(STOP_TIME_S_FALLBACK)
-        anti_spike_factor_k: float = float(ANTI_SPIKE_FACTOR_K)
-        anti_spike_detour_ratio: float = float(ANTI_SPIKE_DETOUR_RATIO)
-        anti_spike_radius: float = float(ANTI_SPIKE_RADIUS_FALLBACK)
-        anti_spike_time: int = int(ANTI_SPIKE_TIME_S_FALLBACK)
-        reentry_gap_s: int = int(REENTRY_GAP_S_FALLBACK)
-        outside_gap_s: int = int(OUTSIDE_GAP_S_FALLBACK)
-        max_gps_accuracy_m: float = float(MAX_GPS_ACCURACY_M_FALLBACK)
-        max_speed_kmh: float = float(MAX_SPEED_KMH_FALLBACK)        
-
-        entries = hass.config_entries.async_entries(DOMAIN)
-        if entries:
-            entry = entries[0]
-            only_admin = entry.options.get("only_admin", entry.data.get("only_admin", False))
-
-            # stop_radius (float >= 0)
-            try:
-                stop_radius_m = float(entry.options.get("stop_radius", entry.data.get("stop_radius", stop_radius_m)))
-                if stop_radius_m < 0:
-                    stop_radius_m = 0.0
-            except (TypeError, ValueError):
-                pass
-
-            # stop_time (int >= 0)
-            try:
-                stop_time_s = int(entry.options.get("stop_time", entry.data.get("stop_time", stop_time_s)))
-                if stop_time_s < 0:
-                    stop_time_s = 0
-            except (TypeError, ValueError):
-                pass
-
-            # reentry_gap (int >= 0)
-            try:
-                reentry_gap_s = int(entry.options.get("reentry_gap", entry.data.get("reentry_gap", reentry_gap_s)))
-                if reentry_gap_s < 0:
-                    reentry_gap_s = 0
-            except (TypeError, ValueError):
-                pass
-                
-            # outside_gap (int >= 0)
-            try:
-                outside_gap_s = int(entry.options.get("outside_gap", entry.data.get("outside_gap", outside_gap_s)))
-                if outside_gap_s < 0:
-                    outside_gap_s = 0
-            except (TypeError, ValueError):
-                pass        
-
-            # gps_accuracy (float >= 0)
-            try:
-                max_gps_accuracy_m = float(entry.options.get("gps_accuracy", entry.data.get("gps_accuracy", max_gps_accuracy_m)))
-                if max_gps_accuracy_m < 0:
-                    max_gps_accuracy_m = 0
-            except (TypeError, ValueError):
-                pass
-                
-            # max_speed (float >= 0)
-            try:
-                max_speed_kmh = float(entry.options.get("max_speed", entry.data.get("max_speed", max_speed_kmh)))
-                if max_speed_kmh < 0:
-                    max_speed_kmh = 0
-            except (TypeError, ValueError):
-                pass                     
-
-            # anti_spike_factor_k (float >= 0)
-            try:
-                anti_spike_factor_k = float(entry.options.get("anti_spike_factor_k", entry.data.get("anti_spike_factor_k", anti_spike_factor_k)))
-                if anti_spike_factor_k < 0:
-                    anti_spike_factor_k = 0.0
-            except (TypeError, ValueError):
-                pass
-
-            # anti_spike_detour_ratio (float >= 0)
-            try:
-                anti_spike_detour_ratio = float(entry.options.get("anti_spike_detour_ratio", entry.data.get("anti_spike_detour_ratio", anti_spike_detour_ratio)))
-                if anti_spike_detour_ratio < 0:
-                    anti_spike_detour_ratio = 0.0
-            except (TypeError, ValueError):
-                pass                
-
-            # anti_spike_radius (float >= 0)
-            try:
-                anti_spike_radius = float(entry.options.get("anti_spike_radius", entry.data.get("anti_spike_radius", anti_spike_radius)))
-                if anti_spike_radius < 0:
-                    anti_spike_radius = 0.0
-            except (TypeError, ValueError):
-                pass
-
-            # anti_spike_time (int >= 0)
-            try:
-                anti_spike_time = int(entry.options.get("anti_spike_time", entry.data.get("anti_spike_time", anti_spike_time)))
-                if anti_spike_time < 0:
-                    anti_spike_time = 0
-            except (TypeError, ValueError):
-                pass
+        only_admin, params = _load_filter_config(hass)
 
         user = request["hass_user"]
         if only_admin and (user is None or not user.is_admin):
             return self.json({"error": "Forbidden"}, status_code=403)
 
         query = request.query
+        is_admin = user is not None and user.is_admin
+
+        if "timings" in query:
+            if not is_admin:
+                return self.json({"error": "Forbidden"}, status_code=403)
+            stats = _timing_stats(hass)
+            if query.get("timings") == "reset":
+                stats.clear()
+            return self.json(stats.snapshot())
+
+        timer = StageTimer(debug=is_admin and query.get("debug") == "1")
 
         person_id, start_date, end_date, error = validate_query_params(query)
         if error:
             return self.json(error, status_code=error["status_code"])
-                     
+
         source_device_id, error = validate_person(hass, person_id)
         if error:
             return self.json(error, status_code=error["status_code"])
 
         start_datetime_utc, end_datetime_utc, error = validate_dates(start_date, end_date)
         if error:
-            return self.json(error, status_code=error["status_code"])       
-        
+            return self.json(error, status_code=error["status_code"])
+
+        simplify_m, zoom, error = validate_simplify(query)
+        if error:
+            return self.json(error, status_code=error["status_code"])
+        simplified = simplify_m is not None or zoom is not None
+
+        encoding = _encoding(request)
+        stream = encoding is None and _wants_stream(query)
+        proj = _projection(query) if encoding is None else None
+        lite = _use_lite_reader(params, proj, encoding)
+
+        cache = hass.data.get(DOMAIN, {}).get(DAY_CACHE_KEY) if params["day_cache"] else None
+
+        # Modo incremental (incremental=1 o cursor=...): solo si el rango termina en "ahora".
+        # Con simplificación no: el delta se apoya en posiciones definitivas, que dejan de serlo.
+        if not simplified and (query.get("incremental") in ("1", "true") or query.get("cursor")) and (
+            end_datetime_utc >= dt_util.utcnow() - timedelta(seconds=INCREMENTAL_SETTLE_S)
+        ):
+            store = _session_store(hass)
+            key = _session_key(person_id, source_device_id, start_datetime_utc, params, lite)
+            sid, seq = parse_cursor(query.get("cursor"))
+            session = store.get(sid, key)
+            if session is None:
+                session, seq = store.create(key, source_device_id, start_datetime_utc), None
+            # Si otra petición está avanzando la misma sesión, respuesta completa normal
+            if session.lock.acquire(blocking=False):
+                return await self._incremental(
+                    request, hass, store, session, seq, person_id, start_datetime_utc, end_datetime_utc, cache, params, lite,
+                    timer,
+                )
+
         try:
             rec = get_recorder_instance(hass)
-            history = await rec.async_add_executor_job(
+            with timer.stage("recorder"):
+                states = await rec.async_add_executor_job(
+                    partial(
+                        _load_states,
+                        hass,
+                        source_device_id,
+                        start_datetime_utc,
+                        end_datetime_utc,
+                        cache,
+                        getattr(rec, "keep_days", None),
+                        lite,
+                    )
+                )
+        except (OSError, ValueError, KeyError) as e:
+            return self.json({"error": f"Error with history: {str(e)}"}, status_code=500)
+
+        if not states:
+            return await self._respond(request, hass, _empty_payload(proj, encoding), stream, timer, "full")
+
+        # Las zonas se leen en el loop (hass.states no es thread-safe); el resto va al executor
+        with timer.stage("zones"):
+            zones = _zone_index(hass)
+
+        cancel = threading.Event()
+        queued = time.perf_counter()
+        async with _pipeline_semaphore(hass, params["max_concurrency"]):
+            timer.add("queue", time.perf_counter() - queued)
+            if _client_gone(request):
+                return self.json({"error": "Client disconnected"}, status_code=499)
+            if stream and not simplified:
+                # las posiciones salen según las produce el pipeline (que ocupa el semáforo mientras)
+                records = _stream_pipeline(
+                    states, start_datetime_utc, end_datetime_utc, zones, params, cancel, proj, timer
+                )
+                return await self._respond(request, hass, records, stream, timer, "full")
+            fut = hass.async_add_executor_job(
                 partial(
-                    get_significant_states,
-                    hass,
+                    _run_pipeline,
+                    states,
                     start_datetime_utc,
                     end_datetime_utc,
-                    [source_device_id],
-                    include_start_time_state=False,
-                    significant_changes_only=False,
-                    minimal_response=False,
-                    no_attributes=False,
+                    zones,
+                    params,
+                    cancel,
+                    stream,
+                    proj,
+                    encoding,
+                    simplify_m,
+                    zoom,
+                    timer,
                 )
             )
-        except (OSError, ValueError, KeyError) as e:
-            return self.json({"error": f"Error with history: {str(e)}"}, status_code=500)
+            payload = await _await_unless_disconnected(request, fut, cancel)
 
-        if not history or source_device_id not in history:
-            return self.json(_empty_payload())
+        if payload is None:
+            _LOGGER.debug("filtered_positions: client disconnected, pipeline cancelled for %s", person_id)
+            return self.json({"error": "Client disconnected"}, status_code=499)
 
-        states = history[source_device_id]
-        states = [s for s in states
-                  if dt_util.as_utc(s.last_updated) >= start_datetime_utc
-                  and dt_util.as_utc(s.last_updated) <= end_datetime_utc]
-        states.sort(key=lambda s: dt_util.as_utc(s.last_updated))
+        return await self._respond(request, hass, payload, stream, timer, "full")
 
-        # Filtra posiciones
-        positions = filter_positions(
-            states, 
-            max_gps_accuracy_m=max_gps_accuracy_m,
-            max_speed_kmh=max_speed_kmh, 
-            min_distance=MIN_DISTANCE
-        )            
+    async def _incremental(self, request, hass, store, session, seq, person_id, start_utc, end_utc, cache, params, lite, timer):
+        """Respuesta delta sobre una sesión ya bloqueada; el lock se libera al acabar su trabajo."""
+        encoding = _encoding(request)
+        fut = None
+        try:
+            try:
+                rec = get_recorder_instance(hass)
+                with timer.stage("recorder"):
+                    states = await rec.async_add_executor_job(
+                        partial(
+                            _load_new_states,
+                            hass,
+                            session,
+                            start_utc,
+                            end_utc,
+                            cache,
+                            getattr(rec, "keep_days", None),
+                            lite,
+                        )
+                    )
+            except (OSError, ValueError, KeyError) as e:
+                store.drop(session)
+                return self.json({"error": f"Error with history: {str(e)}"}, status_code=500)
+
+            with timer.stage("zones"):
+                zones = _zone_index(hass)
+
+            cancel = threading.Event()
+            queued = time.perf_counter()
+            async with _pipeline_semaphore(hass, params["max_concurrency"]):
+                timer.add("queue", time.perf_counter() - queued)
+                if _client_gone(request):
+                    return self.json({"error": "Client disconnected"}, status_code=499)
+                fut = hass.async_add_executor_job(
+                    partial(
+                        _run_incremental,
+                        session,
+                        states,
+                        start_utc,
+                        end_utc,
+                        zones,
+                        params,
+                        seq,
+                        cancel,
+                        _projection(request.query) if encoding is None else None,
+                        encoding,
+                        timer,
+                    )
+                )
+                # el hilo puede seguir tras una desconexión: el lock se suelta cuando termine
+                fut.add_done_callback(partial(_release_session, store, session))
+                payload = await _await_unless_disconnected(request, fut, cancel)
+        finally:
+            if fut is None:
+                session.lock.release()
+
+        if payload is None:
+            _LOGGER.debug("filtered_positions: client disconnected, incremental update cancelled for %s", person_id)
+            return self.json({"error": "Client disconnected"}, status_code=499)
+
+        return await self._respond(
+            request, hass, payload, encoding is None and _wants_stream(request.query), timer, "incremental"
+        )
 
-        # Anti-spike 5 puntos por velocidad relativa (A→B, B→C→D, D→E)
-        if anti_spike_radius > 0 and anti_spike_time > 0:
-            positions = drop_c_spikes_relative_5pt(
-                positions,
-                factor_k=float(anti_spike_factor_k),
-                min_detour_ratio=float(anti_spike_detour_ratio),
-                max_bd_dt_s=int(anti_spike_time),          # puedes reutilizar tu opción existente
-                min_leg_m=max(10.0, anti_spike_radius),    # coherente con tu escala espacial
-                max_gps_accuracy_m=max_gps_accuracy_m
-            )   
-
-        # Paradas
-        if stop_radius_m > 0 and stop_time_s > 0:
-            positions = annotate_stops_and_collapse(
-                positions,
-                stop_radius_m=float(stop_radius_m),
-                stop_time_s=int(stop_time_s),
-                reentry_gap_s=int(reentry_gap_s),
-                outside_gap_s=int(outside_gap_s),
-                max_gps_accuracy_m=float(max_gps_accuracy_m),
-                require_good_acc=REQUIRE_GOOD_ACC,               
+    async def _respond(self, request, hass, payload, stream: bool, timer: StageTimer, kind: str):
+        """
+        JSON de una pieza, binario (format=binary) o, con stream=1, NDJSON por bloques serializados en el executor.
+        En NDJSON `payload` puede ser ya un iterador de registros (_stream_pipeline); si falla a
+        mitad, la respuesta termina con {"error": ...} en lugar de {"end": true}.
+        Añade Server-Timing (y el bloque "debug" si se pidió) y guarda los tiempos en las estadísticas de `kind`.
+        """
+        stats = _timing_stats(hass)
+        record = partial(_record_timings, hass, stats, kind, timer)
+        if timer.debug and isinstance(payload, dict):
+            payload = {**payload, "debug": {"timings_ms": timer.ms()}}
+
+        if isinstance(payload, bytes):
+            response = web.Response(
+                body=payload,
+                content_type=BINARY_CONTENT_TYPE,
+                headers={"Cache-Control": "no-store", "Server-Timing": timer.server_timing()},
             )
+            record()
+            return response
+        if not stream:
+            with timer.stage("serialize"):
+                response = self.json(payload)
+            response.headers["Server-Timing"] = timer.server_timing()
+            record()
+            return response
+
+        # En NDJSON la cabecera sale antes de serializar: "stream" solo entra en las estadísticas
+        response = web.StreamResponse(headers={
+            "Content-Type": NDJSON_CONTENT_TYPE,
+            "Cache-Control": "no-store",
+            "Server-Timing": timer.server_timing(),
+        })
+        await response.prepare(request)
+        chunks = _ndjson_chunks(_payload_records(payload) if isinstance(payload, dict) else payload)
+        failed = False
+        try:
+            with timer.stage("stream"):
+                while True:
+                    try:
+                        chunk = await hass.async_add_executor_job(next, chunks, None)
+                    except Exception as e:  # la respuesta ya empezó (200): el error va como registro
+                        _LOGGER.exception("filtered_positions: pipeline failed while streaming")
+                        await response.write(json_bytes({"error": f"Pipeline error: {e}"}) + b"\n")
+                        failed = True
+                        break
+                    if chunk is None:
+                        break
+                    await response.write(chunk)
+        except ConnectionResetError:
+            _LOGGER.debug("filtered_positions: client disconnected while streaming")
+            return response
+        await response.write_eof()
+        if not failed:
+            record()
+        return response
 
-        # --- calcular resumen y zonas en servidor ---
-        zones = _all_zones(hass)
-        
-        summary = _calc_summary(positions)
-        zones_rows = _calc_zone_stats(positions, zones, expected_total_s=summary["total_time_s"])
 
-        payload = {
-            "positions": positions,
-            "summary": summary,
-            "zones": zones_rows
-        }
-        return self.json(payload)
+class FilteredPositionsBatchEndpoint(HomeAssistantView):
+    """Obtener posiciones filtradas de varias personas en el mismo rango de fechas"""
+
+    url = "/api/ha_tracker/filtered_positions/batch"
+    name = "api:ha_tracker/filtered_positions/batch"
+    requires_auth = True
+
+    @instrumented("filtered_positions/batch")
+    async def get(self, request):
+        """
+        Un resultado por persona ({"person_id": ..., y el payload de filtered_positions o
+        "error"}). Una sola lectura del recorder para todos los device_tracker; los
+        pipelines corren en paralelo (limitados por el semáforo común). Con stream=1 cada
+        resultado es una línea NDJSON que se envía en cuanto termina, y al final {"end": true}.
+        """
+        hass = request.app["hass"]
+
+        only_admin, params = _load_filter_config(hass)
+
+        user = request["hass_user"]
+        if only_admin and (user is None or not user.is_admin):
+            return self.json({"error": "Forbidden"}, status_code=403)
+
+        query = request.query
+
+        persons, start_date, end_date, error = validate_batch_params(query)
+        if error:
+            return self.json(error, status_code=error["status_code"])
+
+        start_utc, end_utc, error = validate_dates(start_date, end_date)
+        if error:
+            return self.json(error, status_code=error["status_code"])
+
+        simplify_m, zoom, error = validate_simplify(query)
+        if error:
+            return self.json(error, status_code=error["status_code"])
+
+        encoding = _encoding(request)
+        if encoding == "binary":
+            return self.json({"error": "format=binary is not available in batch requests", "status_code": 400}, status_code=400)
+        stream = _wants_stream(query)
+        lite = _use_lite_reader(params, _projection(query) if encoding is None else None, encoding)
+
+        # Personas sin device_tracker válido: su error va como resultado, el resto sigue
+        errors: Dict[str, Dict[str, Any]] = {}
+        devices: Dict[str, str] = {}
+        for person_id in persons:
+            source_device_id, error = validate_person(hass, person_id)
+            if error:
+                errors[person_id] = error
+            else:
+                devices[person_id] = source_device_id
+
+        by_entity: Dict[str, List[Any]] = {}
+        if devices:
+            cache = hass.data.get(DOMAIN, {}).get(DAY_CACHE_KEY) if params["day_cache"] else None
+            try:
+                rec = get_recorder_instance(hass)
+                by_entity = await rec.async_add_executor_job(
+                    partial(
+                        _load_states_many,
+                        hass,
+                        list(devices.values()),
+                        start_utc,
+                        end_utc,
+                        cache,
+                        getattr(rec, "keep_days", None),
+                        lite,
+                    )
+                )
+            except (OSError, ValueError, KeyError) as e:
+                return self.json({"error": f"Error with history: {str(e)}"}, status_code=500)
+
+        zones = _zone_index(hass)
+        cancel = threading.Event()
+
+        async def _one(person_id: str):
+            # Projection guarda estado (hoisted): una por pipeline
+            proj = _projection(query) if encoding is None else None
+            states = by_entity.get(devices[person_id]) or []
+            if not states:
+                return person_id, _empty_payload(proj, encoding)
+            async with _pipeline_semaphore(hass, params["max_concurrency"]):
+                if cancel.is_set() or _client_gone(request):
+                    cancel.set()
+                    return person_id, None
+                fut = hass.async_add_executor_job(
+                    partial(
+                        _run_pipeline,
+                        states,
+                        start_utc,
+                        end_utc,
+                        zones,
+                        params,
+                        cancel,
+                        False,
+                        proj,
+                        encoding,
+                        simplify_m,
+                        zoom,
+                    )
+                )
+                try:
+                    return person_id, await _await_unless_disconnected(request, fut, cancel)
+                except PipelineCancelled:
+                    return person_id, None
+                except Exception as e:  # un fallo de una persona no tumba al resto
+                    _LOGGER.exception("filtered_positions/batch: pipeline failed for %s", person_id)
+                    return person_id, {"error": f"Pipeline error: {e}", "status_code": 500}
+
+        tasks = [asyncio.ensure_future(_one(person_id)) for person_id in devices]
+        try:
+            if not stream:
+                records = {pid: {"person_id": pid, **err} for pid, err in errors.items()}
+                for coro in asyncio.as_completed(tasks):
+                    person_id, payload = await coro
+                    if payload is None:
+                        return self.json({"error": "Client disconnected"}, status_code=499)
+                    records[person_id] = {"person_id": person_id, **payload}
+                return self.json({"results": [records[pid] for pid in persons]})
+
+            response = web.StreamResponse(headers={"Content-Type": NDJSON_CONTENT_TYPE, "Cache-Control": "no-store"})
+            await response.prepare(request)
+            try:
+                for person_id, err in errors.items():
+                    await response.write(json_bytes({"person_id": person_id, **err}) + b"\n")
+                for coro in asyncio.as_completed(tasks):
+                    person_id, payload = await coro
+                    if payload is None:
+                        return response
+                    line = await hass.async_add_executor_job(json_bytes, {"person_id": person_id, **payload})
+                    await response.write(line + b"\n")
+                await response.write(json_bytes({"end": True}) + b"\n")
+            except ConnectionResetError:
+                _LOGGER.debug("filtered_positions/batch: client disconnected while streaming")
+                cancel.set()
+                return response
+            await response.write_eof()
+            return response
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
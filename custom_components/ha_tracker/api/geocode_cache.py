@@ -0,0 +1,154 @@
+"""Caché de reverse geocoding: entradas con id estable, índice por celda y orden LRU/TTL"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+Cell = Tuple[int, int]
+
+
+class GeocodeCache:
+    """
+    id -> entrada (CacheEntry de reverse_geocode) más el índice celda -> ids.
+
+    Los ids no cambian cuando se borran otras entradas, así que el índice se mantiene
+    con altas y bajas O(1) (cada celda es un dict usado como conjunto ordenado) y nunca
+    hay que reconstruirlo ni defenderse de posiciones obsoletas.
+
+    Cada entrada lleva su instante efectivo (epoch, s): el de alta o el del último uso.
+    La caché global y cada celda se mantienen ordenadas por ese instante (lista
+    enlazada del OrderedDict / reinserción en el dict de la celda), así que caducar
+    por TTL, bajar al tope o recortar una celda quita entradas por el principio en
+    O(1) cada una, sin ordenar ni parsear fechas. Supone que altas y usos llegan con
+    el reloj actual (no decreciente); la carga inicial se ordena una vez.
+    No es thread-safe: se usa desde el event loop bajo DATA_LOCK_KEY.
+    """
+
+    __slots__ = ("_entries", "_cell_by_id", "_cells", "_ts", "_next_id")
+
+    def __init__(self) -> None:
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._cell_by_id: Dict[int, Cell] = {}
+        self._cells: Dict[Cell, Dict[int, None]] = {}
+        self._ts: "OrderedDict[int, float]" = OrderedDict()   # del más antiguo al más reciente
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, entry_id: int) -> bool:
+        return entry_id in self._entries
+
+    def add(self, entry: Dict[str, Any], cell: Cell, ts: float) -> int:
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        self._cell_by_id[entry_id] = cell
+        self._cells.setdefault(cell, {})[entry_id] = None
+        self._ts[entry_id] = ts
+        return entry_id
+
+    def remove(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return None
+        del self._ts[entry_id]
+        cell = self._cell_by_id.pop(entry_id)
+        ids = self._cells[cell]
+        del ids[entry_id]
+        if not ids:
+            del self._cells[cell]
+        return entry
+
+    def get(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        return self._entries.get(entry_id)
+
+    def touch(self, entry_id: int, ts: float) -> None:
+        """Uso de la entrada en `ts`: pasa a ser la más reciente (global y de su celda)."""
+        self._ts[entry_id] = max(ts, self._ts[entry_id])
+        self._ts.move_to_end(entry_id)
+        ids = self._cells[self._cell_by_id[entry_id]]
+        del ids[entry_id]
+        ids[entry_id] = None
+
+    def touch_where(self, cell: Cell, match: Callable[[Dict[str, Any]], bool], ts: float) -> int:
+        """touch de las entradas de la celda que cumplen `match` (p. ej. el mismo punto en varios idiomas)."""
+        entries = self._entries
+        same = [i for i in self._cells.get(cell, ()) if match(entries[i])]
+        for entry_id in same:
+            self.touch(entry_id, ts)
+        return len(same)
+
+    def expire(self, cutoff: float) -> List[Dict[str, Any]]:
+        """Borra las entradas cuyo instante efectivo es anterior a `cutoff`; devuelve las borradas."""
+        out = []
+        ts = self._ts
+        while ts:
+            entry_id, t = next(iter(ts.items()))
+            if t >= cutoff:
+                break
+            out.append(self.remove(entry_id))
+        return out
+
+    def evict_to(self, size: int) -> List[Dict[str, Any]]:
+        """Borra las menos recientes hasta dejar `size` entradas; devuelve las borradas."""
+        out = []
+        while len(self._entries) > size:
+            out.append(self.remove(next(iter(self._ts))))
+        return out
+
+    def trim_cell(self, cell: Cell, size: int) -> List[Dict[str, Any]]:
+        """Deja en la celda sus `size` entradas más recientes; devuelve las borradas."""
+        ids = self._cells.get(cell)
+        if ids is None or len(ids) <= size:
+            return []
+        return [self.remove(entry_id) for entry_id in list(ids)[:len(ids) - size]]
+
+    def retime(self, ts_of: Callable[[Dict[str, Any]], float]) -> None:
+        """Recalcula el instante de todas las entradas y reordena (O(n log n); solo para resets)."""
+        order = sorted(self._entries, key=lambda i: ts_of(self._entries[i]))
+        self._ts = OrderedDict((i, ts_of(self._entries[i])) for i in order)
+        cells: Dict[Cell, Dict[int, None]] = {}
+        for i in order:
+            cells.setdefault(self._cell_by_id[i], {})[i] = None
+        self._cells = cells
+
+    def merge_older(self, older: "GeocodeCache") -> None:
+        """
+        Se queda con las entradas de `older` por delante (más antiguas) de las propias,
+        sin cambiar de objeto: quien tenga una referencia a esta caché ve ambas.
+        Los ids de las entradas propias cambian; `older` no debe usarse después.
+        """
+        mine = [(self._entries[i], self._cell_by_id[i], t) for i, t in self._ts.items()]
+        self._entries, self._cell_by_id, self._cells = older._entries, older._cell_by_id, older._cells
+        self._ts, self._next_id = older._ts, older._next_id
+        for entry, cell, t in mine:
+            self.add(entry, cell, t)
+
+    def items(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        return iter(list(self._entries.items()))
+
+    def cell_ids(self, cell: Cell) -> List[int]:
+        """Ids de la celda del menos al más reciente (copia: se puede borrar mientras se recorre)."""
+        return list(self._cells.get(cell, ()))
+
+    def in_cells(self, cells: Iterable[Cell]) -> Iterator[Dict[str, Any]]:
+        entries = self._entries
+        for cell in cells:
+            for entry_id in self._cells.get(cell, ()):
+                yield entries[entry_id]
+
+    def cells(self) -> List[Cell]:
+        return list(self._cells)
+
+    def cell_count(self) -> int:
+        return len(self._cells)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._cell_by_id.clear()
+        self._cells.clear()
+        self._ts.clear()
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Entradas en orden de alta (formato persistido: lista de CacheEntry)."""
+        return list(self._entries.values())
@@ -0,0 +1,140 @@
+"""Diario append-only de la caché de reverse geocoding (altas, hits y bajas desde el último snapshot)"""
+
+import json
+import logging
+import os
+
+from typing import Any, Dict, Iterable, List, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+JOURNAL_COMPACT_MIN_RECORDS = 5_000   # por debajo no compensa reescribir el snapshot
+
+# Operaciones (campo "op" de cada línea)
+OP_ADD = "add"              # {"op": "add", "e": CacheEntry}
+OP_DEL = "del"              # {"op": "del", "k": entry_key}
+OP_HOT = "hot"              # {"op": "hot", "k": hot_key, "t": iso}
+OP_CLEAR = "clear"          # reset de la caché
+OP_CLEAR_HOT = "clear_hot"  # reset del hot_map
+
+
+def entry_key(entry: Dict[str, Any]) -> str:
+    """Identidad de una entrada entre reinicios (los ids de GeocodeCache solo viven en memoria)."""
+    return f"{float(entry['lat'])!r},{float(entry['lon'])!r}|{entry.get('lang')}|{entry.get('ts')}"
+
+
+class GeocodeJournal:
+    """
+    Cambios de la caché en NDJSON (una línea por cambio) sobre el snapshot de los Store.
+
+    Las líneas se acumulan en memoria desde el event loop y se escriben al final del
+    fichero por lotes (write, en el executor): cada flush cuesta lo que los cambios, no
+    lo que la caché. La compactación vuelca el snapshot completo y vacía el diario.
+    Mientras la caché se carga en background (paused) los cambios solo se acumulan.
+    Repetir el diario sobre un snapshot que ya lo incluye (caída entre guardar el
+    snapshot y truncar) deja el mismo estado: todas las operaciones son idempotentes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.records = 0                 # líneas en disco desde el último snapshot
+        self.compact_requested = False   # el snapshot está desfasado (migración, reset)
+        self.compacting = False
+        self.paused = False              # no escribir mientras se carga (la carga lee el fichero)
+        self._pending: List[str] = []
+        self._torn: Optional[bool] = None  # el fichero acaba sin '\n' (escritura cortada); None: sin mirar
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def append(self, op: str, **fields: Any) -> None:
+        fields["op"] = op
+        self._pending.append(json.dumps(fields, ensure_ascii=False, separators=(",", ":")))
+
+    def take(self) -> List[str]:
+        lines, self._pending = self._pending, []
+        return lines
+
+    def restore(self, lines: List[str]) -> None:
+        """Devuelve a la cola unas líneas que no se llegaron a escribir (delante de las nuevas)."""
+        self._pending[:0] = lines
+
+    def needs_compaction(self, snapshot_len: int) -> bool:
+        """Cuando el diario ya es tan largo como el snapshot (coste de compactar amortizado por cambio)."""
+        return self.compact_requested or self.records > max(JOURNAL_COMPACT_MIN_RECORDS, snapshot_len)
+
+    # --- E/S bloqueante: solo desde el executor ---
+    def write(self, lines: List[str]) -> None:
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        if self._torn is None:
+            self._torn = self._ends_torn()
+        if self._torn:
+            # cierra la línea cortada: si no, el primer registro nuevo se pegaría a ella y se perdería
+            data = b"\n" + data
+        with open(self.path, "ab") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        self._torn = False
+
+    def read(self) -> List[Dict[str, Any]]:
+        """
+        Registros del diario; se saltan las líneas rotas (p. ej. la última si se cortó una
+        escritura, aunque sea a mitad de un carácter multibyte).
+        """
+        try:
+            with open(self.path, "rb") as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            self._torn = False
+            return []
+        self._torn = bool(data) and not data.endswith(b"\n")
+        out: List[Dict[str, Any]] = []
+        for n, raw in enumerate(data.split(b"\n"), 1):
+            if not raw.strip():
+                continue
+            try:
+                rec = json.loads(raw.decode("utf-8"))
+            except ValueError:   # UnicodeDecodeError incluido
+                _LOGGER.warning("reverse_geocode journal: skipping broken line %d in %s", n, self.path)
+                continue
+            if isinstance(rec, dict):
+                out.append(rec)
+        return out
+
+    def truncate(self) -> None:
+        with open(self.path, "wb"):
+            pass
+        self._torn = False
+
+    def _ends_torn(self) -> bool:
+        try:
+            with open(self.path, "rb") as fh:
+                fh.seek(0, os.SEEK_END)
+                if fh.tell() == 0:
+                    return False
+                fh.seek(-1, os.SEEK_END)
+                return fh.read(1) != b"\n"
+        except FileNotFoundError:
+            return False
+
+
+def replay(records: Iterable[Dict[str, Any]], entries: Dict[str, Dict[str, Any]], hot_map: Dict[str, str]) -> None:
+    """Aplica el diario sobre el snapshot: `entries` (entry_key -> entrada) y `hot_map` (hot_key -> iso)."""
+    for rec in records:
+        op = rec.get("op")
+        try:
+            if op == OP_ADD:
+                entry = rec["e"]
+                entries.setdefault(entry_key(entry), entry)
+            elif op == OP_DEL:
+                entries.pop(rec["k"], None)
+            elif op == OP_HOT:
+                hot_map[rec["k"]] = rec["t"]
+            elif op == OP_CLEAR:
+                entries.clear()
+            elif op == OP_CLEAR_HOT:
+                hot_map.clear()
+        except (KeyError, TypeError, ValueError):
+            continue
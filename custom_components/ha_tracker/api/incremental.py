@@ -0,0 +1,160 @@
+"""Estado reanudable del filtro para rangos que terminan en "ahora" (respuestas delta con cursor)"""
+
+import secrets
+import threading
+import time
+
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .track import Track
+
+INCREMENTAL_SETTLE_S = 30           # los estados más recientes que esto se reprocesan en cada petición
+INCREMENTAL_TTL_S = 900             # sesión sin uso durante este tiempo -> se descarta
+INCREMENTAL_MAX_SESSIONS = 4        # sesiones vivas (cada una guarda su track en memoria)
+INCREMENTAL_MAX_CUTS = 8            # respuestas recientes por sesión a las que se puede responder con delta
+
+
+class FilterState:
+    """Estado del filtro base tras procesar `next` filas: aceptadas y último punto aceptado."""
+
+    __slots__ = ("sel", "next", "last_lat", "last_lon", "last_seen_s", "last_seen_us")
+
+    def __init__(self) -> None:
+        self.sel = array("l")
+        self.next = 0
+        self.last_lat: Optional[float] = None
+        self.last_lon: Optional[float] = None
+        self.last_seen_s: Optional[int] = None
+        self.last_seen_us: Optional[int] = None
+
+    def copy(self) -> "FilterState":
+        other = FilterState()
+        other.sel = array("l", self.sel)
+        other.next = self.next
+        other.last_lat, other.last_lon = self.last_lat, self.last_lon
+        other.last_seen_s, other.last_seen_us = self.last_seen_s, self.last_seen_us
+        return other
+
+
+class IncrementalSession:
+    """
+    Todo lo necesario para continuar el pipeline de una persona desde `start` con los
+    mismos parámetros. Solo contiene la parte DEFINITIVA del resultado: lo que ya no
+    puede cambiar por muchos puntos nuevos que lleguen.
+
+      - raw / filter: filas crudas asentadas (orden temporal) y estado del filtro base
+      - spike_done / spike_keep: posiciones del filtro con decisión anti-spike definitiva
+        y filas que sobrevivieron
+      - stop_from: índice (en la salida del anti-spike) donde se reanuda la detección de paradas
+      - final / seg_dist / seg_dt: posiciones definitivas y sus tramos
+      - summary: acumuladores del resumen sobre `final`
+      - zone_memo: zona por posición y reparto por tramo ya calculados
+    """
+
+    __slots__ = (
+        "sid", "key", "entity_id", "lock", "used",
+        "track", "raw", "watermark", "filter",
+        "spike_done", "spike_keep", "stop_from",
+        "final", "seg_dist", "seg_dt", "summary", "zone_memo",
+        "seq", "cuts",
+    )
+
+    def __init__(self, sid: str, key: Tuple, entity_id: str, start_utc: datetime) -> None:
+        self.sid = sid
+        self.key = key
+        self.entity_id = entity_id
+        self.lock = threading.Lock()
+        self.used = time.monotonic()
+
+        self.track = Track()
+        self.raw = array("l")
+        self.watermark = start_utc          # estados con last_updated < watermark ya están en `raw`
+        self.filter = FilterState()
+
+        self.spike_done = 0
+        self.spike_keep = array("l")
+        self.stop_from = 0
+
+        self.final = array("l")
+        self.seg_dist: List[float] = []
+        self.seg_dt: List[float] = []
+        self.summary: Any = None
+        self.zone_memo: Any = None
+
+        self.seq = 0
+        self.cuts: "OrderedDict[int, int]" = OrderedDict()   # seq -> posiciones definitivas enviadas
+
+    def cursor(self) -> str:
+        return f"{self.sid}.{self.seq}"
+
+    def base_for(self, seq: Optional[int]) -> int:
+        """Posiciones que el cliente que recibió la respuesta `seq` puede conservar."""
+        if seq is None:
+            return 0
+        return self.cuts.get(seq, 0)
+
+    def remember_cut(self) -> None:
+        self.cuts[self.seq] = len(self.final)
+        while len(self.cuts) > INCREMENTAL_MAX_CUTS:
+            self.cuts.popitem(last=False)
+
+
+def parse_cursor(cursor: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+    """'sid.seq' -> (sid, seq); (None, None) si no es válido."""
+    if not cursor:
+        return None, None
+    sid, _, seq = str(cursor).partition(".")
+    try:
+        return sid, int(seq)
+    except ValueError:
+        return None, None
+
+
+class SessionStore:
+    """Sesiones incrementales vivas (LRU + caducidad). Thread-safe."""
+
+    def __init__(self, max_sessions: int = INCREMENTAL_MAX_SESSIONS, ttl_s: float = INCREMENTAL_TTL_S) -> None:
+        self._sessions: "OrderedDict[str, IncrementalSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max = max_sessions
+        self._ttl = ttl_s
+
+    def _expire(self, now: float) -> None:
+        for sid in [sid for sid, s in self._sessions.items() if now - s.used > self._ttl]:
+            del self._sessions[sid]
+
+    def get(self, sid: Optional[str], key: Tuple) -> Optional[IncrementalSession]:
+        """Sesión `sid` si sigue viva y corresponde a la misma consulta (persona, inicio, parámetros)."""
+        if not sid:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(sid)
+            if session is None or session.key != key:
+                return None
+            session.used = now
+            self._sessions.move_to_end(sid)
+            return session
+
+    def create(self, key: Tuple, entity_id: str, start_utc: datetime) -> IncrementalSession:
+        now = time.monotonic()
+        session = IncrementalSession(secrets.token_urlsafe(12), key, entity_id, start_utc)
+        with self._lock:
+            self._expire(now)
+            self._sessions[session.sid] = session
+            while len(self._sessions) > self._max:
+                self._sessions.popitem(last=False)
+        return session
+
+    def drop(self, session: IncrementalSession) -> None:
+        with self._lock:
+            if self._sessions.get(session.sid) is session:
+                del self._sessions[session.sid]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions)}
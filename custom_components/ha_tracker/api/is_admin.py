@@ -4,6 +4,8 @@ import logging
 
 from homeassistant.components.http import HomeAssistantView
 
+from .metrics import instrumented
+
 DOMAIN = __package__.split(".")[-2]
 
 _LOGGER = logging.getLogger(__name__)
@@ -16,6 +18,7 @@ class IsAdminEndpoint(HomeAssistantView):
     name = "api:ha_tracker/is_admin"
     requires_auth = True
 
+    @instrumented("is_admin")
     async def get(self, request):
         """Devuelve si un usuario es administrador"""
         hass_user = request["hass_user"]
@@ -0,0 +1,94 @@
+"""Kernels por tramos (distancia, tiempo, velocidad) con NumPy opcional"""
+
+import math
+
+from typing import List, NamedTuple
+
+try:  # NumPy es opcional: si no está instalado se usa el bucle puro
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+EARTH_RADIUS_M = 6371000.0
+
+# Por debajo de este número de puntos el coste de crear arrays supera al bucle
+NUMPY_MIN_POINTS = 64
+
+USE_NUMPY = np is not None
+
+
+def haversine(lat1, lon1, lat2, lon2) -> float:
+    """Calcula la distancia en metros entre dos puntos geográficos."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlmb = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2.0) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2.0) ** 2
+    )
+    # clamp por estabilidad numérica
+    a = min(1.0, max(0.0, a))
+    return EARTH_RADIUS_M * (2.0 * math.atan2(math.sqrt(a), math.sqrt(1.0 - a)))
+
+
+class Segments(NamedTuple):
+    """Métricas de los tramos consecutivos de una selección (len = puntos - 1)."""
+    dist_m: List[float]
+    dt_s: List[float]
+
+
+def _use_numpy(n: int) -> bool:
+    """
+    Camino NumPy para selecciones de NUMPY_MIN_POINTS o más. Aplica la misma fórmula
+    que haversine, en el mismo orden, pero sin/cos/atan2 de NumPy y de libm pueden
+    diferir en el último bit: casi todas las distancias coinciden bit a bit con el
+    bucle puro y el resto difiere en un ulp (< 1e-15 relativo), no más. Quien
+    necesite resultados idénticos entre instalaciones debe fijar USE_NUMPY = False.
+    """
+    return USE_NUMPY and n >= NUMPY_MIN_POINTS
+
+
+def segment_metrics(track, sel) -> Segments:
+    """Distancia haversine y Δt (s) entre filas consecutivas de `sel`."""
+    n = len(sel)
+    if n < 2:
+        return Segments([], [])
+
+    if _use_numpy(n):
+        idx = np.frombuffer(sel, dtype=np.dtype(sel.typecode)) if hasattr(sel, "typecode") else np.asarray(sel)
+        lat_deg = np.frombuffer(track.lat, dtype=np.float64)[idx]
+        lon_deg = np.frombuffer(track.lon, dtype=np.float64)[idx]
+        ts = np.frombuffer(track.ts, dtype=np.int64)[idx]
+
+        # Diferencias en grados y luego a radianes, como haversine
+        phi = np.radians(lat_deg)
+        a = (
+            np.sin(np.radians(np.diff(lat_deg)) / 2.0) ** 2
+            + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(np.radians(np.diff(lon_deg)) / 2.0) ** 2
+        )
+        a = np.clip(a, 0.0, 1.0)
+        dist = EARTH_RADIUS_M * (2.0 * np.arctan2(np.sqrt(a), np.sqrt(1.0 - a)))
+        dt = np.diff(ts) / 1_000_000
+        return Segments(dist.tolist(), dt.tolist())
+
+    lat_col, lon_col, ts_col = track.lat, track.lon, track.ts
+    dist = []
+    dt = []
+    prev = sel[0]
+    for i in range(1, n):
+        cur = sel[i]
+        dist.append(haversine(lat_col[prev], lon_col[prev], lat_col[cur], lon_col[cur]))
+        dt.append((ts_col[cur] - ts_col[prev]) / 1_000_000)
+        prev = cur
+    return Segments(dist, dt)
+
+
+def segment_speeds(seg: Segments) -> List[float]:
+    """Velocidad media (m/s) de cada tramo; 0.0 si Δt <= 0."""
+    if _use_numpy(len(seg.dist_m)):
+        dist = np.asarray(seg.dist_m)
+        dt = np.asarray(seg.dt_s)
+        out = np.zeros_like(dist)
+        np.divide(dist, dt, out=out, where=dt > 0)
+        return out.tolist()
+    return [d / t if t > 0 else 0.0 for d, t in zip(seg.dist_m, seg.dt_s)]
@@ -0,0 +1,258 @@
+"""Métricas de HA Tracker (peticiones, latencias, tamaños, cachés, cola de Nominatim, etapas) en formato Prometheus"""
+
+import asyncio
+import functools
+import logging
+import math
+import time
+
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from homeassistant.components.http import HomeAssistantView
+
+DOMAIN = __package__.split(".")[-2]
+
+_LOGGER = logging.getLogger(__name__)
+
+METRICS_KEY = "metrics_registry"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRIC_PREFIX = "ha_tracker_"
+
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS_B = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+LabelValues = Tuple[str, ...]
+
+
+# ----------------------------
+# Familias de métricas
+# ----------------------------
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class MetricFamily:
+    """Una métrica con su HELP/TYPE y sus muestras ya calculadas (lo que devuelven los collectors)."""
+
+    __slots__ = ("name", "kind", "help", "samples")
+
+    def __init__(self, name: str, kind: str, help_text: str) -> None:
+        self.name = METRIC_PREFIX + name
+        self.kind = kind
+        self.help = help_text
+        self.samples: List[Tuple[str, Sequence[str], Sequence[str], float]] = []
+
+    def add(self, value: float, suffix: str = "", **labels: Any) -> "MetricFamily":
+        self.samples.append((self.name + suffix, tuple(labels), tuple(str(v) for v in labels.values()), value))
+        return self
+
+    def render(self, out: List[str]) -> None:
+        out.append(f"# HELP {self.name} {_escape(self.help)}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        for name, label_names, label_values, value in self.samples:
+            out.append(f"{name}{_labels(label_names, label_values)} {_number(value)}")
+
+
+class Counter:
+    """Contador con etiquetas (solo se incrementa desde el event loop)."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, labels: LabelValues = (), amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def family(self) -> MetricFamily:
+        fam = MetricFamily(self.name, "counter", self.help)
+        for values, total in self._values.items():
+            fam.add(total, "", **dict(zip(self.labelnames, values)))
+        return fam
+
+
+class Histogram:
+    """Histograma acumulativo con etiquetas (buckets fijos, solo desde el event loop)."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str], buckets: Sequence[float]) -> None:
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # etiquetas -> [cuenta por bucket (+Inf al final), suma, cuenta]
+        self._series: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, labels: LabelValues, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def family(self) -> MetricFamily:
+        fam = MetricFamily(self.name, "histogram", self.help)
+        for values, (counts, total, n) in self._series.items():
+            labels = dict(zip(self.labelnames, values))
+            acc = 0
+            for bound, count in zip(self.buckets, counts):
+                acc += count
+                fam.add(acc, "_bucket", **labels, le=_number(float(bound)))
+            fam.add(n, "_bucket", **labels, le="+Inf")
+            fam.add(total, "_sum", **labels)
+            fam.add(n, "_count", **labels)
+        return fam
+
+
+class MetricsRegistry:
+    """Contadores e histogramas de HA Tracker (uno por instancia de hass, en hass.data)."""
+
+    def __init__(self) -> None:
+        self.requests = Counter(
+            "http_requests_total", "HTTP requests by endpoint, method and status", ("endpoint", "method", "status")
+        )
+        self.latency = Histogram(
+            "http_request_duration_seconds", "Handler time per request", ("endpoint", "method"), LATENCY_BUCKETS_S
+        )
+        self.payload = Histogram(
+            "http_response_bytes", "Response body size (before HTTP compression)", ("endpoint",), SIZE_BUCKETS_B
+        )
+        self.stages = Histogram(
+            "filtered_positions_stage_seconds", "filtered_positions time per stage (see Server-Timing)",
+            ("kind", "stage"), STAGE_BUCKETS_S,
+        )
+
+    def families(self) -> List[MetricFamily]:
+        return [self.requests.family(), self.latency.family(), self.payload.family(), self.stages.family()]
+
+
+def metrics_registry(hass) -> MetricsRegistry:
+    dd = hass.data.setdefault(DOMAIN, {})
+    reg = dd.get(METRICS_KEY)
+    if reg is None:
+        reg = dd[METRICS_KEY] = MetricsRegistry()
+    return reg
+
+
+# ----------------------------
+# Collectors: métricas que se leen del estado de cada módulo al exportar
+# ----------------------------
+_COLLECTORS: List[Callable[[Any], Iterable[MetricFamily]]] = []
+
+
+def collector(fn: Callable[[Any], Iterable[MetricFamily]]) -> Callable[[Any], Iterable[MetricFamily]]:
+    """Registra fn(hass) -> familias; se llama en cada exportación, desde el event loop."""
+    _COLLECTORS.append(fn)
+    return fn
+
+
+def render(hass) -> str:
+    """Texto de exposición: registro + collectors (las familias con el mismo nombre se juntan)."""
+    families = list(metrics_registry(hass).families())
+    for fn in _COLLECTORS:
+        try:
+            families.extend(fn(hass))
+        except Exception:  # un collector roto no tumba la exportación
+            _LOGGER.exception("metrics: collector %s failed", getattr(fn, "__name__", fn))
+
+    merged: Dict[str, MetricFamily] = {}
+    for fam in families:
+        if fam.name in merged:
+            merged[fam.name].samples.extend(fam.samples)
+        else:
+            merged[fam.name] = fam
+    out: List[str] = []
+    for fam in merged.values():
+        if fam.samples:
+            fam.render(out)
+    return "\n".join(out) + "\n"
+
+
+# ----------------------------
+# Instrumentación de endpoints
+# ----------------------------
+def _body_bytes(response: Optional[web.StreamResponse]) -> int:
+    if isinstance(response, web.Response):
+        body = response.body
+        if body is None:
+            return 0
+        if isinstance(body, (bytes, bytearray)):
+            return len(body)
+        return int(getattr(body, "size", None) or 0)
+    if response is not None:
+        return int(response.body_length)   # streaming: ya está todo escrito
+    return 0
+
+
+def instrumented(endpoint: str):
+    """Decorador para los handlers de un HomeAssistantView: cuenta, mide la latencia y el tamaño de la respuesta."""
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(self, request, *args, **kwargs):
+            t0 = time.perf_counter()
+            status = 500
+            response = None
+            try:
+                response = await handler(self, request, *args, **kwargs)
+                status = response.status
+                return response
+            except web.HTTPException as e:
+                status = e.status
+                raise
+            except asyncio.CancelledError:
+                status = 499
+                raise
+            finally:
+                reg = metrics_registry(request.app["hass"])
+                reg.requests.inc((endpoint, request.method, str(status)))
+                reg.latency.observe((endpoint, request.method), time.perf_counter() - t0)
+                if response is not None:
+                    reg.payload.observe((endpoint,), _body_bytes(response))
+
+        return wrapper
+
+    return decorator
+
+
+def observe_stages(hass, kind: str, stages: Dict[str, float]) -> None:
+    """Tiempos (s) por etapa de una petición de filtered_positions (StageTimer.stages)."""
+    hist = metrics_registry(hass).stages
+    for name, seconds in stages.items():
+        hist.observe((kind, name), seconds)
+
+
+class MetricsEndpoint(HomeAssistantView):
+    """Métricas de HA Tracker en formato de exposición de Prometheus (solo admin)"""
+
+    url = "/api/ha_tracker/metrics"
+    name = "api:ha_tracker/metrics"
+    requires_auth = True
+
+    @instrumented("metrics")
+    async def get(self, request):
+        """Texto para un scrape de Prometheus (bearer token de un usuario admin)."""
+        user = request["hass_user"]
+        if user is None or not user.is_admin:
+            return self.json({"error": "Forbidden"}, status_code=403)
+        body = render(request.app["hass"])
+        return web.Response(body=body.encode("utf-8"), headers={"Content-Type": METRICS_CONTENT_TYPE, "Cache-Control": "no-store"})
@@ -9,6 +9,8 @@ from homeassistant.components.recorder.history import (
 )
 from homeassistant.util import dt as dt_util
 
+from .metrics import instrumented
+
 DOMAIN = __package__.split(".")[-2]
 
 _LOGGER = logging.getLogger(__name__)
@@ -58,6 +60,7 @@ class NearestPositionEndpoint(HomeAssistantView):
     name = "api:ha_tracker/nearest_position"
     requires_auth = True
 
+    @instrumented("nearest_position")
     async def get(self, request):
         try:
             hass = request.app["hass"]
@@ -4,6 +4,8 @@ import logging
 
 from homeassistant.components.http import HomeAssistantView
 
+from .metrics import instrumented
+
 DOMAIN = __package__.split(".")[-2]
 
 _LOGGER = logging.getLogger(__name__)
@@ -16,6 +18,7 @@ class PersonsEndpoint(HomeAssistantView):
     name = "api:ha_tracker/persons"
     requires_auth = True
 
+    @instrumented("persons")
     async def get(self, request):
         """Devuelve las personas de Home Assistant (filtra por dominio 'person')"""
 
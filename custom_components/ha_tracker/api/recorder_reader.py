@@ -0,0 +1,177 @@
+"""Lectura directa de las tablas del recorder (states + state_attributes) con solo los campos del track"""
+
+import threading
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+
+from homeassistant.components.recorder.db_schema import StateAttributes, States, StatesMeta
+from homeassistant.components.recorder.util import session_scope
+from homeassistant.util import dt as dt_util
+from homeassistant.util.json import json_loads
+
+from .day_cache import CachedState
+from .track import BATTERY_KEYS, normalize_attributes
+
+SQL_BATCH_ROWS = 2000
+SQL_MAX_BIND_VARS = 900         # ids por IN (...) (SQLite antiguo admite 999)
+ATTRS_MEMO_MAX = 20_000         # blobs de atributos decodificados que se recuerdan entre lecturas
+
+# Atributos que se conservan: los que usan Track/normalize_attributes y el perfil compacto
+LITE_ATTRIBUTES = (
+    "latitude", "longitude", "gps_accuracy", "accuracy",
+    "speed", "speedMps", "velocity",
+) + BATTERY_KEYS
+
+
+def _lite_attributes(shared_attrs) -> Dict[str, Any]:
+    """JSON de state_attributes -> solo LITE_ATTRIBUTES, normalizados (vacío si no se puede leer)."""
+    if not shared_attrs:
+        return {}
+    try:
+        attrs = json_loads(shared_attrs)
+    except ValueError:
+        return {}
+    if not isinstance(attrs, dict):
+        return {}
+    return normalize_attributes({k: attrs[k] for k in LITE_ATTRIBUTES if k in attrs})
+
+
+class AttributesMemo:
+    """
+    attributes_id -> atributos reducidos y normalizados (LRU, thread-safe).
+
+    Un dispositivo parado repite el mismo blob durante horas y el tramo abierto del
+    día se vuelve a leer en cada refresco: cada blob se decodifica y normaliza una
+    sola vez y todas sus filas comparten el mismo dict (de solo lectura). Se valida
+    con el hash de state_attributes por si el recorder reutiliza un id tras purgar.
+    """
+
+    def __init__(self, max_entries: int = ATTRS_MEMO_MAX) -> None:
+        self._items: "OrderedDict[int, Tuple[Optional[int], Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, keys: Dict[int, Optional[int]]) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+        """{attributes_id: hash} -> (encontrados, ids que hay que leer)."""
+        found: Dict[int, Dict[str, Any]] = {}
+        missing: List[int] = []
+        with self._lock:
+            items = self._items
+            for attributes_id, attrs_hash in keys.items():
+                entry = items.get(attributes_id)
+                if entry is not None and entry[0] == attrs_hash:
+                    items.move_to_end(attributes_id)
+                    found[attributes_id] = entry[1]
+                else:
+                    missing.append(attributes_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def store(self, attributes_id: int, attrs_hash: Optional[int], attrs: Dict[str, Any]) -> None:
+        with self._lock:
+            self._items[attributes_id] = (attrs_hash, attrs)
+            self._items.move_to_end(attributes_id)
+            while len(self._items) > self._max:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+def iter_state_batches(
+    hass,
+    entity_ids: List[str],
+    start_utc: datetime,
+    end_utc: datetime,
+    batch_rows: int = SQL_BATCH_ROWS,
+    memo: Optional[AttributesMemo] = None,
+) -> Iterator[List[Tuple[str, CachedState]]]:
+    """
+    Filas de `entity_ids` con start < last_updated < end (mismo criterio que
+    get_significant_states sin estado inicial), en orden temporal y por bloques de
+    `batch_rows`. Cada fila es (entity_id, CachedState) con los atributos reducidos.
+
+    Cada bloque es una consulta completa (paginación por (last_updated_ts, state_id)),
+    sin cursores abiertos entre bloques, y los blobs de atributos se piden aparte solo
+    para los attributes_id que no están en `memo`.
+    Hay que llamarlo desde el executor del recorder.
+    """
+    if memo is None:
+        memo = AttributesMemo()
+
+    base = (
+        select(
+            States.state_id,
+            StatesMeta.entity_id,
+            States.state,
+            States.last_updated_ts,
+            States.last_changed_ts,
+            States.attributes_id,
+            StateAttributes.hash,
+        )
+        .join(StatesMeta, States.metadata_id == StatesMeta.metadata_id)
+        .outerjoin(StateAttributes, States.attributes_id == StateAttributes.attributes_id)
+        .where(
+            StatesMeta.entity_id.in_(list(entity_ids)),
+            States.last_updated_ts > start_utc.timestamp(),
+            States.last_updated_ts < end_utc.timestamp(),
+        )
+        .order_by(States.last_updated_ts, States.state_id)
+        .limit(batch_rows)
+    )
+
+    utc_from_ts = dt_util.utc_from_timestamp
+    after: Optional[Tuple[float, int]] = None
+    with session_scope(hass=hass, read_only=True) as session:
+        while True:
+            stmt = base
+            if after is not None:
+                lu_after, id_after = after
+                stmt = stmt.where(or_(
+                    States.last_updated_ts > lu_after,
+                    and_(States.last_updated_ts == lu_after, States.state_id > id_after),
+                ))
+            rows = session.execute(stmt).all()
+            if not rows:
+                return
+            after = (rows[-1][3], rows[-1][0])
+
+            attrs_by_id, missing = memo.lookup({r[5]: r[6] for r in rows if r[5] is not None})
+            for i in range(0, len(missing), SQL_MAX_BIND_VARS):
+                blobs = session.execute(
+                    select(StateAttributes.attributes_id, StateAttributes.hash, StateAttributes.shared_attrs)
+                    .where(StateAttributes.attributes_id.in_(missing[i:i + SQL_MAX_BIND_VARS]))
+                ).all()
+                for attributes_id, attrs_hash, shared_attrs in blobs:
+                    attrs = _lite_attributes(shared_attrs)
+                    memo.store(attributes_id, attrs_hash, attrs)
+                    attrs_by_id[attributes_id] = attrs
+
+            batch = []
+            for _, entity_id, state, lu_ts, lc_ts, attributes_id, _ in rows:
+                last_updated = utc_from_ts(lu_ts)
+                last_changed = last_updated if lc_ts is None or lc_ts == lu_ts else utc_from_ts(lc_ts)
+                attrs = attrs_by_id.get(attributes_id) or {}
+                batch.append((entity_id, CachedState(entity_id, state, attrs, last_updated, last_changed)))
+            yield batch
+            if len(rows) < batch_rows:
+                return
+
+
+def read_states(
+    hass, entity_ids: List[str], start_utc: datetime, end_utc: datetime, memo: Optional[AttributesMemo] = None
+) -> Dict[str, List[CachedState]]:
+    """iter_state_batches agrupado por entidad (cada lista en orden temporal)."""
+    out: Dict[str, List[CachedState]] = {entity_id: [] for entity_id in entity_ids}
+    for batch in iter_state_batches(hass, entity_ids, start_utc, end_utc, memo=memo):
+        for entity_id, st in batch:
+            out[entity_id].append(st)
+    return out
@@ -1,17 +1,16 @@
 # reverse_geocode.py
 """
 Reverse Geocoding endpoint (Nominatim) with:
-- Persistent cache (HA Store) + optional compaction
+- Persistent cache (HA Store snapshot + append-only journal) + background compaction
 - Grid index + bounding-box prefilter + haversine (prefiltro barato y exacto)
 - Entry cap + TTL prune (con "hot map" para mantener vivas entradas REVISITADAS sin reescribir el JSON grande)
 - Hysteresis cap (cuando supera 10k, baja hasta 8k de una vez)
 - Global rate limit (con pequeño jitter)
-- Coalesced saves (async_delay_save) para reducir I/O
+- Persistencia incremental: cada cambio es una línea del diario (geocode_journal), escrita por lotes
 - Concurrency de-dup por celda
 - Rounding de coordenadas para mejorar hit-rate
 - Nominatim 429 y 5xx (Retry-After) + email opcional
-- Force-flush intervals (cache + hot_map) para no aplazar indefinidamente con tráfico continuo
-- Flush on Home Assistant stop (con try/except)
+- Flush del diario en cada ciclo de mantenimiento (60 s) y al parar Home Assistant (con try/except)
 - (Extras) Métricas rápidas ?metrics=1, robustez en tareas periódicas y Accept-Language fijo del servidor
 - Backpressure: límite de misses simultáneos + modo nowait
 
@@ -47,6 +46,21 @@ Añadidos en esta versión:
 - (Nuevo) AUTO-NOWAIT: si hay backlog y la ETA estimada supera un umbral (p. ej. 2s), respondemos 202 automáticamente
   con `retry_after`/`X-Queue-ETA`/`X-Pending-Misses` arrancando la tarea en background antes de devolver 202.
 - (Nuevo) Backpressure duro: si la cola supera el máximo configurado, respondemos `503 busy` con `retry_after`.
+- (Nuevo) Caché con ids estables e índice por celda (geocode_cache.GeocodeCache): altas y bajas O(1), sin
+  reconstruir el índice al podar/recortar; el recorte por celda borra las entradas sobrantes de la caché.
+- (Nuevo) Desalojo LRU/TTL sin ordenar: cada entrada lleva su instante efectivo (epoch) y la caché se mantiene
+  ordenada con cada alta/hit; caducar, bajar al tope y recortar celdas quitan por el principio. hot_map también
+  va ordenado por instante, así que su poda se para en el primer hit vigente.
+- (Nuevo) Persistencia incremental: altas, hits y bajas se anotan en un diario append-only (geocode_journal) que
+  se escribe por lotes en cada ciclo de mantenimiento; el snapshot completo de los Store solo se reescribe al
+  compactar en background, cuando el diario ya es tan largo como la caché.
+- (Nuevo) Carga diferida: la caché persistida se lee e indexa en el executor tras EVENT_HOMEASSISTANT_STARTED;
+  mientras tanto se atiende en modo degradado (solo misses, sin bloquear) y `cache_ready` lo indica en métricas.
+  Si la carga falla (tras reintentos) no se compacta nunca sobre lo persistido hasta `?reset=cache`.
+- (Nuevo) Lote: `POST /api/ha_tracker/reverse_geocode/batch` resuelve cientos de puntos (paradas, exportaciones)
+  con una sola pasada por la caché bajo el lock; los misses van por el mismo rate limit y coalescing por celda, y
+  los resultados salen en NDJSON (`?stream=1`) según llegan o en un único JSON; lo que no llega en `max_wait` sale
+  como `queued` con `retry_after` y se sigue resolviendo en background.
 """
 from __future__ import annotations
 
@@ -58,21 +72,36 @@ import random
 import re
 import time
 
-from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from email.utils import parsedate_to_datetime
 from math import isfinite
-from typing import Any, DefaultDict, Dict, List, Optional, Tuple, TypedDict
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+from aiohttp import web
 
 from homeassistant.components.http import HomeAssistantView
 from homeassistant.core import CoreState
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
-from homeassistant.helpers.storage import Store
+from homeassistant.helpers.json import json_bytes
+from homeassistant.helpers.storage import STORAGE_DIR, Store
 from homeassistant.const import (
     EVENT_HOMEASSISTANT_STOP,
     EVENT_HOMEASSISTANT_STARTED,
 )
 
+from .geocode_cache import GeocodeCache
+from .geocode_journal import (
+    OP_ADD,
+    OP_CLEAR,
+    OP_CLEAR_HOT,
+    OP_DEL,
+    OP_HOT,
+    GeocodeJournal,
+    entry_key,
+    replay,
+)
+from .metrics import MetricFamily, collector, instrumented
+
 DOMAIN = __package__.split(".")[-2]
 
 # --- Logger / timeouts ---
@@ -85,8 +114,7 @@ LOG_SAMPLE_RATE = 0.1  # 10% logs no críticos
 EXPOSE_HDRS = "Retry-After, Content-Language, X-Queue-ETA, X-Pending-Misses, X-Cache, X-Cache-Dist-M"
 
 # --- Config (defaults) ---
-CACHE_KEY = "reverse_geocode_cache"
-INDEX_KEY = "reverse_geocode_index"
+CACHE_KEY = "reverse_geocode_cache"  # GeocodeCache (entradas + índice por celda)
 CACHE_TTL = timedelta(days=6)
 CACHE_RADIUS_M = 20.0
 MAX_ENTRIES = 10_000
@@ -99,26 +127,18 @@ RL_LAST_TS_KEY = "reverse_geocode_rl_last"
 RL_LAST_MONO_KEY = "reverse_geocode_rl_last_mono"
 RL_MIN_INTERVAL = 1.0  # s
 
-SAVE_DEBOUNCE_ON_CHANGE = 900.0  # s
-
 STORE_VERSION = 1
-STORE_KEY = "ha_tracker_reverse_cache"
+STORE_KEY = "ha_tracker_reverse_cache"       # snapshot de la caché (lista de CacheEntry)
 STORE_HANDLE_KEY = "reverse_geocode_store"
 
-CACHE_DIRTY_KEY = "reverse_geocode_cache_dirty"
-CACHE_LAST_FLUSH_KEY = "reverse_geocode_cache_last_flush"
-HOT_DIRTY_KEY = "reverse_geocode_hot_dirty"
-HOT_LAST_FLUSH_KEY = "reverse_geocode_hot_last_flush"
-
-CACHE_FORCE_FLUSH_INTERVAL = 21_600.0  # 6 h
-HOT_FORCE_FLUSH_INTERVAL = 10_800.0    # 3 h
-
 HOT_MAP_KEY = "hot_map"
-HOT_STORE_KEY = "ha_tracker_reverse_hits"
+HOT_STORE_KEY = "ha_tracker_reverse_hits"    # snapshot del hot_map
 HOT_HANDLE_KEY = "reverse_geocode_hot_store"
-HOT_SAVE_INTERVAL = 7_200.0  # 2 h
 HOT_TTL = CACHE_TTL
 
+JOURNAL_KEY = "reverse_geocode_journal"
+JOURNAL_FILE = STORE_KEY + ".journal"       # dentro de .storage, junto a los snapshots
+
 NOMINATIM_URL = "https://nominatim.openstreetmap.org/reverse"
 NOMINATIM_EMAIL: Optional[str] = "vgcouso@gmail.com"
 
@@ -136,7 +156,7 @@ MET_RL_WAIT_N = "rg_rl_wait_n"
 MET_BP_202 = "rg_bp_202"
 MET_BP_429 = "rg_bp_429"
 
-STARTED_LISTENER_KEY = "reverse_geocode_started_listener"
+STARTED_LISTENER_KEY = "reverse_geocode_started_listener"   # unsub de cada listener mientras no se ha disparado
 STOP_LISTENER_KEY = "reverse_geocode_stop_listener"
 
 NEG_CACHE_KEY = "reverse_geocode_neg_cache"
@@ -148,6 +168,12 @@ DATA_LOCK_KEY = "reverse_geocode_data_lock"
 BACKOFF_UNTIL_KEY = "reverse_geocode_backoff_until"
 
 MAINT_TASK_KEY = "reverse_geocode_maint_task"
+COMPACT_TASK_KEY = "reverse_geocode_compact_task"
+LOAD_TASK_KEY = "reverse_geocode_load_task"
+CACHE_READY_KEY = "reverse_geocode_cache_ready"   # False: modo degradado (caché persistida aún sin cargar)
+LOAD_FAILED_KEY = "reverse_geocode_load_failed"   # True: la carga falló; sin compactar hasta un reset de la caché
+HOT_RESET_KEY = "reverse_geocode_hot_reset"       # True: reset=hot en modo degradado; la carga descarta el hot persistido
+LOAD_RETRY_DELAYS_S = (30, 120, 600)              # reintentos de la carga antes de darla por fallida
 
 # Overrides via options
 CFG_RL_MIN_INTERVAL = "reverse_geocode_cfg_rl_interval"
@@ -167,6 +193,12 @@ MAX_BACKOFF_S = 900  # 15 min
 
 AUTO_NOWAIT_ETA_S = 2.0  # s
 
+# --- Lote (POST .../reverse_geocode/batch) ---
+BATCH_MAX_POINTS = 500
+BATCH_DEFAULT_WAIT_S = 20.0  # s que se espera a los misses antes de devolverlos como "queued"
+BATCH_MAX_WAIT_S = 60.0
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
 
 class CacheEntry(TypedDict, total=False):
     lat: float
@@ -301,88 +333,116 @@ def _compact_nominatim(data: Dict[str, Any]) -> Dict[str, Any]:
     return compact
 
 
-def _effective_ts(entry: Dict[str, Any], hot_map: Dict[str, str]) -> datetime:
+def _epoch(iso: Optional[str], default: Optional[float] = 0.0) -> Optional[float]:
+    """ISO -> epoch (s); lo que no se puede parsear vale `default` (por defecto 1970: caduca lo primero)."""
     try:
-        base_ts = datetime.fromisoformat(entry.get("ts", "1970-01-01T00:00:00+00:00"))
+        ts = datetime.fromisoformat(iso)
     except Exception:
-        base_ts = datetime.fromtimestamp(0, tz=timezone.utc)
-    try:
-        k = _hot_key(float(entry["lat"]), float(entry["lon"]))
-    except Exception:
-        return base_ts
-    hot = hot_map.get(k)
-    if not hot:
-        return base_ts
-    try:
-        hot_ts = datetime.fromisoformat(hot)
-    except Exception:
-        return base_ts
-    return max(base_ts, hot_ts)
-
-
-def _prune_cache(cache: List[Dict[str, Any]], hot_map: Dict[str, str]) -> bool:
-    cutoff = _utcnow() - CACHE_TTL
-    old_len = len(cache)
-    keep = []
-    for it in cache:
-        if _effective_ts(it, hot_map) >= cutoff:
-            keep.append(it)
-    if len(keep) != old_len:
-        cache[:] = keep
-        return True
-    return False
+        return default
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def _effective_epoch(entry: Dict[str, Any], hot_epoch: Dict[str, float]) -> float:
+    """Instante efectivo de una entrada: su alta o el último hit en su punto (hot_map), el más reciente."""
+    base = _epoch(entry.get("ts", "1970-01-01T00:00:00+00:00"))
+    return max(base, hot_epoch.get(_hot_key(entry["lat"], entry["lon"]), 0.0))
+
+
+def _sorted_hot_map(hot_map: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, float]]:
+    """hot_map ordenado del hit más antiguo al más reciente (y sus epochs); descarta valores rotos."""
+    parsed = [(t, k, v) for k, v in hot_map.items() if (t := _epoch(v, None)) is not None]
+    parsed.sort(key=lambda t: t[0])
+    return {k: v for _, k, v in parsed}, {k: t for t, k, _ in parsed}
+
+
+def _touch_hot(hot_map: Dict[str, str], key: str, now_iso: str) -> None:
+    """Hit en `key`: se reinserta al final para que hot_map siga ordenado por instante."""
+    hot_map.pop(key, None)
+    hot_map[key] = now_iso
+
+
+def _journal_removed(journal: GeocodeJournal, removed: List[CacheEntry]) -> bool:
+    for entry in removed:
+        journal.append(OP_DEL, k=entry_key(entry))
+    return bool(removed)
+
+
+def _prune_cache(cache: GeocodeCache, journal: GeocodeJournal) -> bool:
+    return _journal_removed(journal, cache.expire((_utcnow() - CACHE_TTL).timestamp()))
 
 
 def _prune_hot_map(hot_map: Dict[str, str]) -> bool:
+    """Quita los hits caducados; como hot_map va ordenado, se para en el primero vigente."""
     if not hot_map:
         return False
-    cutoff = _utcnow() - HOT_TTL
-    old = len(hot_map)
-    new_map: Dict[str, str] = {}
+    cutoff = (_utcnow() - HOT_TTL).timestamp()
+    expired: List[str] = []
     for k, v in hot_map.items():
-        try:
-            ts = datetime.fromisoformat(v)
-        except Exception:
-            continue
-        if ts >= cutoff:
-            new_map[k] = v
-    if len(new_map) != old:
-        hot_map.clear()
-        hot_map.update(new_map)
-        return True
-    return False
+        if _epoch(v) >= cutoff:
+            break
+        expired.append(k)
+    for k in expired:
+        del hot_map[k]
+    return bool(expired)
 
 
 def _enforce_cap(
-    cache: List[Dict[str, Any]],
-    hot_map: Dict[str, str],
+    cache: GeocodeCache,
+    journal: GeocodeJournal,
     low_water: int = LOW_WATER,
     high_water: int = MAX_ENTRIES,
 ) -> bool:
-    n = len(cache)
-    if n <= high_water:
+    if len(cache) <= high_water:
         return False
+    _journal_removed(journal, cache.evict_to(low_water))
+    return True
+
+
+def _trim_cell(cache: GeocodeCache, cell: Tuple[int, int], per_cell_max: int, journal: GeocodeJournal) -> bool:
+    """Deja en la celda solo sus `per_cell_max` entradas más recientes; el resto se borra de la caché."""
+    return _journal_removed(journal, cache.trim_cell(cell, per_cell_max))
+
+
+async def _flush_journal(hass, dd: Dict[str, Any]) -> None:
+    """Escribe al final del diario los cambios acumulados (no durante una compactación)."""
+    journal: Optional[GeocodeJournal] = dd.get(JOURNAL_KEY)
+    if journal is None or journal.compacting or journal.paused or not journal.pending:
+        return
+    lines = journal.take()
     try:
-        ordered = sorted(cache, key=lambda it: _effective_ts(it, hot_map))
-    except Exception:
-        ordered = list(cache)
-    keep = ordered[-low_water:]
-    if len(keep) != n:
-        cache[:] = keep
-        return True
-    return False
+        await hass.async_add_executor_job(journal.write, lines)
+    except Exception as e:
+        journal.restore(lines)
+        _LOGGER.warning("reverse_geocode: journal write failed: %s", e)
+    else:
+        journal.records += len(lines)
 
 
-def _rebuild_index(cache: List[Dict[str, Any]]) -> DefaultDict[Tuple[int, int], List[int]]:
-    idx: DefaultDict[Tuple[int, int], List[int]] = defaultdict(list)
-    for i, it in enumerate(cache):
+async def _compact_journal(hass, dd: Dict[str, Any]) -> None:
+    """Snapshot completo en los Store y diario vacío; los cambios que llegan mientras tanto esperan en memoria."""
+    journal: GeocodeJournal = dd[JOURNAL_KEY]
+    if journal.compacting or not dd.get(CACHE_READY_KEY):
+        return  # sin la caché persistida cargada, el snapshot la borraría
+    journal.compacting = True
+    try:
+        async with dd[DATA_LOCK_KEY]:
+            snapshot = dd[CACHE_KEY].to_list()
+            hot_snapshot = dict(dd[HOT_MAP_KEY])
+            lines = journal.take()  # ya incluidas en el snapshot
         try:
-            lat = float(it["lat"])
-            lon = float(it["lon"])
-        except Exception:
-            continue
-        idx[_cell_of(lat, lon)].append(i)
-    return idx
+            await dd[STORE_HANDLE_KEY].async_save(snapshot)
+            await dd[HOT_HANDLE_KEY].async_save(hot_snapshot)
+            await hass.async_add_executor_job(journal.truncate)
+        except Exception as e:
+            journal.restore(lines)
+            _LOGGER.warning("reverse_geocode: journal compaction failed: %s", e)
+            return
+        journal.records = 0
+        journal.compact_requested = False
+    finally:
+        journal.compacting = False
 
 
 # --- Negative cache, ETA, flags y errores ---
@@ -408,7 +468,7 @@ def _parse_zoom(qs) -> Optional[int]:
     z = qs.get("zoom")
     try:
         zi = int(z) if z is not None else None
-    except ValueError:
+    except (TypeError, ValueError):
         return None
     return zi if zi is not None and 10 <= zi <= 18 else None
 
@@ -503,6 +563,51 @@ async def _rate_limit_wait(dd: Dict[str, Any]) -> None:
     dd[MET_RL_WAIT_N] = dd.get(MET_RL_WAIT_N, 0) + 1
 
 
+@collector
+def _collect_metrics(hass) -> List[MetricFamily]:
+    """Caché, cola de Nominatim, backoff y backpressure para /api/ha_tracker/metrics."""
+    dd = hass.data.get(DOMAIN, {})
+    if STORE_HANDLE_KEY not in dd:
+        return []
+    hits, miss = dd.get(MET_HITS, 0), dd.get(MET_MISS, 0)
+    eta, backlog_n = _queue_eta(
+        dd.get(INFLIGHT_KEY, {}),
+        dd.get(RL_LAST_MONO_KEY, 0.0),
+        float(dd.get(CFG_RL_MIN_INTERVAL, RL_MIN_INTERVAL)),
+    )
+    backoff = max(0.0, (dd.get(BACKOFF_UNTIL_KEY, _utcnow()) - _utcnow()).total_seconds())
+    journal: Optional[GeocodeJournal] = dd.get(JOURNAL_KEY)
+    return [
+        MetricFamily("cache_hits_total", "counter", "Cache hits by cache").add(hits, cache="reverse_geocode"),
+        MetricFamily("cache_misses_total", "counter", "Cache misses by cache").add(miss, cache="reverse_geocode"),
+        MetricFamily("cache_hit_ratio", "gauge", "hits / (hits + misses) since start, by cache")
+        .add(hits / max(1, hits + miss), cache="reverse_geocode"),
+        MetricFamily("cache_entries", "gauge", "Entries held in memory, by cache")
+        .add(len(dd.get(CACHE_KEY, [])), cache="reverse_geocode")
+        .add(len(dd.get(HOT_MAP_KEY, {})), cache="reverse_geocode_hot")
+        .add(len(dd.get(NEG_CACHE_KEY, {})), cache="reverse_geocode_negative"),
+        MetricFamily("reverse_geocode_hit_distance_meters", "summary", "Distance from the query to the cached hit")
+        .add(dd.get(MET_HIT_DIST_SUM, 0.0), "_sum")
+        .add(dd.get(MET_HIT_DIST_N, 0), "_count"),
+        MetricFamily("nominatim_queue_depth", "gauge", "Nominatim lookups queued or in flight").add(backlog_n),
+        MetricFamily("nominatim_queue_eta_seconds", "gauge", "Estimated time to drain the Nominatim queue").add(eta),
+        MetricFamily("nominatim_rate_limit_wait_seconds", "summary", "Time spent waiting for the Nominatim rate limiter")
+        .add(dd.get(MET_RL_WAIT_SUM, 0.0), "_sum")
+        .add(dd.get(MET_RL_WAIT_N, 0), "_count"),
+        MetricFamily("nominatim_backoff_seconds", "gauge", "Remaining Nominatim backoff").add(backoff),
+        MetricFamily("reverse_geocode_backpressure_total", "counter", "Misses answered with 202/429 instead of queueing")
+        .add(dd.get(MET_BP_202, 0), status="202")
+        .add(dd.get(MET_BP_429, 0), status="429"),
+        MetricFamily("reverse_geocode_cache_ready", "gauge", "1 once the persisted cache is loaded (0: degraded, misses only)")
+        .add(1 if dd.get(CACHE_READY_KEY) else 0),
+        MetricFamily("reverse_geocode_cache_load_failed", "gauge", "1 if the persisted cache could not be loaded (reset=cache discards it)")
+        .add(1 if dd.get(LOAD_FAILED_KEY) else 0),
+        MetricFamily("reverse_geocode_journal_records", "gauge", "Cache journal records since the last snapshot")
+        .add(journal.records if journal else 0, state="written")
+        .add(journal.pending if journal else 0, state="pending"),
+    ]
+
+
 def _get_only_admin(hass, dd: Dict[str, Any]) -> bool:
     if "only_admin" in dd:
         return bool(dd["only_admin"])
@@ -569,29 +674,18 @@ async def _ensure_structs(hass) -> None:
     if HOT_HANDLE_KEY not in dd:
         dd[HOT_HANDLE_KEY] = Store(hass, STORE_VERSION, HOT_STORE_KEY)
 
-    store: Store = dd[STORE_HANDLE_KEY]
-    hot_store: Store = dd[HOT_HANDLE_KEY]
+    if JOURNAL_KEY not in dd:
+        dd[JOURNAL_KEY] = GeocodeJournal(hass.config.path(STORAGE_DIR, JOURNAL_FILE))
+    journal: GeocodeJournal = dd[JOURNAL_KEY]
 
     if CACHE_KEY not in dd:
-        saved: List[CacheEntry] | None = await store.async_load()
-        cache: List[CacheEntry] = saved or []
-
-        migrated = False
-        for it in cache:
-            try:
-                if "lang_primary" not in it:
-                    it["lang_primary"] = _primary_of(it.get("lang", "en"))
-                    migrated = True
-                if "lang_simple" not in it:
-                    it["lang_simple"] = ((it.get("lang") or "").split(",", 1)[0] or "en").lower()
-                    migrated = True
-            except Exception:
-                it["lang_primary"] = it.get("lang_primary") or "en"
-                it["lang_simple"] = (it.get("lang_simple") or "en").lower()
-                migrated = True
-
-        dd[CACHE_KEY] = cache
-        dd[INDEX_KEY] = _rebuild_index(cache)  # type: ignore[arg-type]
+        # Modo degradado hasta que _async_load_cache termine: caché vacía (solo misses) que después
+        # se fusiona con la persistida; el diario acumula sin escribir para no mezclarse con la carga.
+        dd[CACHE_KEY] = GeocodeCache()
+        dd[HOT_MAP_KEY] = {}
+        dd[CACHE_READY_KEY] = False
+        dd[HOT_RESET_KEY] = False
+        journal.paused = True
         dd.setdefault(INFLIGHT_KEY, {})
         dd.setdefault(MET_HITS, 0)
         dd.setdefault(MET_MISS, 0)
@@ -601,38 +695,16 @@ async def _ensure_structs(hass) -> None:
         dd.setdefault(MET_RL_WAIT_N, 0)
         dd.setdefault(MET_BP_202, 0)
         dd.setdefault(MET_BP_429, 0)
-        dd.setdefault(CACHE_DIRTY_KEY, migrated)
-        dd.setdefault(CACHE_LAST_FLUSH_KEY, _utcnow())
-        if migrated:
-            store.async_delay_save(lambda: cache, SAVE_DEBOUNCE_ON_CHANGE)
-
-    if HOT_MAP_KEY not in dd:
-        hot_saved: Dict[str, str] | None = await hot_store.async_load()
-        dd[HOT_MAP_KEY] = hot_saved or {}
-        dd.setdefault(HOT_DIRTY_KEY, False)
-        dd.setdefault(HOT_LAST_FLUSH_KEY, _utcnow())
-        if _prune_hot_map(dd[HOT_MAP_KEY]):
-            dd[HOT_DIRTY_KEY] = True
-            hot_store.async_delay_save(lambda: dd[HOT_MAP_KEY], HOT_SAVE_INTERVAL)
 
     dd.setdefault(NEG_CACHE_KEY, {})
     dd.setdefault(BACKOFF_UNTIL_KEY, datetime.fromtimestamp(0, tz=timezone.utc))
     _get_only_admin(hass, dd)
     _load_cfg_overrides(hass, dd)
 
-    try:
-        cache: List[CacheEntry] = dd[CACHE_KEY]
-        index: DefaultDict[Tuple[int, int], List[int]] = dd[INDEX_KEY]
-        hot_map: Dict[str, str] = dd[HOT_MAP_KEY]
-        per_cell_max = int(dd.get(CFG_PER_CELL_MAX, PER_CELL_MAX))
-        for k, lst in list(index.items()):
-            if len(lst) > per_cell_max:
-                lst.sort(key=lambda i: _effective_ts(cache[i], hot_map))
-                index[k] = lst[-per_cell_max:]
-    except Exception:
-        pass
-
-    async def _start_periodic_maintenance(_event=None):
+    async def _start_background(_event=None):
+        dd.pop(STARTED_LISTENER_KEY, None)
+        if LOAD_TASK_KEY not in dd:
+            dd[LOAD_TASK_KEY] = _create_task(hass, _async_load_cache(hass), "rg_cache_load")
         if MAINT_TASK_KEY in dd:
             return
 
@@ -641,22 +713,11 @@ async def _ensure_structs(hass) -> None:
                 while True:
                     await asyncio.sleep(60)
                     now = _utcnow()
-                    if dd.get(CACHE_DIRTY_KEY) and (now - dd.get(CACHE_LAST_FLUSH_KEY, now)).total_seconds() >= CACHE_FORCE_FLUSH_INTERVAL:
-                        try:
-                            await store.async_save(dd[CACHE_KEY])
-                        except Exception:
-                            pass
-                        else:
-                            dd[CACHE_LAST_FLUSH_KEY] = _utcnow()
-                            dd[CACHE_DIRTY_KEY] = False
-                    if dd.get(HOT_DIRTY_KEY) and (now - dd.get(HOT_LAST_FLUSH_KEY, now)).total_seconds() >= HOT_FORCE_FLUSH_INTERVAL:
-                        try:
-                            await hot_store.async_save(dd[HOT_MAP_KEY])
-                        except Exception:
-                            pass
-                        else:
-                            dd[HOT_LAST_FLUSH_KEY] = _utcnow()
-                            dd[HOT_DIRTY_KEY] = False
+                    await _flush_journal(hass, dd)
+                    if journal.needs_compaction(len(dd[CACHE_KEY])):
+                        # en su propia tarea: cancelar el bucle no la corta a medias (ver _async_shutdown)
+                        dd[COMPACT_TASK_KEY] = _create_task(hass, _compact_journal(hass, dd), "rg_compact")
+                        await asyncio.shield(dd[COMPACT_TASK_KEY])
                     try:
                         neg: Dict[Tuple[int, int], datetime] = dd.get(NEG_CACHE_KEY, {})
                         for k, exp in list(neg.items()):
@@ -670,91 +731,687 @@ async def _ensure_structs(hass) -> None:
         dd[MAINT_TASK_KEY] = _create_task(hass, _periodic_maint(), "rg_periodic_maint")
 
     if hass.state == CoreState.running:
-        await _start_periodic_maintenance()
+        await _start_background()
     else:
         if not dd.get(STARTED_LISTENER_KEY):
-            hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STARTED, _start_periodic_maintenance)
-            dd[STARTED_LISTENER_KEY] = True
+            dd[STARTED_LISTENER_KEY] = hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STARTED, _start_background)
 
     async def _on_stop(event):
-        task = dd.get(MAINT_TASK_KEY)
-        if task:
+        dd.pop(STOP_LISTENER_KEY, None)
+        await _async_shutdown(hass, dd)
+
+    if not dd.get(STOP_LISTENER_KEY):
+        dd[STOP_LISTENER_KEY] = hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _on_stop)
+
+
+async def _async_shutdown(hass, dd: Dict[str, Any]) -> None:
+    """
+    Al parar Home Assistant o descargar la entrada: para el mantenimiento, la carga y los
+    fetch en curso, deja terminar una compactación empezada y escribe lo pendiente del
+    diario. Tras una descarga (recarga por cambio de opciones) no puede quedar nada de
+    esta instancia escribiendo en el mismo fichero que la nueva.
+    """
+    for key in (MAINT_TASK_KEY, LOAD_TASK_KEY):
+        task = dd.get(key)
+        if task and not task.done():
             task.cancel()
+    for task in list(dd.get(INFLIGHT_KEY, {}).values()):
+        if not task.done():
+            task.cancel()
+    compact = dd.get(COMPACT_TASK_KEY)
+    if compact is not None and not compact.done():
         try:
-            await store.async_save(dd[CACHE_KEY])
+            await compact
         except Exception:
             pass
+    journal: Optional[GeocodeJournal] = dd.get(JOURNAL_KEY)
+    if journal is not None:
+        # Sin carga en curso, lo atendido en modo degradado se puede anotar tal cual
+        journal.paused = False
+        await _flush_journal(hass, dd)
+
+
+def _request_lang(hass, raw_lang: Optional[str]) -> Tuple[str, str, str, str]:
+    """(Accept-Language, accept-language para Nominatim, idioma canónico, idioma simple en minúsculas)."""
+    server_lang = getattr(hass.config, "language", None) or "en"
+    norm_lang = (raw_lang or "").strip().replace("_", "-")
+    client_lang = norm_lang if (norm_lang and _LANG_RE.match(norm_lang)) else None
+
+    accept_lang, accept_lang_param = _build_accept_lang(client_lang or server_lang)
+    token = accept_lang_param.split(",", 1)[0]
+    return accept_lang, accept_lang_param, _canon_bcp47(token), token.lower()
+
+
+def _lookup_cached(
+    cache: GeocodeCache,
+    lat: float,
+    lon: float,
+    lang_simple: str,
+    accept_lang_param: str,
+    lang_strict: bool,
+) -> Tuple[Optional[CacheEntry], bool]:
+    """Hit en el idioma pedido o, si no es estricto, en el primario o en cualquiera -> (entrada, fallback). Bajo DATA_LOCK_KEY."""
+    hit = _find_cached_with_index(cache, lat, lon, lang_simple)
+    if hit or lang_strict:
+        return hit, False
+    hit = _find_cached_with_index_primary(cache, lat, lon, _primary_of(accept_lang_param))
+    if not hit:
+        hit = _find_cached_with_index(cache, lat, lon, lang_simple=None)
+    return hit, bool(hit)
+
+
+def _count_hit(dd: Dict[str, Any], hit: CacheEntry, lat: float, lon: float) -> Optional[float]:
+    """Métricas de un hit; devuelve la distancia (m) a la entrada."""
+    dd[MET_HITS] = dd.get(MET_HITS, 0) + 1
+    hd: Optional[float] = None
+    try:
+        hd = _haversine_m(lat, lon, float(hit["lat"]), float(hit["lon"]))
+        dd[MET_HIT_DIST_SUM] = dd.get(MET_HIT_DIST_SUM, 0.0) + float(hd)
+        dd[MET_HIT_DIST_N] = dd.get(MET_HIT_DIST_N, 0) + 1
+    except Exception:
+        pass
+    return hd
+
+
+def _touch_hit(
+    cache: GeocodeCache,
+    hot_map: Dict[str, str],
+    journal: GeocodeJournal,
+    hit: CacheEntry,
+    now: datetime,
+) -> str:
+    """Hit en el punto de `hit`: hot_map, orden LRU de la caché y diario. Bajo DATA_LOCK_KEY; devuelve la hot key."""
+    now_iso = now.isoformat()
+    hot_key = _hot_key(hit["lat"], hit["lon"])
+    _touch_hot(hot_map, hot_key, now_iso)
+    cache.touch_where(
+        _cell_of(hit["lat"], hit["lon"]),
+        lambda it: _hot_key(it["lat"], it["lon"]) == hot_key,
+        now.timestamp(),
+    )
+    journal.append(OP_HOT, k=hot_key, t=now_iso)
+    return hot_key
+
+
+def _hit_payload(
+    hit: CacheEntry,
+    lat: float,
+    lon: float,
+    lat_q: float,
+    lon_q: float,
+    accept_lang_param: str,
+    fallback_used: bool,
+    hd: Optional[float],
+) -> Dict[str, Any]:
+    payload = {
+        "lat": lat,
+        "lon": lon,
+        "query_lat": lat_q,
+        "query_lon": lon_q,
+        "address": hit.get("address"),
+        "source": "cache_lang_fallback" if fallback_used else "cache",
+        "cached_at": hit.get("ts"),
+        "lang": hit.get("lang", accept_lang_param),
+        "source_lang": hit.get("lang", accept_lang_param),
+        "hit_distance_m": round(hd, 3) if hd is not None else None,
+    }
+    if fallback_used and hit.get("lang"):
+        payload["lang_cached"] = hit["lang"]
+    return payload
+
+
+def _spawn_fetch(hass, dd: Dict[str, Any], key: Tuple[int, int], coro) -> asyncio.Task:
+    """Arranca el fetch de una celda y lo registra en INFLIGHT_KEY (se quita solo al terminar). Bajo DATA_LOCK_KEY."""
+    inflight: Dict[Any, asyncio.Task] = dd.setdefault(INFLIGHT_KEY, {})
+    data_lock: asyncio.Lock = dd[DATA_LOCK_KEY]
+    task = _create_task(hass, coro, f"rg_fetch_{key[0]}_{key[1]}_any")
+    inflight[key] = task
+
+    # cleanup automático por si alguien no alcanza el finally
+    def _cleanup(_t, k=key, tsk=task):
+        async def _rm():
+            async with data_lock:
+                if inflight.get(k) is tsk:
+                    inflight.pop(k, None)
+        _create_task(hass, _rm(), "rg_inflight_cleanup")
+    task.add_done_callback(_cleanup)
+    return task
+
+
+async def _fetch_and_cache(
+    hass,
+    dd: Dict[str, Any],
+    lat: float,
+    lon: float,
+    lat_q: float,
+    lon_q: float,
+    zoom_override: Optional[int],
+    accept_lang: str,
+    accept_lang_param: str,
+    param_lang_simple: str,
+    param_lang_simple_lc: str,
+) -> Dict[str, Any]:
+    """Un miss: rate limit, Nominatim y alta en la caché. Devuelve el payload o _err(...); corre como tarea de INFLIGHT_KEY."""
+    cache: GeocodeCache = dd[CACHE_KEY]
+    journal: GeocodeJournal = dd[JOURNAL_KEY]
+    neg_cache: Dict[Tuple[int, int], datetime] = dd[NEG_CACHE_KEY]
+    data_lock: asyncio.Lock = dd[DATA_LOCK_KEY]
+    cell_key = _cell_of(lat, lon)
+
+    await _rate_limit_wait(dd)
+    dd[RL_LAST_TS_KEY] = _utcnow()
+
+    session = async_get_clientsession(hass)
+    params = {
+        "format": "json",
+        "lat": f"{lat_q:.8f}",
+        "lon": f"{lon_q:.8f}",
+        "zoom": str(zoom_override or 18),
+        "addressdetails": "1",
+        "accept-language": param_lang_simple,
+    }
+    nom_email = dd.get(CFG_NOM_EMAIL, NOMINATIM_EMAIL)
+    if nom_email and "@" not in nom_email:
+        nom_email = None
+    if nom_email:
+        params["email"] = nom_email
+    headers = {
+        "User-Agent": f"HA-Tracker/1.0 ({nom_email or 'no-contact'})",
+        "Accept-Language": accept_lang,
+        "Accept": "application/json",
+    }
+    try:
+        external_url = getattr(getattr(hass, "config", None), "external_url", None)
+        if external_url:
+            headers["Referer"] = external_url
+    except Exception:
+        pass
+
+    raw: Any = None
+    try:
+        async with session.get(NOMINATIM_URL, params=params, headers=headers, timeout=NOMINATIM_TIMEOUT) as resp:
+            ctype = resp.headers.get("Content-Type", "")
+            charset = resp.charset or "utf-8"
+
+            if resp.status == 429:
+                ra_hdr = resp.headers.get("Retry-After")
+                ttl_secs = int(NEG_CACHE_TTL)
+                if ra_hdr:
+                    try:
+                        ttl_secs = int(ra_hdr)
+                    except ValueError:
+                        try:
+                            ra_dt = parsedate_to_datetime(ra_hdr)
+                            ttl_secs = max(1, int((ra_dt - _utcnow()).total_seconds()))
+                        except Exception:
+                            ttl_secs = int(NEG_CACHE_TTL)
+                backoff_secs = min(int(max(ttl_secs, int(NEG_CACHE_TTL)) * random.uniform(0.9, 1.1)), MAX_BACKOFF_S)
+                async with data_lock:
+                    _neg_set_for(neg_cache, cell_key, backoff_secs)
+                    dd[BACKOFF_UNTIL_KEY] = _utcnow() + timedelta(seconds=backoff_secs)
+                return _err(429, "rate_limited", backoff_secs)
+
+            if resp.status != 200:
+                ra_hdr = resp.headers.get("Retry-After")
+                retry_after = None
+                if ra_hdr:
+                    try:
+                        retry_after = int(ra_hdr)
+                    except ValueError:
+                        try:
+                            ra_dt = parsedate_to_datetime(ra_hdr)
+                            retry_after = max(1, int((ra_dt - _utcnow()).total_seconds()))
+                        except Exception:
+                            retry_after = None
+
+                if 500 <= resp.status <= 599:
+                    async with data_lock:
+                        _neg_set_for(neg_cache, cell_key, int(retry_after or NEG_CACHE_TTL))
+                        secs = int(retry_after or NEG_CACHE_TTL)
+                        dd[BACKOFF_UNTIL_KEY] = _utcnow() + timedelta(seconds=min(secs, MAX_BACKOFF_S))
+                    return _err(503, "upstream_unavailable", retry_after)
+                else:
+                    async with data_lock:
+                        _neg_set_for(neg_cache, cell_key, int(retry_after or NEG_CACHE_TTL))
+                    return _err(502, f"upstream_http_{resp.status}", retry_after)
+
+            if resp.content_length and resp.content_length > NOMINATIM_MAX_BYTES:
+                _LOGGER.warning("Nominatim payload too large: %s bytes", resp.content_length)
+                async with data_lock:
+                    _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
+                return _err(502, "payload_too_large")
+
+            if "application/json" not in ctype:
+                raw_preview = await resp.content.read(300)
+                text_preview = raw_preview.decode(charset, errors="ignore").strip()
+                if random.random() < LOG_SAMPLE_RATE:
+                    _LOGGER.warning("Nominatim non-JSON 200: Content-Type=%s preview=%r", ctype, text_preview)
+                async with data_lock:
+                    _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
+                return _err(502, "invalid_content_type")
+
+            raw_bytes = await resp.content.read(NOMINATIM_MAX_BYTES + 1)
+            if len(raw_bytes) > NOMINATIM_MAX_BYTES:
+                _LOGGER.warning("Nominatim payload exceeded max bytes: > %s", NOMINATIM_MAX_BYTES)
+                async with data_lock:
+                    _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
+                return _err(502, "payload_too_large")
+
+            try:
+                raw = json.loads(raw_bytes.decode(charset, errors="strict"))
+            except Exception as e:
+                if random.random() < LOG_SAMPLE_RATE:
+                    _LOGGER.warning("Nominatim invalid JSON: %s", e)
+                async with data_lock:
+                    _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
+                return _err(502, "invalid_json_from_nominatim")
+
+    except asyncio.TimeoutError:
+        async with data_lock:
+            _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
+        return _err(504, "nominatim_timeout")
+    except Exception:
+        async with data_lock:
+            _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
+        return _err(502, "nominatim_error")
+
+    if not isinstance(raw, dict):
+        async with data_lock:
+            _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
+        return _err(502, "invalid_json_from_nominatim")
+
+    if "error" in raw:
         try:
-            await hot_store.async_save(dd[HOT_MAP_KEY])
+            _LOGGER.warning("Nominatim returned error: %r", raw.get("error"))
         except Exception:
             pass
+        async with data_lock:
+            _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
+        return _err(502, "nominatim_error")
 
-    if not dd.get(STOP_LISTENER_KEY):
-        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _on_stop)
-        dd[STOP_LISTENER_KEY] = True
+    data = _compact_nominatim(raw)
+
+    addr = data.get("address") if isinstance(data, dict) else None
+    if not addr:
+        short_ttl = 30
+        async with data_lock:
+            _neg_set_for(neg_cache, cell_key, short_ttl)
+        return {
+            "lat": lat, "lon": lon,
+            "query_lat": lat_q, "query_lon": lon_q,
+            "address": data, "source": "nominatim",
+            "cached": False, "cacheable": False,
+            "lang": accept_lang_param,
+        }
+
+    now = _utcnow()
+    ts = now.isoformat()
+    entry: CacheEntry = {
+        "lat": lat, "lon": lon, "address": data, "ts": ts,
+        "lang": accept_lang_param, "lang_hdr": accept_lang,
+        "lang_primary": _primary_of(accept_lang_param),
+        "lang_simple": param_lang_simple_lc,
+    }
+
+    async with data_lock:
+        cache.add(entry, cell_key, now.timestamp())
+        journal.append(OP_ADD, e=entry)
+        _trim_cell(cache, cell_key, int(dd.get(CFG_PER_CELL_MAX, PER_CELL_MAX)), journal)
+        _enforce_cap(cache, journal)
+        neg_cache.pop(cell_key, None)
+        dd[BACKOFF_UNTIL_KEY] = datetime.fromtimestamp(0, tz=timezone.utc)
+
+    return {
+        "lat": lat, "lon": lon,
+        "query_lat": lat_q, "query_lon": lon_q,
+        "address": data, "source": "nominatim",
+        "cached_at": ts, "lang": accept_lang_param,
+        "source_lang": accept_lang_param,
+    }
+
+
+def _build_cache(
+    saved: Optional[List[CacheEntry]],
+    hot_saved: Optional[Dict[str, str]],
+    records: List[Dict[str, Any]],
+    per_cell_max: int,
+) -> Tuple[GeocodeCache, Dict[str, str], List[CacheEntry], bool]:
+    """
+    Snapshots + diario -> (caché indexada, hot_map ordenado, entradas recortadas por celda, migrated).
+    No toca hass ni hass.data: se ejecuta en el executor.
+    """
+    migrated = False
+    entries: Dict[str, CacheEntry] = {}
+    for it in saved or []:
+        try:
+            if "lang_primary" not in it:
+                it["lang_primary"] = _primary_of(it.get("lang", "en"))
+                migrated = True
+            if "lang_simple" not in it:
+                it["lang_simple"] = ((it.get("lang") or "").split(",", 1)[0] or "en").lower()
+                migrated = True
+        except Exception:
+            it["lang_primary"] = it.get("lang_primary") or "en"
+            it["lang_simple"] = (it.get("lang_simple") or "en").lower()
+            migrated = True
+        try:
+            it["lat"] = float(it["lat"])
+            it["lon"] = float(it["lon"])
+        except Exception:
+            migrated = True  # sin coordenadas no se puede indexar: se descarta
+            continue
+        entries.setdefault(entry_key(it), it)
+    hot_raw: Dict[str, str] = dict(hot_saved or {})
+    replay(records, entries, hot_raw)
+
+    # hot_map primero: el orden de la caché depende de los últimos hits.
+    # Los hits caducados se podan aquí sin anotarlos: al repetir el diario se vuelven a podar.
+    hot_map, hot_epoch = _sorted_hot_map(hot_raw)
+    _prune_hot_map(hot_map)
+
+    # Una sola ordenación al cargar; después el orden LRU se mantiene con cada alta/hit
+    cache = GeocodeCache()
+    for ts, it in sorted(((_effective_epoch(it, hot_epoch), it) for it in entries.values()), key=lambda t: t[0]):
+        cache.add(it, _cell_of(it["lat"], it["lon"]), ts)
+
+    # Recorte por celda de lo recién cargado (después, cada alta recorta solo su celda)
+    trimmed: List[CacheEntry] = []
+    for cell in cache.cells():
+        trimmed.extend(cache.trim_cell(cell, per_cell_max))
+    return cache, hot_map, trimmed, migrated
+
+
+async def _async_load_cache(hass) -> None:
+    """
+    Carga en background (tras EVENT_HOMEASSISTANT_STARTED) de la caché persistida: lectura e
+    índice fuera del loop; después, en el loop y bajo DATA_LOCK_KEY, fusión con lo atendido
+    en modo degradado y fin del modo degradado.
+    """
+    dd = hass.data[DOMAIN]
+    journal: GeocodeJournal = dd[JOURNAL_KEY]
+    t0 = time.monotonic()
+    for attempt, delay in enumerate((0,) + LOAD_RETRY_DELAYS_S):
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            saved: List[CacheEntry] | None = await dd[STORE_HANDLE_KEY].async_load()
+            hot_saved: Dict[str, str] | None = await dd[HOT_HANDLE_KEY].async_load()
+            records = await hass.async_add_executor_job(journal.read)
+            loaded, hot_loaded, trimmed, migrated = await hass.async_add_executor_job(
+                _build_cache, saved, hot_saved, records, int(dd.get(CFG_PER_CELL_MAX, PER_CELL_MAX))
+            )
+            break
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _LOGGER.exception("reverse_geocode: cache load failed (attempt %d)", attempt + 1)
+    else:
+        # Se sigue en modo degradado: el diario vuelve a escribirse (solo añade, lo persistido
+        # sigue intacto para el próximo arranque) pero sin compactar, que lo sobrescribiría.
+        # ?reset=cache descarta lo persistido y sale de este estado.
+        _LOGGER.error("reverse_geocode: persisted cache unreadable, continuing without it (reset=cache discards it)")
+        dd[LOAD_FAILED_KEY] = True
+        journal.paused = False
+        return
+
+    async with dd[DATA_LOCK_KEY]:
+        cache: GeocodeCache = dd[CACHE_KEY]
+        hot_map: Dict[str, str] = dd[HOT_MAP_KEY]
+        if dd.get(HOT_RESET_KEY):
+            # reset=hot durante la carga: los hits persistidos también se descartan
+            hot_loaded = {}
+            loaded.retime(lambda it: _epoch(it.get("ts")))
+            dd[HOT_RESET_KEY] = False
+        # Mismos objetos (los handlers en curso tienen referencias): lo cargado va delante
+        cache.merge_older(loaded)
+        recent_hot = list(hot_map.items())
+        hot_map.clear()
+        hot_map.update(hot_loaded)
+        for key, iso in recent_hot:
+            _touch_hot(hot_map, key, iso)
+            lat_s, lon_s = key.split(",", 1)
+            cache.touch_where(
+                _cell_of(float(lat_s), float(lon_s)),
+                lambda it, key=key: _hot_key(it["lat"], it["lon"]) == key,
+                _epoch(iso),
+            )
+        journal.records = len(records)
+        _journal_removed(journal, trimmed)
+        if migrated:
+            journal.compact_requested = True
+        journal.paused = False
+        dd[CACHE_READY_KEY] = True
+
+    _LOGGER.debug(
+        "reverse_geocode: cache loaded in %.2fs (%d entries, %d journal records)",
+        time.monotonic() - t0, len(cache), len(records),
+    )
+
+
+async def _discard_load(dd: Dict[str, Any]) -> None:
+    """Antes de vaciar la caché: cancela la carga pendiente (o sus reintentos) y sale del modo degradado/fallido."""
+    task = dd.get(LOAD_TASK_KEY)
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    dd[JOURNAL_KEY].paused = False
+    dd[LOAD_FAILED_KEY] = False
+    dd[CACHE_READY_KEY] = True
+    dd[HOT_RESET_KEY] = False
+
+
+def _parse_point(raw: Any) -> Optional[Tuple[float, float]]:
+    """[lat, lon] o {"lat": ..., "lon": ...} (números o cadenas) -> (lat, lon) finitos y en rango, o None."""
+    if isinstance(raw, dict):
+        raw = (raw.get("lat"), raw.get("lon"))
+    if not isinstance(raw, (list, tuple)) or len(raw) != 2:
+        return None
+    try:
+        lat, lon = (_parse_float_field(v) if isinstance(v, str) else float(v) for v in raw)
+    except (TypeError, ValueError):
+        return None
+    if not (isfinite(lat) and isfinite(lon)):
+        return None
+    if not (-90.0 <= lat <= 90.0) or not (-180.0 <= lon <= 180.0):
+        return None
+    return lat, lon
+
+
+# (índice en el lote, lat, lon cuantizadas, lat, lon pedidas)
+BatchPoint = Tuple[int, float, float, float, float]
+
+
+def _batch_record(pt: BatchPoint, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Resultado de un punto del lote: el payload (o _err) con sus propias coordenadas."""
+    i, lat, lon, lat_q, lon_q = pt
+    return {"i": i, **payload, "lat": lat, "lon": lon, "query_lat": lat_q, "query_lon": lon_q}
+
+
+async def _batch_records(
+    hass,
+    dd: Dict[str, Any],
+    points: List[Optional[Tuple[float, float]]],
+    lang: Tuple[str, str, str, str],
+    lang_strict: bool,
+    zoom_override: Optional[int],
+    max_wait: float,
+):
+    """
+    Resultados de un lote en el orden en que se resuelven: primero los inválidos y los
+    hits (una pasada por la caché bajo DATA_LOCK_KEY, un hit por hot key), después los
+    misses según termina su celda. Los misses siguen el camino del GET: backoff,
+    negative cache, backpressure y una tarea por celda (reutiliza la que ya esté en
+    vuelo). Lo que no termina en `max_wait` sale como "queued" y la tarea sigue llenando
+    la caché.
+    """
+    accept_lang, accept_lang_param, param_lang_simple, param_lang_simple_lc = lang
+    cache: GeocodeCache = dd[CACHE_KEY]
+    journal: GeocodeJournal = dd[JOURNAL_KEY]
+    hot_map: Dict[str, str] = dd[HOT_MAP_KEY]
+    neg_cache: Dict[Tuple[int, int], datetime] = dd[NEG_CACHE_KEY]
+    data_lock: asyncio.Lock = dd[DATA_LOCK_KEY]
+    inflight: Dict[Any, asyncio.Task] = dd.setdefault(INFLIGHT_KEY, {})
+    interval = float(dd.get(CFG_RL_MIN_INTERVAL, RL_MIN_INTERVAL))
+
+    # 1) inválidos + hits
+    out: List[Dict[str, Any]] = []
+    misses: Dict[Tuple[int, int], List[BatchPoint]] = {}
+    async with data_lock:
+        now = _utcnow()
+        touched = set()
+        for i, point in enumerate(points):
+            if point is None:
+                out.append({"i": i, **_err(400, "invalid_point")})
+                continue
+            lat_q, lon_q = point
+            pt = (i, _quantize(lat_q), _quantize(lon_q), lat_q, lon_q)
+            hit, fallback_used = _lookup_cached(cache, pt[1], pt[2], param_lang_simple_lc, accept_lang_param, lang_strict)
+            if not hit:
+                misses.setdefault(_cell_of(pt[1], pt[2]), []).append(pt)
+                continue
+            hd = _count_hit(dd, hit, pt[1], pt[2])
+            hot_key = _hot_key(hit["lat"], hit["lon"])
+            if hot_key not in touched:
+                touched.add(hot_key)
+                _touch_hit(cache, hot_map, journal, hit, now)
+            out.append({"i": i, **_hit_payload(hit, pt[1], pt[2], lat_q, lon_q, accept_lang_param, fallback_used, hd)})
+    for rec in out:
+        yield rec
+    if not misses:
+        return
+
+    # 2) misses: backoff global, negative cache y backpressure como en el GET
+    backoff_until = dd.get(BACKOFF_UNTIL_KEY)
+    if isinstance(backoff_until, datetime) and _utcnow() < backoff_until:
+        retry_after = max(1, int((backoff_until - _utcnow()).total_seconds()))
+        for pts in misses.values():
+            for pt in pts:
+                yield _batch_record(pt, _err(503, "temporarily_unavailable", retry_after))
+        return
+
+    cfg_max = int(dd.get(CFG_MAX_PENDING_MISSES, MAX_PENDING_MISSES))
+    waiting: Dict[asyncio.Task, List[BatchPoint]] = {}
+    out = []
+    async with data_lock:
+        if not _prune_cache(cache, journal):
+            _enforce_cap(cache, journal)
+        _prune_hot_map(hot_map)  # no se anota: al cargar se vuelve a podar
+
+        eta, backlog_n = _queue_eta(inflight, dd.get(RL_LAST_MONO_KEY, 0.0), interval)
+        for cell_key, pts in misses.items():
+            retry = _neg_retry_after(neg_cache, cell_key)
+            if retry > 0:
+                out.extend(_batch_record(pt, _err(503, "temporarily_unavailable", retry)) for pt in pts)
+                continue
+            dd[MET_MISS] = dd.get(MET_MISS, 0) + len(pts)
+            task = inflight.get(cell_key)
+            if task is None:
+                if backlog_n >= cfg_max:
+                    busy = {**_err(503, "busy", 1), "eta": int(eta), "pending": backlog_n}
+                    out.extend(_batch_record(pt, busy) for pt in pts)
+                    continue
+                _, lat, lon, lat_q, lon_q = pts[0]
+                task = _spawn_fetch(
+                    hass, dd, cell_key,
+                    _fetch_and_cache(hass, dd, lat, lon, lat_q, lon_q, zoom_override, *lang),
+                )
+                backlog_n += 1
+                eta += interval
+            waiting.setdefault(task, []).extend(pts)
+    for rec in out:
+        yield rec
+
+    # 3) resultados según termina cada celda, hasta max_wait
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_wait
+    pending = set(waiting)
+    while pending:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.cancelled():
+                result = _err(503, "temporarily_unavailable", 1)
+            elif task.exception() is not None:
+                result = _err(502, "nominatim_error")
+            else:
+                result = task.result()
+            for pt in waiting[task]:
+                yield _batch_record(pt, result)
+
+    # 4) lo que sigue en cola: 202 "queued" por punto (la tarea no se cancela)
+    if pending:
+        eta, backlog_n = _queue_eta(inflight, dd.get(RL_LAST_MONO_KEY, 0.0), interval)
+        queued = {**_err(202, "queued", max(1, int(eta))), "eta": int(eta), "pending": backlog_n}
+        for task in pending:
+            for pt in waiting[task]:
+                dd[MET_BP_202] = dd.get(MET_BP_202, 0) + 1
+                yield _batch_record(pt, queued)
+
+
+def _tally(summary: Dict[str, int], rec: Dict[str, Any]) -> None:
+    if rec.get("error") == "queued":
+        summary["queued"] += 1
+    elif "error" in rec:
+        summary["errors"] += 1
+    elif str(rec.get("source", "")).startswith("cache"):
+        summary["hits"] += 1
+    else:
+        summary["fetched"] += 1
 
 
 def _find_cached_with_index(
-    cache: List[CacheEntry],
-    index: DefaultDict[Tuple[int, int], List[int]],
+    cache: GeocodeCache,
     lat: float,
     lon: float,
     lang_simple: Optional[str] = None,
 ) -> Optional[CacheEntry]:
-    ix, iy = _cell_of(lat, lon)
     best = None
     best_d = float("inf")
-    for cx, cy in _neighbors(ix, iy):
-        for idx in list(index.get((cx, cy), ())):
-            try:
-                it = cache[idx]
-                it_lat = float(it["lat"])
-                it_lon = float(it["lon"])
-            except Exception:
-                continue
-            if lang_simple:
-                it_lang_simple = (it.get("lang_simple") or (it.get("lang") or "").split(",", 1)[0]).lower()
-                if it_lang_simple != lang_simple:
-                    continue
-            if not _close_enough_box(lat, lon, it_lat, it_lon):
+    for it in cache.in_cells(_neighbors(*_cell_of(lat, lon))):
+        it_lat = it["lat"]
+        it_lon = it["lon"]
+        if lang_simple:
+            it_lang_simple = (it.get("lang_simple") or (it.get("lang") or "").split(",", 1)[0]).lower()
+            if it_lang_simple != lang_simple:
                 continue
-            d = _haversine_m(lat, lon, it_lat, it_lon)
-            if d == 0.0:
-                return it
-            if d < CACHE_RADIUS_M and d < best_d:
-                best = it
-                best_d = d
+        if not _close_enough_box(lat, lon, it_lat, it_lon):
+            continue
+        d = _haversine_m(lat, lon, it_lat, it_lon)
+        if d == 0.0:
+            return it
+        if d < CACHE_RADIUS_M and d < best_d:
+            best = it
+            best_d = d
     return best
 
 
 def _find_cached_with_index_primary(
-    cache: List[CacheEntry],
-    index: DefaultDict[Tuple[int, int], List[int]],
+    cache: GeocodeCache,
     lat: float,
     lon: float,
     lang_primary: Optional[str] = None,
 ) -> Optional[CacheEntry]:
     if not lang_primary:
         return None
-    ix, iy = _cell_of(lat, lon)
     best = None
     best_d = float("inf")
-    for cx, cy in _neighbors(ix, iy):
-        for idx in list(index.get((cx, cy), ())):
-            try:
-                it = cache[idx]
-                it_lat = float(it["lat"]); it_lon = float(it["lon"])  # noqa: E702
-            except Exception:
-                continue
-            if it.get("lang_primary") != lang_primary:
-                continue
-            if not _close_enough_box(lat, lon, it_lat, it_lon):
-                continue
-            d = _haversine_m(lat, lon, it_lat, it_lon)
-            if d == 0.0:
-                return it
-            if d < CACHE_RADIUS_M and d < best_d:
-                best, best_d = it, d
+    for it in cache.in_cells(_neighbors(*_cell_of(lat, lon))):
+        it_lat = it["lat"]
+        it_lon = it["lon"]
+        if it.get("lang_primary") != lang_primary:
+            continue
+        if not _close_enough_box(lat, lon, it_lat, it_lon):
+            continue
+        d = _haversine_m(lat, lon, it_lat, it_lon)
+        if d == 0.0:
+            return it
+        if d < CACHE_RADIUS_M and d < best_d:
+            best, best_d = it, d
     return best
 
 
@@ -763,6 +1420,7 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
     name = "api:ha_tracker/reverse_geocode"
     requires_auth = True
 
+    @instrumented("reverse_geocode")
     async def get(self, request):
         """
         Query params:
@@ -786,15 +1444,7 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
         qs = request.rel_url.query or {}
         debug = (qs.get("debug") == "1")
 
-        server_lang = getattr(hass.config, "language", None) or "en"
-        raw_lang = (qs.get("lang") or "").strip()
-        norm_lang = raw_lang.replace("_", "-")
-        client_lang = norm_lang if (norm_lang and _LANG_RE.match(norm_lang)) else None
-
-        accept_lang, accept_lang_param = _build_accept_lang(client_lang or server_lang)
-        _param_token = accept_lang_param.split(",", 1)[0]
-        param_lang_simple = _canon_bcp47(_param_token)
-        param_lang_simple_lc = _param_token.lower()
+        accept_lang, accept_lang_param, param_lang_simple, param_lang_simple_lc = _request_lang(hass, qs.get("lang"))
         lang_strict = (qs.get("lang_strict") == "1")
 
         only_admin = _get_only_admin(hass, dd)
@@ -815,9 +1465,12 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
             if what not in valid:
                 return _json_error(self, 400, "invalid_reset", lang=accept_lang_param)
 
-            store: Store = dd[STORE_HANDLE_KEY]
-            hot_store: Store = dd[HOT_HANDLE_KEY]
-            save_cache = save_hot = False
+            journal: GeocodeJournal = dd[JOURNAL_KEY]
+            # Ningún reset espera a la carga (que puede estar entre reintentos durante minutos):
+            # cache/all descartan lo persistido, hot se anota para que la carga descarte el hot
+            # persistido al fusionar, y neg/backoff/metrics no tocan nada de lo que se carga.
+            if what in ("cache", "all"):
+                await _discard_load(dd)  # lo persistido se descarta: no hace falta (ni se puede) cargarlo
 
             async with dd[DATA_LOCK_KEY]:
                 out: Dict[str, Any] = {"action": what}
@@ -825,15 +1478,18 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
                 if what in ("cache", "all"):
                     out["cache_len_before"] = len(dd[CACHE_KEY])
                     dd[CACHE_KEY].clear()
-                    dd[INDEX_KEY].clear()
-                    dd[CACHE_DIRTY_KEY] = True
-                    save_cache = True
+                    journal.append(OP_CLEAR)
+                    journal.compact_requested = True
 
                 if what in ("hot", "all"):
+                    if not dd.get(CACHE_READY_KEY):
+                        dd[HOT_RESET_KEY] = True
                     out["hot_len_before"] = len(dd[HOT_MAP_KEY])
                     dd[HOT_MAP_KEY].clear()
-                    dd[HOT_DIRTY_KEY] = True
-                    save_hot = True
+                    # sin hits, el instante efectivo vuelve a ser el de alta
+                    dd[CACHE_KEY].retime(lambda it: _epoch(it.get("ts")))
+                    journal.append(OP_CLEAR_HOT)
+                    journal.compact_requested = True
 
                 if what in ("neg", "all"):
                     out["neg_len_before"] = len(dd[NEG_CACHE_KEY])
@@ -855,10 +1511,7 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
 
                 out["lang"] = accept_lang_param
 
-            if save_cache:
-                store.async_delay_save(lambda: dd[CACHE_KEY], 0)
-            if save_hot:
-                hot_store.async_delay_save(lambda: dd[HOT_MAP_KEY], 0)
+            await _flush_journal(hass, dd)
 
             return _json_ok(self, out)
 
@@ -887,10 +1540,13 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
                 "miss": miss,
                 "hit_rate": round(hit_rate, 4),
                 "cache_len": len(dd.get(CACHE_KEY, [])),
-                "index_cells": len(dd.get(INDEX_KEY, {})),
+                "cache_ready": bool(dd.get(CACHE_READY_KEY, False)),
+                "cache_load_failed": bool(dd.get(LOAD_FAILED_KEY, False)),
+                "index_cells": dd[CACHE_KEY].cell_count() if CACHE_KEY in dd else 0,
                 "hot_len": len(dd.get(HOT_MAP_KEY, {})),
-                "store_dirty": bool(dd.get(CACHE_DIRTY_KEY, False)),
-                "hot_dirty": bool(dd.get(HOT_DIRTY_KEY, False)),
+                "store_dirty": bool(dd[JOURNAL_KEY].pending) if JOURNAL_KEY in dd else False,
+                "journal_pending": dd[JOURNAL_KEY].pending if JOURNAL_KEY in dd else 0,
+                "journal_records": dd[JOURNAL_KEY].records if JOURNAL_KEY in dd else 0,
                 "neg_cells": len(dd.get(NEG_CACHE_KEY, {})),
                 "pending_misses": backlog_n,
                 "backlog_eta": int(eta),
@@ -925,10 +1581,8 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
         lat = _quantize(lat_q)
         lon = _quantize(lon_q)
 
-        cache: List[CacheEntry] = dd[CACHE_KEY]
-        index: DefaultDict[Tuple[int, int], List[int]] = dd[INDEX_KEY]
-        store: Store = dd[STORE_HANDLE_KEY]
-        hot_store: Store = dd[HOT_HANDLE_KEY]
+        cache: GeocodeCache = dd[CACHE_KEY]
+        journal: GeocodeJournal = dd[JOURNAL_KEY]
         hot_map: Dict[str, str] = dd[HOT_MAP_KEY]
         data_lock: asyncio.Lock = dd[DATA_LOCK_KEY]
 
@@ -938,54 +1592,16 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
         zoom_override = _parse_zoom(qs)
 
         # 1) cache hit
-        fallback_used = False
-        async with data_lock:
-            hit = None if force else _find_cached_with_index(
-                cache, index, lat, lon, param_lang_simple_lc
-            )
-            if not hit and not force and not lang_strict:
-                prim = _primary_of(accept_lang_param)
-                hit = _find_cached_with_index_primary(cache, index, lat, lon, prim)
-                if not hit:
-                    hit = _find_cached_with_index(cache, index, lat, lon, lang_simple=None)
-                fallback_used = bool(hit)
+        hit, fallback_used = None, False
+        if not force:
+            async with data_lock:
+                hit, fallback_used = _lookup_cached(cache, lat, lon, param_lang_simple_lc, accept_lang_param, lang_strict)
 
         if hit:
-            dd[MET_HITS] = dd.get(MET_HITS, 0) + 1
-            hd: Optional[float] = None
-            try:
-                hd = _haversine_m(lat, lon, float(hit["lat"]), float(hit["lon"]))
-                dd[MET_HIT_DIST_SUM] = dd.get(MET_HIT_DIST_SUM, 0.0) + float(hd)
-                dd[MET_HIT_DIST_N] = dd.get(MET_HIT_DIST_N, 0) + 1
-            except Exception:
-                pass
-
-            now_iso = _utcnow().isoformat()
-            try:
-                entry_key = _hot_key(float(hit["lat"]), float(hit["lon"]))
-            except Exception:
-                entry_key = _hot_key(lat, lon)
-
+            hd = _count_hit(dd, hit, lat, lon)
             async with data_lock:
-                hot_map[entry_key] = now_iso
-                dd[HOT_DIRTY_KEY] = True
-                hot_store.async_delay_save(lambda: hot_map, HOT_SAVE_INTERVAL)
-
-            payload = {
-                "lat": lat,
-                "lon": lon,
-                "query_lat": lat_q,
-                "query_lon": lon_q,
-                "address": hit.get("address"),
-                "source": "cache_lang_fallback" if fallback_used else "cache",
-                "cached_at": hit.get("ts"),
-                "lang": hit.get("lang", accept_lang_param),
-                "source_lang": hit.get("lang", accept_lang_param),
-                "hit_distance_m": round(hd, 3) if hd is not None else None,
-            }
-            if fallback_used and hit.get("lang"):
-                payload["lang_cached"] = hit["lang"]
-            return _json_ok(self, payload)
+                _touch_hit(cache, hot_map, journal, hit, _utcnow())
+            return _json_ok(self, _hit_payload(hit, lat, lon, lat_q, lon_q, accept_lang_param, fallback_used, hd))
 
         # 1.5) MISS → aplicar backoff/negative-cache DESPUÉS de intentar caché
         neg_cache: Dict[Tuple[int, int], datetime] = dd[NEG_CACHE_KEY]
@@ -1010,204 +1626,16 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
 
         dd[MET_MISS] = dd.get(MET_MISS, 0) + 1
         async with data_lock:
-            cache_changed = _prune_cache(cache, hot_map) or _enforce_cap(cache, hot_map)
-            hot_changed = _prune_hot_map(hot_map)
-            if cache_changed:
-                dd[INDEX_KEY] = index = _rebuild_index(cache)  # type: ignore[arg-type]
-                per_cell_max = int(dd.get(CFG_PER_CELL_MAX, PER_CELL_MAX))
-                for k, lst in list(index.items()):
-                    if len(lst) > per_cell_max:
-                        lst.sort(key=lambda i: _effective_ts(cache[i], hot_map))
-                        index[k] = lst[-per_cell_max:]
-                dd[CACHE_DIRTY_KEY] = True
-                store.async_delay_save(lambda: cache, SAVE_DEBOUNCE_ON_CHANGE)
-            if hot_changed:
-                dd[HOT_DIRTY_KEY] = True
-                hot_store.async_delay_save(lambda: hot_map, HOT_SAVE_INTERVAL)
-
-        # 3) fetch/cache (definida aquí para cerrar sobre variables)
-        async def _do_fetch_and_cache() -> Dict[str, Any]:
-            await _rate_limit_wait(dd)
-            dd[RL_LAST_TS_KEY] = _utcnow()
-
-            session = async_get_clientsession(hass)
-            params = {
-                "format": "json",
-                "lat": f"{lat_q:.8f}",
-                "lon": f"{lon_q:.8f}",
-                "zoom": str(zoom_override or 18),
-                "addressdetails": "1",
-                "accept-language": param_lang_simple,
-            }
-            nom_email = dd.get(CFG_NOM_EMAIL, NOMINATIM_EMAIL)
-            if nom_email and "@" not in nom_email:
-                nom_email = None
-            if nom_email:
-                params["email"] = nom_email
-            headers = {
-                "User-Agent": f"HA-Tracker/1.0 ({nom_email or 'no-contact'})",
-                "Accept-Language": accept_lang,
-                "Accept": "application/json",
-            }
-            try:
-                external_url = getattr(getattr(hass, "config", None), "external_url", None)
-                if external_url:
-                    headers["Referer"] = external_url
-            except Exception:
-                pass
-
-            raw: Any = None
-            try:
-                async with session.get(NOMINATIM_URL, params=params, headers=headers, timeout=NOMINATIM_TIMEOUT) as resp:
-                    ctype = resp.headers.get("Content-Type", "")
-                    charset = resp.charset or "utf-8"
-
-                    if resp.status == 429:
-                        ra_hdr = resp.headers.get("Retry-After")
-                        ttl_secs = int(NEG_CACHE_TTL)
-                        if ra_hdr:
-                            try:
-                                ttl_secs = int(ra_hdr)
-                            except ValueError:
-                                try:
-                                    ra_dt = parsedate_to_datetime(ra_hdr)
-                                    ttl_secs = max(1, int((ra_dt - _utcnow()).total_seconds()))
-                                except Exception:
-                                    ttl_secs = int(NEG_CACHE_TTL)
-                        backoff_secs = min(int(max(ttl_secs, int(NEG_CACHE_TTL)) * random.uniform(0.9, 1.1)), MAX_BACKOFF_S)
-                        async with data_lock:
-                            _neg_set_for(neg_cache, cell_key, backoff_secs)
-                            dd[BACKOFF_UNTIL_KEY] = _utcnow() + timedelta(seconds=backoff_secs)
-                        return _err(429, "rate_limited", backoff_secs)
-
-                    if resp.status != 200:
-                        ra_hdr = resp.headers.get("Retry-After")
-                        retry_after = None
-                        if ra_hdr:
-                            try:
-                                retry_after = int(ra_hdr)
-                            except ValueError:
-                                try:
-                                    ra_dt = parsedate_to_datetime(ra_hdr)
-                                    retry_after = max(1, int((ra_dt - _utcnow()).total_seconds()))
-                                except Exception:
-                                    retry_after = None
-
-                        if 500 <= resp.status <= 599:
-                            async with data_lock:
-                                _neg_set_for(neg_cache, cell_key, int(retry_after or NEG_CACHE_TTL))
-                                secs = int(retry_after or NEG_CACHE_TTL)
-                                dd[BACKOFF_UNTIL_KEY] = _utcnow() + timedelta(seconds=min(secs, MAX_BACKOFF_S))
-                            return _err(503, "upstream_unavailable", retry_after)
-                        else:
-                            async with data_lock:
-                                _neg_set_for(neg_cache, cell_key, int(retry_after or NEG_CACHE_TTL))
-                            return _err(502, f"upstream_http_{resp.status}", retry_after)
-
-                    if resp.content_length and resp.content_length > NOMINATIM_MAX_BYTES:
-                        _LOGGER.warning("Nominatim payload too large: %s bytes", resp.content_length)
-                        async with data_lock:
-                            _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
-                        return _err(502, "payload_too_large")
-
-                    if "application/json" not in ctype:
-                        raw_preview = await resp.content.read(300)
-                        text_preview = raw_preview.decode(charset, errors="ignore").strip()
-                        if random.random() < LOG_SAMPLE_RATE:
-                            _LOGGER.warning("Nominatim non-JSON 200: Content-Type=%s preview=%r", ctype, text_preview)
-                        async with data_lock:
-                            _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
-                        return _err(502, "invalid_content_type")
-
-                    raw_bytes = await resp.content.read(NOMINATIM_MAX_BYTES + 1)
-                    if len(raw_bytes) > NOMINATIM_MAX_BYTES:
-                        _LOGGER.warning("Nominatim payload exceeded max bytes: > %s", NOMINATIM_MAX_BYTES)
-                        async with data_lock:
-                            _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
-                        return _err(502, "payload_too_large")
-
-                    try:
-                        raw = json.loads(raw_bytes.decode(charset, errors="strict"))
-                    except Exception as e:
-                        if random.random() < LOG_SAMPLE_RATE:
-                            _LOGGER.warning("Nominatim invalid JSON: %s", e)
-                        async with data_lock:
-                            _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
-                        return _err(502, "invalid_json_from_nominatim")
-
-            except asyncio.TimeoutError:
-                async with data_lock:
-                    _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
-                return _err(504, "nominatim_timeout")
-            except Exception:
-                async with data_lock:
-                    _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
-                return _err(502, "nominatim_error")
-
-            if not isinstance(raw, dict):
-                async with data_lock:
-                    _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
-                return _err(502, "invalid_json_from_nominatim")
-
-            if "error" in raw:
-                try:
-                    _LOGGER.warning("Nominatim returned error: %r", raw.get("error"))
-                except Exception:
-                    pass
-                async with data_lock:
-                    _neg_set_for(neg_cache, cell_key, int(NEG_CACHE_TTL))
-                return _err(502, "nominatim_error")
-
-            data = _compact_nominatim(raw)
-
-            addr = data.get("address") if isinstance(data, dict) else None
-            if not addr:
-                short_ttl = 30
-                async with data_lock:
-                    _neg_set_for(neg_cache, cell_key, short_ttl)
-                return {
-                    "lat": lat, "lon": lon,
-                    "query_lat": lat_q, "query_lon": lon_q,
-                    "address": data, "source": "nominatim",
-                    "cached": False, "cacheable": False,
-                    "lang": accept_lang_param,
-                }
-
-            ts = _utcnow().isoformat()
-            entry: CacheEntry = {
-                "lat": lat, "lon": lon, "address": data, "ts": ts,
-                "lang": accept_lang_param, "lang_hdr": accept_lang,
-                "lang_primary": _primary_of(accept_lang_param),
-                "lang_simple": param_lang_simple_lc,
-            }
-
-            async with data_lock:
-                cache.append(entry)
-                index.setdefault(cell_key, []).append(len(cache) - 1)
-                per_cell_max = int(dd.get(CFG_PER_CELL_MAX, PER_CELL_MAX))
-                cell_list = index[cell_key]
-                if len(cell_list) > per_cell_max:
-                    cell_list.sort(key=lambda i: _effective_ts(cache[i], hot_map))
-                    del cell_list[0: len(cell_list) - per_cell_max]
-                if _enforce_cap(cache, hot_map):
-                    dd[INDEX_KEY] = _rebuild_index(cache)  # type: ignore[arg-type]
-                    per_cell_max = int(dd.get(CFG_PER_CELL_MAX, PER_CELL_MAX))
-                    for k, lst in list(dd[INDEX_KEY].items()):
-                        if len(lst) > per_cell_max:
-                            lst.sort(key=lambda i: _effective_ts(cache[i], hot_map))
-                            dd[INDEX_KEY][k] = lst[-per_cell_max:]
-                dd[CACHE_DIRTY_KEY] = True
-                store.async_delay_save(lambda: cache, SAVE_DEBOUNCE_ON_CHANGE)
-                neg_cache.pop(cell_key, None)
-                dd[BACKOFF_UNTIL_KEY] = datetime.fromtimestamp(0, tz=timezone.utc)
-
-            return {
-                "lat": lat, "lon": lon,
-                "query_lat": lat_q, "query_lon": lon_q,
-                "address": data, "source": "nominatim",
-                "cached_at": ts, "lang": accept_lang_param,
-                "source_lang": accept_lang_param,
-            }
+            if not _prune_cache(cache, journal):
+                _enforce_cap(cache, journal)
+            _prune_hot_map(hot_map)  # no se anota: al cargar se vuelve a podar
+
+        # 3) fetch/cache
+        def _do_fetch_and_cache():
+            return _fetch_and_cache(
+                hass, dd, lat, lon, lat_q, lon_q, zoom_override,
+                accept_lang, accept_lang_param, param_lang_simple, param_lang_simple_lc,
+            )
 
         # 4) Decisiones AUTO-NOWAIT / NOWAIT + backpressure duro
         eta, backlog_n = _queue_eta(
@@ -1258,36 +1686,14 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
         # No hay tarea aún → arrancar
         if nowait or eta >= AUTO_NOWAIT_ETA_S:
             async with data_lock:
-                task_name = f"rg_fetch_{cell_key[0]}_{cell_key[1]}_any"
-                task = _create_task(hass, _do_fetch_and_cache(), task_name)
-                inflight[inflight_key] = task
-
-                # cleanup automático
-                def _cleanup(_t, k=inflight_key, tsk=task):
-                    async def _rm():
-                        async with data_lock:
-                            if inflight.get(k) is tsk:
-                                inflight.pop(k, None)
-                    _create_task(hass, _rm(), "rg_inflight_cleanup")
-                task.add_done_callback(_cleanup)
+                _spawn_fetch(hass, dd, inflight_key, _do_fetch_and_cache())
 
             dd[MET_BP_202] = dd.get(MET_BP_202, 0) + 1
             return _json_error(self, 202, "queued", max(1, int(eta)), eta=int(eta), pending=backlog_n, lang=accept_lang_param)
 
         # Camino síncrono: arrancar y esperar
         async with data_lock:
-            task_name = f"rg_fetch_{cell_key[0]}_{cell_key[1]}_any"
-            task = _create_task(hass, _do_fetch_and_cache(), task_name)
-            inflight[inflight_key] = task
-
-            # cleanup automático por si alguien no alcanza el finally
-            def _cleanup(_t, k=inflight_key, tsk=task):
-                async def _rm():
-                    async with data_lock:
-                        if inflight.get(k) is tsk:
-                            inflight.pop(k, None)
-                _create_task(hass, _rm(), "rg_inflight_cleanup")
-            task.add_done_callback(_cleanup)
+            task = _spawn_fetch(hass, dd, inflight_key, _do_fetch_and_cache())
 
         try:
             result = await task
@@ -1308,6 +1714,116 @@ class ReverseGeocodeEndpoint(HomeAssistantView):
         return _json_ok(self, result)
 
 
+class ReverseGeocodeBatchEndpoint(HomeAssistantView):
+    """Reverse geocoding de muchos puntos en una sola petición (listas de paradas y exportaciones)"""
+
+    url = "/api/ha_tracker/reverse_geocode/batch"
+    name = "api:ha_tracker/reverse_geocode/batch"
+    requires_auth = True
+
+    @instrumented("reverse_geocode/batch")
+    async def post(self, request):
+        """
+        Cuerpo JSON:
+          - points: [[lat, lon] | {"lat": ..., "lon": ...}, ...] (hasta BATCH_MAX_POINTS)
+          - lang, lang_strict, zoom (opcionales): como en el GET
+          - max_wait (opcional, s): espera máxima a los misses (0..BATCH_MAX_WAIT_S, por defecto BATCH_DEFAULT_WAIT_S)
+        Un resultado por punto con "i" (su posición en points) y el payload del GET, o su
+        error/status/retry_after ("queued" si sigue en cola al agotar max_wait). Con stream=1
+        cada resultado es una línea NDJSON que se envía en cuanto se resuelve, y al final
+        {"end": true, ...resumen}; sin stream, {"results": [...en orden de points], ...resumen}.
+        """
+        hass = request.app["hass"]
+        await _ensure_structs(hass)
+
+        dd = hass.data[DOMAIN]
+        _load_cfg_overrides(hass, dd)
+
+        only_admin = _get_only_admin(hass, dd)
+        user = request.get("hass_user")
+        if only_admin and (user is None or not user.is_admin):
+            return _json_error(self, 403, "forbidden")
+
+        try:
+            body = await request.json()
+        except ValueError:
+            return _json_error(self, 400, "invalid_json")
+        if not isinstance(body, dict) or not isinstance(body.get("points"), list):
+            return _json_error(self, 400, "points must be a list")
+
+        raw_lang = body.get("lang")
+        lang = _request_lang(hass, raw_lang if isinstance(raw_lang, str) else None)
+        accept_lang_param = lang[1]
+
+        raw_points = body["points"]
+        if len(raw_points) > BATCH_MAX_POINTS:
+            return _json_error(self, 400, "too_many_points", max_points=BATCH_MAX_POINTS, lang=accept_lang_param)
+
+        try:
+            max_wait = float(body.get("max_wait", BATCH_DEFAULT_WAIT_S))
+        except (TypeError, ValueError):
+            max_wait = math.nan
+        if not isfinite(max_wait):
+            return _json_error(self, 400, "max_wait must be a number", lang=accept_lang_param)
+        max_wait = min(max(max_wait, 0.0), BATCH_MAX_WAIT_S)
+
+        lang_strict = body.get("lang_strict") in (True, 1, "1")
+        zoom_override = _parse_zoom(body)
+
+        records = _batch_records(
+            hass, dd, [_parse_point(p) for p in raw_points], lang, lang_strict, zoom_override, max_wait
+        )
+        summary = {"points": len(raw_points), "hits": 0, "fetched": 0, "queued": 0, "errors": 0}
+        headers = {"Cache-Control": "no-store", "Content-Language": accept_lang_param.split(",", 1)[0]}
+
+        try:
+            if request.query.get("stream") not in ("1", "true", "ndjson"):
+                results = []
+                async for rec in records:
+                    _tally(summary, rec)
+                    results.append(rec)
+                results.sort(key=lambda r: r["i"])
+                resp = self.json({"results": results, **summary, "lang": accept_lang_param})
+                resp.headers.update(headers)
+                return resp
+
+            response = web.StreamResponse(headers={"Content-Type": NDJSON_CONTENT_TYPE, **headers})
+            await response.prepare(request)
+            try:
+                async for rec in records:
+                    _tally(summary, rec)
+                    await response.write(json_bytes(rec) + b"\n")
+                await response.write(json_bytes({"end": True, **summary, "lang": accept_lang_param}) + b"\n")
+            except ConnectionResetError:
+                _LOGGER.debug("reverse_geocode/batch: client disconnected while streaming")
+                return response
+            await response.write_eof()
+            return response
+        finally:
+            await records.aclose()
+
+
 async def async_init_reverse_cache(hass) -> None:
-    """Carga la caché persistida y prepara rate-limit/estructuras al iniciar la integración."""
+    """
+    Prepara rate-limit/estructuras al iniciar la integración. La caché persistida se carga en
+    background cuando Home Assistant ha arrancado; hasta entonces se atiende en modo degradado.
+    """
     await _ensure_structs(hass)
+
+
+async def async_unload_reverse_cache(hass) -> None:
+    """
+    Descarga de la entrada (también al recargarla por un cambio de opciones): quita los
+    listeners pendientes y cierra la caché (_async_shutdown) antes de que se descarten
+    sus datos y la nueva instancia vuelva a cargar el diario.
+    """
+    dd = hass.data.get(DOMAIN)
+    if not dd:
+        return
+    for key in (STARTED_LISTENER_KEY, STOP_LISTENER_KEY):
+        unsub = dd.pop(key, None)
+        if callable(unsub):
+            unsub()
+    await _async_shutdown(hass, dd)
+    for key in (MAINT_TASK_KEY, LOAD_TASK_KEY, COMPACT_TASK_KEY):
+        dd.pop(key, None)
@@ -0,0 +1,84 @@
+"""Simplificación Douglas-Peucker del track para dibujar (tolerancia en metros o por nivel de zoom)"""
+
+import math
+
+from array import array
+from typing import Iterable, Optional
+
+from .zone_index import M_PER_DEG
+
+# Metros por píxel en el ecuador a zoom 0 (teselas de 256 px, Web Mercator)
+ZOOM0_M_PER_PX = 156543.03392
+SIMPLIFY_ZOOM_PX = 1.0          # con zoom=, tolerancia = este número de píxeles a ese zoom
+SIMPLIFY_MAX_ZOOM = 24
+
+
+def zoom_tolerance_m(zoom: float, lat: float) -> float:
+    """Tolerancia (m) equivalente a SIMPLIFY_ZOOM_PX píxeles en `zoom` a la latitud `lat`."""
+    return SIMPLIFY_ZOOM_PX * ZOOM0_M_PER_PX * math.cos(math.radians(lat)) / (2.0 ** zoom)
+
+
+def _seg_dist2(px: float, py: float, ax: float, ay: float, bx: float, by: float) -> float:
+    """Distancia² del punto P al segmento AB (plano local en metros)."""
+    dx, dy = bx - ax, by - ay
+    den = dx * dx + dy * dy
+    if den > 0.0:
+        t = ((px - ax) * dx + (py - ay) * dy) / den
+        if t > 1.0:
+            ax, ay = bx, by
+        elif t > 0.0:
+            ax, ay = ax + t * dx, ay + t * dy
+    ex, ey = px - ax, py - ay
+    return ex * ex + ey * ey
+
+
+def douglas_peucker(track, sel, tolerance_m: Optional[float] = None, zoom: Optional[float] = None,
+                    keep: Iterable[int] = ()) -> array:
+    """
+    Subconjunto de `sel` (en el mismo orden) a menos de `tolerance_m` de la línea original.
+
+    Se conservan siempre la primera y la última posición y las de `keep` (índices en
+    `sel`): el track se parte en ellas y cada tramo se simplifica por separado, así que
+    nunca se pierden. Las distancias se miden en una proyección equirectangular local.
+    Con `zoom` la tolerancia se calcula para la latitud media del track.
+    """
+    n = len(sel)
+    if n < 3:
+        return array("l", sel)
+
+    lat_col, lon_col = track.lat, track.lon
+    lat_ref = sum(lat_col[r] for r in sel) / n
+    if tolerance_m is None:
+        if zoom is None:
+            return array("l", sel)
+        tolerance_m = zoom_tolerance_m(zoom, lat_ref)
+    tol2 = float(tolerance_m) ** 2
+
+    kx = M_PER_DEG * math.cos(math.radians(lat_ref))
+    xs = [lon_col[r] * kx for r in sel]
+    ys = [lat_col[r] * M_PER_DEG for r in sel]
+
+    mark = bytearray(n)
+    mark[0] = mark[-1] = 1
+    for i in keep:
+        if 0 <= i < n:
+            mark[i] = 1
+    anchors = [i for i in range(n) if mark[i]]
+
+    stack = [(a, b) for a, b in zip(anchors, anchors[1:]) if b - a > 1]
+    while stack:
+        a, b = stack.pop()
+        ax, ay, bx, by = xs[a], ys[a], xs[b], ys[b]
+        best, best_i = -1.0, -1
+        for i in range(a + 1, b):
+            d2 = _seg_dist2(xs[i], ys[i], ax, ay, bx, by)
+            if d2 > best:
+                best, best_i = d2, i
+        if best > tol2:
+            mark[best_i] = 1
+            if best_i - a > 1:
+                stack.append((a, best_i))
+            if b - best_i > 1:
+                stack.append((best_i, b))
+
+    return array("l", (r for i, r in enumerate(sel) if mark[i]))
@@ -0,0 +1,441 @@
+"""Detección de paradas por radio en flujo: colapso de grupos y fusión de paradas cercanas"""
+
+import heapq
+import itertools
+import math
+
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .kernels import haversine
+from .track import Stop, Track, US_PER_S
+from .zone_index import M_PER_DEG
+
+LOOKAHEAD_CELL_MARGIN = 1.05    # celda algo mayor que el radio (haversine vs. rejilla en grados)
+LOOKAHEAD_MAX_LAT = 89.0        # latitud máxima para el ancho de celda en longitud
+LOOKAHEAD_CLEARANCE_EPS_M = 1e-3    # margen de la holgura frente al redondeo de haversine
+
+
+class _LookaheadCell:
+    """
+    Posiciones indexadas de una celda, en orden. Las de `checked` están todas a más de
+    radio + `clearance` de (ref_lat, ref_lon), el centroide de la última pregunta sin
+    retorno que las revisó; las de `fresh` (posteriores) aún no se han revisado.
+    """
+
+    __slots__ = ("checked", "fresh", "ref_lat", "ref_lon", "clearance", "shift", "nearest")
+
+    def __init__(self) -> None:
+        self.checked: deque = deque()
+        self.fresh: deque = deque()
+        self.ref_lat = self.ref_lon = math.nan
+        self.clearance = 0.0
+        self.shift = math.inf       # distancia del centroide de la pregunta en curso a ref
+        self.nearest = math.inf     # menor distancia revisada en la pregunta en curso
+
+
+def _tagged(entries, cell: _LookaheadCell) -> Iterator[tuple]:
+    for idx, row in entries:
+        yield idx, row, cell
+
+
+class LookaheadWindow:
+    """
+    Posiciones de la ventana outside_gap (las que siguen al primer punto fuera de un
+    grupo), indexadas por celdas del tamaño del radio.
+
+    Cada posición se lee, se indexa y se descarta una sola vez: los dos extremos de la
+    ventana solo avanzan (el inicio es el primer punto fuera y el final su instante +
+    outside_gap, ambos crecientes a lo largo del track).
+
+    La pregunta "¿vuelve dentro del radio del centroide antes de outside_gap?" recorre
+    las posiciones de las celdas vecinas del centroide en orden de posición (mezcla de
+    las celdas) y después las aún no indexadas, parando en el primer acierto:
+      - si hay retorno, todo lo revisado es anterior a él y se descarta en la pregunta
+        siguiente, así que cada posición se revisa como mucho una vez con retorno;
+      - si no lo hay, cada celda vecina guarda el centroide y la holgura (distancia
+        mínima menos el radio) de lo revisado, y las preguntas siguientes se saltan la
+        celda entera mientras el centroide se haya movido menos que esa holgura. Solo
+        vuelven a revisarse las posiciones nuevas de la celda o las de una celda cuya
+        holgura ha rebasado el centroide; lo leído hasta el final de la ventana se
+        indexa y no vuelve a recorrerse en orden.
+    """
+
+    def __init__(self, track: Track, radius_m: float, good: Callable[[int], bool]) -> None:
+        self._lat, self._lon, self._ts = track.lat, track.lon, track.ts
+        self._radius_m = radius_m
+        self._good = good
+        self._dlat = radius_m / M_PER_DEG * LOOKAHEAD_CELL_MARGIN
+        self._dlon: Optional[float] = None      # se fija con la latitud de la primera posición
+        self._cells: Dict[Tuple[int, int], _LookaheadCell] = {}
+        self._anywhere: deque = deque()         # indexadas sin coordenadas finitas
+        self._order: deque = deque()            # (posición, fila, celda) indexadas, en orden
+        self._tail: deque = deque()             # (posición, fila) leídas y aún sin indexar
+        self.hi = 0                             # primera posición que aún no se ha mirado
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        if self._dlon is None:
+            self._dlon = self._dlat / math.cos(math.radians(min(abs(lat), LOOKAHEAD_MAX_LAT)))
+        return math.floor(lat / self._dlat), math.floor(lon / self._dlon)
+
+    def find_return(
+        self, lo: int, until_us: int, c_lat: float, c_lon: float, at: Callable[[int], Optional[int]]
+    ) -> Tuple[Optional[Tuple[int, int]], Optional[int]]:
+        """
+        Primera posición >= lo con ts <= until_us a <= radio del centroide. Devuelve
+        ((posición, fila), None) si la hay o (None, fila en self.hi) si no: la primera
+        que queda fuera de plazo, o None si la entrada se acabó. `lo` y `until_us` no
+        decrecen entre llamadas.
+        """
+        order, cells, tail = self._order, self._cells, self._tail
+        while order and order[0][0] < lo:
+            _, _, key = order.popleft()
+            if key is None:
+                self._anywhere.popleft()
+                continue
+            cell = cells[key]
+            (cell.checked if cell.checked else cell.fresh).popleft()
+            if not cell.checked and not cell.fresh:
+                del cells[key]
+        while tail and tail[0][0] < lo:
+            tail.popleft()
+        if self.hi < lo:
+            self.hi = lo
+
+        lat_col, lon_col, ts_col, radius_m = self._lat, self._lon, self._ts, self._radius_m
+        scanned: List[Tuple[Tuple[int, int], _LookaheadCell, bool]] = []
+        if order:
+            if math.isfinite(c_lat) and math.isfinite(c_lon):
+                hit = self._first_indexed(c_lat, c_lon, scanned)
+            else:
+                # haversine con NaN da 0: cualquier posición está "dentro"
+                hit = order[0][:2]
+            if hit is not None:
+                return hit, None
+        # posiciones aún sin indexar (todas posteriores a las indexadas), en orden
+        dists: List[float] = []
+        for idx, row in tail:
+            d = haversine(c_lat, c_lon, lat_col[row], lon_col[row])
+            if d <= radius_m:
+                return (idx, row), None
+            dists.append(d)
+
+        # se amplía la ventana posición a posición
+        while True:
+            beyond = at(self.hi)
+            if beyond is None or ts_col[beyond] > until_us:
+                break
+            row = beyond
+            idx = self.hi
+            self.hi += 1
+            if self._good(row):
+                d = haversine(c_lat, c_lon, lat_col[row], lon_col[row])
+                if d <= radius_m:
+                    tail.append((idx, row))
+                    return (idx, row), None
+                tail.append((idx, row))
+                dists.append(d)
+
+        # sin retorno: las celdas revisadas quedan comprobadas respecto a este centroide
+        checked = set()
+        for key, cell, valid in scanned:
+            clearance = cell.clearance - cell.shift if valid else math.inf
+            cell.clearance = min(clearance, cell.nearest - radius_m)
+            cell.checked.extend(cell.fresh)
+            cell.fresh.clear()
+            cell.ref_lat, cell.ref_lon = c_lat, c_lon
+            checked.add(key)
+        # y lo leído se indexa para las próximas preguntas
+        for (idx, row), d in zip(tail, dists):
+            lat, lon = lat_col[row], lon_col[row]
+            if not (math.isfinite(lat) and math.isfinite(lon)):
+                self._anywhere.append((idx, row))
+                order.append((idx, row, None))
+                continue
+            key = self._cell(lat, lon)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = _LookaheadCell()
+                cell.ref_lat, cell.ref_lon, cell.clearance = c_lat, c_lon, math.inf
+                checked.add(key)
+            if key in checked:
+                cell.checked.append((idx, row))
+                cell.clearance = min(cell.clearance, d - radius_m)
+            else:
+                cell.fresh.append((idx, row))
+            order.append((idx, row, key))
+        tail.clear()
+        return None, beyond
+
+    def _first_indexed(
+        self, c_lat: float, c_lon: float, scanned: List[Tuple[Tuple[int, int], _LookaheadCell, bool]]
+    ) -> Optional[Tuple[int, int]]:
+        """
+        (posición, fila) de la primera posición indexada a <= radio del centroide (finito).
+        Añade a `scanned` las celdas vecinas revisadas (celda, holgura vigente).
+        """
+        # una posición sin coordenadas finitas está a distancia 0 de todo (haversine)
+        best: Optional[Tuple[int, int]] = self._anywhere[0] if self._anywhere else None
+        if not self._cells:
+            return best
+        cy, cx = self._cell(c_lat, c_lon)
+        # ancho en longitud del radio en la latitud más alejada del ecuador que puede alcanzar
+        lat_far = min(abs(c_lat) + self._dlat, LOOKAHEAD_MAX_LAT)
+        span = max(1, math.ceil(self._dlat / math.cos(math.radians(lat_far)) / self._dlon))
+
+        lat_col, lon_col, radius_m, cells = self._lat, self._lon, self._radius_m, self._cells
+        streams = []
+        for y in (cy - 1, cy, cy + 1):
+            for x in range(cx - span, cx + span + 1):
+                cell = cells.get((y, x))
+                if cell is None:
+                    continue
+                valid = False
+                if cell.checked:
+                    cell.shift = haversine(c_lat, c_lon, cell.ref_lat, cell.ref_lon)
+                    valid = cell.shift < cell.clearance - LOOKAHEAD_CLEARANCE_EPS_M
+                cell.nearest = math.inf
+                scanned.append(((y, x), cell, valid))
+                if valid:
+                    if cell.fresh:
+                        streams.append(_tagged(cell.fresh, cell))
+                elif cell.fresh:
+                    streams.append(_tagged(itertools.chain(cell.checked, cell.fresh), cell))
+                else:
+                    streams.append(_tagged(cell.checked, cell))
+
+        # en orden de posición: lo revisado sin acierto es anterior al retorno
+        for idx, row, cell in heapq.merge(*streams) if len(streams) > 1 else (streams[0] if streams else ()):
+            if best is not None and idx >= best[0]:
+                break
+            d = haversine(c_lat, c_lon, lat_col[row], lon_col[row])
+            if d <= radius_m:
+                return idx, row
+            if d < cell.nearest:
+                cell.nearest = d
+        return best
+
+
+def iter_collapse_stops(
+    track: Track,
+    rows: Iterator[int],
+    stop_radius_m: float,
+    stop_time_s: int,
+    outside_gap_s: int,
+    max_gps_accuracy_m: float,
+    require_good_acc: bool,
+    checkpoints: Optional[List[tuple]] = None,
+) -> Iterator[int]:
+    """
+    Grupos por radio con centroide incremental sobre un flujo de filas; cada grupo que
+    dura al menos stop_time_s (hasta el primer punto FUERA que no vuelve dentro antes
+    de outside_gap_s) se sustituye por su parada (Track.add_stop).
+
+    Solo se retienen las posiciones desde el inicio del grupo actual hasta el final de
+    la ventana outside_gap; en cuanto el grupo ya dura stop_time_s (será parada seguro)
+    se olvida su interior. La ventana es un LookaheadWindow: cada posición se lee, se
+    indexa y se descarta una vez, y las preguntas no vuelven a recorrer la ventana.
+
+    `checkpoints` (opcional) recibe (i, emitidas, horizonte) cada vez que el recorrido
+    empieza en la posición i de la entrada: todo lo emitido antes solo depende de las
+    posiciones < horizonte (math.inf si la decisión dependió del final de la entrada).
+    """
+    lat_col, lon_col, acc_col, ts_col = track.lat, track.lon, track.acc, track.ts
+    outside_gap_us = int(outside_gap_s) * US_PER_S
+
+    buf: deque = deque()    # buf[p] es la posición base + p de la entrada
+    base = 0
+    exhausted = False
+
+    def at(idx):
+        """Fila en la posición idx de la entrada (None si la entrada termina antes)."""
+        nonlocal exhausted
+        while idx - base >= len(buf):
+            if exhausted:
+                return None
+            row = next(rows, None)
+            if row is None:
+                exhausted = True
+                return None
+            buf.append(row)
+        return buf[idx - base]
+
+    def forget(idx):
+        """Libera las posiciones anteriores a idx (ya leídas)."""
+        nonlocal base
+        while base < idx and buf:
+            buf.popleft()
+            base += 1
+
+    def acc_ok(row):
+        if not require_good_acc:
+            return True
+        a = acc_col[row]
+        return not (a > max_gps_accuracy_m)
+
+    window = LookaheadWindow(track, stop_radius_m, acc_ok)
+    emitted = 0
+    i = 0
+    horizon = 0
+
+    while True:
+        first = at(i)
+        if first is None:
+            break
+        # a partir de aquí todas las posiciones llevan la marca "stop"
+        track.stops_annotated = True
+        forget(i)
+        if checkpoints is not None:
+            checkpoints.append((i, emitted, horizon))
+
+        if not acc_ok(first):
+            yield first
+            emitted += 1
+            i += 1
+            horizon = max(horizon, i)
+            continue
+
+        # Grupo por radio con centroide incremental
+        c_lat, c_lon = lat_col[first], lon_col[first]
+        count = 1
+        t_start = ts_col[first]
+        t_last_in = t_start
+        last_in = i
+        j = i
+        is_stop = False     # dwell >= stop_time_s ya garantizado (leave >= t_last_in)
+
+        def close_group(t_next):
+            """
+            Cierra el grupo actual calculando el dwell desde t_start hasta:
+              - t_next, si existe y es el primer punto fuera del radio
+              - t_last_in, si no hay siguiente (fin de lista)
+            """
+            leave_us = t_next if t_next is not None else t_last_in
+            dwell_s = (leave_us - t_start) / US_PER_S
+
+            if dwell_s >= stop_time_s:
+                return [track.add_stop(first, Stop(t_start, t_last_in, leave_us, dwell_s, c_lat, c_lon))]
+            # NO colapsar: conservar puntos originales "dentro"
+            return [buf[p] for p in range(i - base, last_in + 1 - base)]
+
+        while True:
+            nxt = at(j + 1)
+            if nxt is None:
+                # Fin de lista -> cerrar sin t_next (leave = t_last_in)
+                group = close_group(None)
+                i = last_in + 1
+                horizon = math.inf
+                break
+
+            # Siguiente con mala precisión -> ignorar y seguir
+            if not acc_ok(nxt):
+                j += 1
+                continue
+
+            # Distancia al centroide
+            dist_to_center = haversine(c_lat, c_lon, lat_col[nxt], lon_col[nxt])
+
+            if dist_to_center > stop_radius_m:
+                # Siguiente está FUERA del radio -> comprobar si la salida persiste al menos outside_gap_s
+                t_next = ts_col[nxt]
+                returned, beyond = window.find_return(j + 1, t_next + outside_gap_us, c_lat, c_lon, at)
+
+                if returned is None:
+                    # Si no volvió dentro del margen, sí cerramos
+                    group = close_group(t_next)
+                    i = j + 1
+                    horizon = max(horizon, window.hi + 1) if beyond is not None else math.inf
+                    break
+
+                # Ignorar la mini-excursión: continúa el grupo desde el retorno
+                j, nxt = returned
+            else:
+                j += 1
+
+            count += 1
+            last_in = j
+            t_last_in = ts_col[nxt]
+            # actualizar centroide incremental
+            c_lat = (c_lat * (count - 1) + lat_col[nxt]) / count
+            c_lon = (c_lon * (count - 1) + lon_col[nxt]) / count
+
+            if not is_stop and (t_last_in - t_start) / US_PER_S >= stop_time_s:
+                is_stop = True
+            if is_stop:
+                # ya no hará falta conservar el interior del grupo
+                forget(last_in + 1)
+
+        yield from group
+        emitted += len(group)
+
+
+def iter_keep_first_stop(
+    track: Track,
+    rows,
+    same_radius_m: float,
+    reentry_gap_s: int = 0,
+) -> Iterator[int]:
+    """
+    Fusiona paradas consecutivas dentro del mismo radio si la salida entre ellas fue
+    breve. Las paradas ya emitidas se siguen extendiendo (prev_stop) con las que se
+    fusionan después: sus campos solo son definitivos cuando se agota el generador.
+    """
+    prev_stop: Optional[Stop] = None
+
+    for row in rows:
+        stop = track.stops.get(row)
+        if stop is None:
+            yield row
+            continue
+
+        keep = True
+        if prev_stop is not None:
+            d = haversine(prev_stop.center_lat, prev_stop.center_lon, stop.center_lat, stop.center_lon)
+            if d <= same_radius_m:
+                gap_s = (stop.start - prev_stop.leave) / US_PER_S
+
+                if gap_s < float(reentry_gap_s):
+                    # --- FUSIÓN: extender la parada anterior con los tiempos de la actual ---
+                    # stop_end: máximo de ambos
+                    if stop.end > prev_stop.end:
+                        prev_stop.end = stop.end
+
+                    # stop_leave: máximo de ambos
+                    if stop.leave > prev_stop.leave:
+                        prev_stop.leave = stop.leave
+
+                    # Recalcular duración desde su stop_start original
+                    if prev_stop.leave >= prev_stop.start:
+                        prev_stop.duration = int((prev_stop.leave - prev_stop.start) / US_PER_S)
+
+                    keep = False  # descartamos la parada actual porque ya fue fusionada
+
+        if keep:
+            yield row
+            prev_stop = stop
+
+
+def iter_settled_stops(track: Track, rows, reentry_gap_s: int = 0) -> Iterator[int]:
+    """
+    Salida de iter_keep_first_stop en el mismo orden, pero cada parada solo sale cuando
+    sus campos son definitivos: a partir de ella se retienen las filas hasta que llega
+    otra parada conservada o una fila a reentry_gap_s o más de su stop_leave (ninguna
+    parada posterior, que empieza después, puede ya fusionarse con ella).
+    """
+    held: deque = deque()
+    stop: Optional[Stop] = None
+    gap_us = int(reentry_gap_s) * US_PER_S
+
+    for row in rows:
+        new = track.stops.get(row)
+        if stop is not None and (new is not None or track.ts[row] - stop.leave >= gap_us):
+            yield from held
+            held.clear()
+            stop = None
+        if new is not None:
+            stop = new
+        if stop is None:
+            yield row
+        else:
+            held.append(row)
+    yield from held
@@ -0,0 +1,132 @@
+"""Tiempos por etapa de una petición (cabecera Server-Timing) y percentiles móviles por etapa"""
+
+import time
+
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Any, Deque, Dict, Iterable, Iterator, Optional, Sequence
+
+TIMING_WINDOW = 500                 # últimas muestras por etapa con las que se calculan los percentiles
+TIMING_PERCENTILES = (50, 90, 95, 99)
+
+
+class StageTimer:
+    """
+    Duraciones (s) de las etapas de una petición, en el orden en que se miden; si una
+    etapa se mide varias veces, se suman. La usa una sola petición y, mientras el
+    pipeline corre en el executor, un solo hilo: no lleva lock.
+    Con `debug`, las etapas fusionadas se desglosan además (iter_timed), a costa de
+    medir cada fila.
+    """
+
+    __slots__ = ("debug", "stages", "_t0")
+
+    def __init__(self, debug: bool = False) -> None:
+        self.debug = debug
+        self.stages: Dict[str, float] = {}
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def iter_timed(self, name: str, rows: Iterable[int]) -> Iterator[int]:
+        """
+        `rows` tal cual, sumando a `name` el tiempo de cada next(). Es tiempo inclusivo:
+        en una cadena de generadores incluye el de los anteriores (ver exclusive).
+        """
+        it = iter(rows)
+        clock = time.perf_counter
+        spent = 0.0
+        try:
+            while True:
+                t0 = clock()
+                try:
+                    row = next(it)
+                except StopIteration:
+                    spent += clock() - t0
+                    return
+                spent += clock() - t0
+                yield row
+        finally:
+            self.add(name, spent)
+
+    def exclusive(self, names: Sequence[str]) -> None:
+        """Etapas medidas con iter_timed sobre una cadena (en orden) -> tiempo propio de cada una."""
+        prev = 0.0
+        for name in names:
+            if name in self.stages:
+                inclusive = self.stages[name]
+                self.stages[name] = max(0.0, inclusive - prev)
+                prev = inclusive
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def ms(self) -> Dict[str, float]:
+        """Etapas en milisegundos más "total" (desde que se creó el timer)."""
+        out = {name: round(s * 1000.0, 3) for name, s in self.stages.items()}
+        out["total"] = round(self.elapsed() * 1000.0, 3)
+        return out
+
+    def server_timing(self) -> str:
+        """Valor de la cabecera Server-Timing (https://www.w3.org/TR/server-timing/)."""
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.ms().items())
+
+
+def timed(timer: Optional[StageTimer], name: str):
+    """timer.stage(name), o un contexto vacío si no hay timer."""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+class TimingStats:
+    """
+    Últimas TIMING_WINDOW duraciones (ms) por tipo de petición y etapa, y sus percentiles.
+    Solo se usa desde el event loop.
+    """
+
+    def __init__(self, window: int = TIMING_WINDOW) -> None:
+        self._window = window
+        self._samples: Dict[str, Dict[str, Deque[float]]] = {}
+        self._counts: Dict[str, int] = {}
+
+    def record(self, kind: str, timer: StageTimer) -> None:
+        by_stage = self._samples.setdefault(kind, {})
+        for name, ms in timer.ms().items():
+            samples = by_stage.get(name)
+            if samples is None:
+                samples = by_stage[name] = deque(maxlen=self._window)
+            samples.append(ms)
+        self._counts[kind] = self._counts.get(kind, 0) + 1
+
+    def clear(self) -> None:
+        self._samples.clear()
+        self._counts.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """{tipo: {"requests": n, "stages": {etapa: {"samples", "p50", ..., "max"}}}} en ms."""
+        out: Dict[str, Any] = {}
+        for kind, by_stage in self._samples.items():
+            stages = {}
+            for name, samples in by_stage.items():
+                ordered = sorted(samples)
+                row: Dict[str, Any] = {"samples": len(ordered)}
+                for p in TIMING_PERCENTILES:
+                    row[f"p{p}"] = _percentile(ordered, p)
+                row["max"] = ordered[-1]
+                stages[name] = row
+            out[kind] = {"requests": self._counts.get(kind, 0), "stages": stages}
+        return out
+
+
+def _percentile(ordered: Sequence[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada (no vacía)."""
+    k = max(0, min(len(ordered) - 1, -(-len(ordered) * p // 100) - 1))
+    return ordered[int(k)]
@@ -0,0 +1,334 @@
+"""Representación columnar de un track de device_tracker"""
+
+import math
+
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from homeassistant.util import dt as dt_util
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+US_PER_S = 1_000_000
+
+# Claves de batería que lee la tabla del filtro (extractBatteryPercent en filter.js), en su mismo orden
+BATTERY_KEYS = ("battery", "battery_level", "battery_percent", "battery_percentage", "battery_level_pct", "batteryLevel")
+# Perfil por defecto de la respuesta (fields=compact): lo que usan el mapa, la tabla y los exportadores
+COMPACT_FIELDS = ("latitude", "longitude", "gps_accuracy", "speed") + BATTERY_KEYS
+TOP_LEVEL_FIELDS = ("state", "last_changed")        # campos del State (no de attributes) que se pueden pedir
+STOP_OVERRIDES = ("latitude", "longitude", "speed")  # atributos que una parada sustituye por los suyos
+
+
+def dt_to_us(value: datetime) -> int:
+    """datetime -> microsegundos desde epoch (entero exacto, sin pérdida por float)."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def us_to_iso(us: int) -> str:
+    """Microsegundos desde epoch -> ISO 8601 en UTC (mismo formato que datetime.isoformat())."""
+    return (EPOCH + timedelta(microseconds=us)).isoformat()
+
+
+def _float_or_nan(value) -> float:
+    if value is None:
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def normalize_attributes(attributes) -> Dict[str, Any]:
+    """
+    Atributos de un State con la velocidad normalizada:
+      - speedMps (m/s) o velocity (OwnTracks, km/h) -> speed (m/s)
+      - speed negativa -> 0.0
+    Si no hay nada que cambiar devuelve el MISMO objeto (sin copia); si lo hay, una
+    copia. Nunca modifica `attributes`: el resultado se trata como de solo lectura.
+    """
+    attrs = attributes
+
+    # speedMps / velocity -> speed (m/s)
+    if "speed" not in attrs:
+        # Prioridad: speedMps (ya viene en m/s)
+        if "speedMps" in attrs:
+            try:
+                speed = round(float(attrs["speedMps"]), 2)
+                attrs = dict(attrs)
+                attrs["speed"] = speed
+            except (TypeError, ValueError):
+                pass
+        # Alternativa: OwnTracks "velocity" (km/h -> m/s)
+        elif "velocity" in attrs:
+            attrs = dict(attrs)
+            try:
+                attrs["speed"] = round(float(attrs.pop("velocity")) / 3.6, 2)
+            except (TypeError, ValueError):
+                pass
+
+    # Normaliza speed: si es numérica y < 0 -> 0.0
+    try:
+        spd = float(attrs.get("speed"))
+        if math.isfinite(spd) and spd < 0:
+            if attrs is attributes:
+                attrs = dict(attrs)
+            attrs["speed"] = 0.0
+    except (TypeError, ValueError):
+        pass
+
+    return attrs
+
+
+class Stop:
+    """Marcas de una parada colapsada en su punto representativo."""
+
+    __slots__ = ("start", "end", "leave", "duration", "center_lat", "center_lon")
+
+    def __init__(self, start: int, end: int, leave: int, duration, center_lat: float, center_lon: float) -> None:
+        self.start = start              # us
+        self.end = end                  # us (último punto dentro)
+        self.leave = leave              # us (primer punto fuera o fin)
+        self.duration = duration        # s (float al detectar, int tras fusionar)
+        self.center_lat = center_lat
+        self.center_lon = center_lon
+
+
+class Projection:
+    """
+    Campos de cada posición en la respuesta (parámetro fields=). last_updated y las marcas
+    de parada van siempre; entity_id y los atributos que valen lo mismo en todas las
+    posiciones enviadas se mandan una sola vez en la cabecera (ver header()).
+    """
+
+    __slots__ = ("attrs", "state", "last_changed", "hoisted")
+
+    def __init__(self, fields: Iterable[str]) -> None:
+        fields = list(dict.fromkeys(fields))
+        self.state = "state" in fields
+        self.last_changed = "last_changed" in fields
+        self.attrs = tuple(f for f in fields if f not in TOP_LEVEL_FIELDS)
+        self.hoisted: Dict[str, Any] = {}
+
+    def header(self, track: Optional["Track"], sel) -> Dict[str, Any]:
+        """Constantes de la respuesta para las filas `sel` (fija `hoisted`; llamar antes de serializar)."""
+        self.hoisted = {}
+        entity_id = None
+        if len(sel):
+            entity_id = track.states[track.origin[sel[0]]].entity_id
+            attrs_list, origin = track.attrs, track.origin
+            missing = object()
+            for key in self.attrs:
+                if key in STOP_OVERRIDES:
+                    continue
+                value = attrs_list[origin[sel[0]]].get(key, missing)
+                if value is missing:
+                    continue
+                if all(attrs_list[origin[r]].get(key, missing) == value for r in sel):
+                    self.hoisted[key] = value
+
+        fields = ["last_updated"]
+        if self.state:
+            fields.append("state")
+        if self.last_changed:
+            fields.append("last_changed")
+        fields.extend(f"attributes.{k}" for k in self.attrs)
+        return {"entity_id": entity_id, "fields": fields, "attributes": dict(self.hoisted)}
+
+
+class Track:
+    """
+    Track en columnas paralelas construido UNA vez desde los State del recorder:
+      - lat, lon, acc, speed: array('d') (NaN = desconocido)
+      - ts: array('q') con microsegundos desde epoch (exacto, sin re-parseos ISO)
+      - origin: fila original de la que procede cada fila (las paradas se añaden
+        como filas derivadas que comparten atributos con su punto ancla)
+      - attrs / states: índice de vuelta a atributos y State para serializar al final
+
+    Las etapas del pipeline trabajan con selecciones (array('l') de índices de fila).
+    """
+
+    __slots__ = ("lat", "lon", "acc", "speed", "ts", "origin", "attrs", "states", "stops", "stops_annotated")
+
+    def __init__(self) -> None:
+        self.lat = array("d")
+        self.lon = array("d")
+        self.acc = array("d")
+        self.speed = array("d")
+        self.ts = array("q")
+        self.origin = array("l")
+        self.attrs: List[Dict[str, Any]] = []
+        self.states: List[Any] = []
+        self.stops: Dict[int, Stop] = {}
+        self.stops_annotated = False
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    @classmethod
+    def from_states(cls, states: Iterable[Any]) -> "Track":
+        """Descarta estados sin lat/lon numéricos; el resto se convierte a columnas."""
+        track = cls()
+        track.extend(states)
+        return track
+
+    def extend(self, states: Iterable[Any]) -> None:
+        """Añade estados (ya ordenados) como filas nuevas al final del track."""
+        lat_col, lon_col, acc_col, speed_col, ts_col = self.lat, self.lon, self.acc, self.speed, self.ts
+        origin, attrs_list, states_list = self.origin, self.attrs, self.states
+        # Filas seguidas con el mismo dict de atributos (blob compartido del recorder o
+        # de la caché de atributos): se normaliza una vez
+        last_in = last_out = None
+
+        for state in states:
+            latitude = state.attributes.get("latitude")
+            longitude = state.attributes.get("longitude")
+            if latitude is None or longitude is None:
+                continue
+            try:
+                latitude = float(latitude)
+                longitude = float(longitude)
+            except (TypeError, ValueError):
+                continue
+
+            if state.attributes is not last_in:
+                last_in = state.attributes
+                last_out = normalize_attributes(last_in)
+            attrs = last_out
+
+            origin.append(len(states_list))
+            lat_col.append(latitude)
+            lon_col.append(longitude)
+            acc_col.append(_float_or_nan(attrs.get("gps_accuracy", attrs.get("accuracy"))))
+            speed_col.append(_float_or_nan(attrs.get("speed")))
+            ts_col.append(dt_to_us(dt_util.as_utc(state.last_updated)))
+            attrs_list.append(attrs)
+            states_list.append(state)
+
+    def add_stop(self, row: int, stop: Stop) -> int:
+        """Añade el representativo de una parada (fila derivada de `row`) y devuelve su índice."""
+        new_row = len(self.ts)
+        self.lat.append(stop.center_lat)
+        self.lon.append(stop.center_lon)
+        self.acc.append(self.acc[row])
+        self.speed.append(0.0)
+        self.ts.append(self.ts[row])
+        self.origin.append(self.origin[row])
+        self.stops[new_row] = stop
+        return new_row
+
+    def stop_of(self, row: int) -> Optional[Stop]:
+        return self.stops.get(row)
+
+    def mark(self) -> Tuple[int, int]:
+        """Punto de restauración para truncate(): (filas, estados origen)."""
+        return len(self.ts), len(self.states)
+
+    def truncate(self, mark: Tuple[int, int], keep: Iterable[int] = ()) -> Dict[int, int]:
+        """
+        Elimina las filas añadidas después de `mark`. Las filas derivadas de `keep`
+        (paradas ancladas a estados anteriores a la marca) se vuelven a añadir al final.
+        Devuelve {fila antigua: fila nueva} de las conservadas.
+        """
+        n_rows, n_src = mark
+        saved = []
+        for row in keep:
+            if row < n_rows:
+                continue
+            if self.origin[row] >= n_src or row not in self.stops:
+                raise ValueError(f"row {row} cannot be kept across truncate")
+            saved.append((row, self.lat[row], self.lon[row], self.acc[row], self.speed[row],
+                          self.ts[row], self.origin[row], self.stops[row]))
+
+        for col in (self.lat, self.lon, self.acc, self.speed, self.ts, self.origin):
+            del col[n_rows:]
+        del self.attrs[n_src:]
+        del self.states[n_src:]
+        for row in [r for r in self.stops if r >= n_rows]:
+            del self.stops[row]
+
+        moved = {}
+        for row, lat, lon, acc, speed, ts, src, stop in saved:
+            new_row = len(self.ts)
+            self.lat.append(lat)
+            self.lon.append(lon)
+            self.acc.append(acc)
+            self.speed.append(speed)
+            self.ts.append(ts)
+            self.origin.append(src)
+            self.stops[new_row] = stop
+            moved[row] = new_row
+        return moved
+
+    # ----------------------------
+    # Serialización (solo al final del pipeline)
+    # ----------------------------
+    def position(self, row: int, proj: Optional[Projection] = None) -> Dict[str, Any]:
+        """Fila -> dict con la forma JSON histórica del endpoint (o solo los campos de `proj`)."""
+        if proj is not None:
+            return self._projected(row, proj)
+
+        src = self.origin[row]
+        state = self.states[src]
+        stop = self.stops.get(row)
+
+        if stop is None:
+            attrs = self.attrs[src]
+        else:
+            attrs = dict(self.attrs[src])
+            # coords visibles al centroide
+            attrs["latitude"] = self.lat[row]
+            attrs["longitude"] = self.lon[row]
+            attrs["speed"] = 0.0
+
+        pos = {
+            "entity_id": state.entity_id,
+            "state": state.state,
+            "attributes": attrs,
+            "last_updated": state.last_updated.isoformat(),
+            "last_changed": state.last_changed.isoformat(),
+        }
+        self._stop_fields(pos, stop)
+        return pos
+
+    def _projected(self, row: int, proj: Projection) -> Dict[str, Any]:
+        src = self.origin[row]
+        state = self.states[src]
+        stop = self.stops.get(row)
+        attrs = self.attrs[src]
+        hoisted = proj.hoisted
+
+        out = {k: attrs[k] for k in proj.attrs if k in attrs and k not in hoisted}
+        if stop is not None:
+            for key, value in (("latitude", self.lat[row]), ("longitude", self.lon[row]), ("speed", 0.0)):
+                if key in proj.attrs:
+                    out[key] = value
+
+        pos = {"last_updated": state.last_updated.isoformat()}
+        if proj.state:
+            pos["state"] = state.state
+        if proj.last_changed:
+            pos["last_changed"] = state.last_changed.isoformat()
+        pos["attributes"] = out
+        self._stop_fields(pos, stop)
+        return pos
+
+    def _stop_fields(self, pos: Dict[str, Any], stop: Optional[Stop]) -> None:
+        if self.stops_annotated:
+            pos["stop"] = stop is not None
+        if stop is not None:
+            pos["stop_start"] = us_to_iso(stop.start)
+            pos["stop_end"] = us_to_iso(stop.end)
+            pos["stop_leave"] = us_to_iso(stop.leave)
+            pos["stop_duration_s"] = stop.duration
+            pos["stop_center_lat"] = stop.center_lat
+            pos["stop_center_lon"] = stop.center_lon
+
+    def to_positions(self, sel: Iterable[int], proj: Optional[Projection] = None) -> List[Dict[str, Any]]:
+        return [self.position(r, proj) for r in sel]
+
+    def iter_positions(self, sel: Iterable[int], proj: Optional[Projection] = None) -> Iterator[Dict[str, Any]]:
+        """Como to_positions, pero sin materializar la lista (respuesta por streaming)."""
+        for r in sel:
+            yield self.position(r, proj)
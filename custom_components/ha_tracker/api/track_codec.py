@@ -0,0 +1,163 @@
+"""Codificación compacta de las posiciones filtradas: columnas enteras con deltas (polyline o binario)"""
+
+import json
+import math
+import struct
+import sys
+
+from array import array
+from typing import Any, Dict, List, Optional, Union
+
+from .track import BATTERY_KEYS, Track, US_PER_S
+
+ENCODINGS = ("polyline", "binary")
+BINARY_CONTENT_TYPE = "application/vnd.ha-tracker.track"
+POLYLINE_CONTENT_TYPE = "application/vnd.ha-tracker.polyline+json"
+BINARY_MAGIC = b"HTK1"
+
+# Escalas de cuantización (valor entero = valor * escala). -1 = desconocido en las no delta.
+SCALES = {"latitude": 1_000_000, "longitude": 1_000_000, "speed": 100, "gps_accuracy": 10, "battery": 100}
+COLUMNS = ("latitude", "longitude", "t", "speed", "gps_accuracy", "battery")
+DELTA_COLUMNS = ("latitude", "longitude", "t")
+
+_INT32_MAX = 2**31 - 1
+
+
+def _quantize(value: float, scale: int) -> int:
+    """Valor >= 0 -> entero escalado; NaN, negativo o fuera de rango -> -1."""
+    if not math.isfinite(value) or value < 0:
+        return -1
+    return min(_INT32_MAX, int(round(value * scale)))
+
+
+def _battery(attrs: Dict[str, Any]) -> float:
+    """Primera clave de BATTERY_KEYS presente: la misma que mostraría la tabla con el JSON."""
+    value = next((attrs[k] for k in BATTERY_KEYS if k in attrs), None)
+    if isinstance(value, str):
+        value = value.strip().rstrip("%").strip()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class EncodedTrack:
+    """
+    Posiciones de una respuesta como columnas enteras (ver COLUMNS y SCALES):
+      - latitude / longitude: microgrados, delta respecto a la posición anterior
+      - t: segundos desde epoch, delta respecto a la anterior (la primera respecto a t0).
+        last_updated se trunca al segundo: dos posiciones del mismo segundo salen con
+        la misma hora (en JSON conservan los microsegundos); los campos de parada
+        conservan su precisión completa
+      - speed (cm/s), gps_accuracy (dm), battery (centésimas de %): valores absolutos.
+        battery sale de la primera clave de BATTERY_KEYS y se decodifica como battery_level
+    Las paradas van aparte, indexadas por posición. Se construye antes de que el
+    track se trunque (modo incremental) y no guarda referencias a él.
+    """
+
+    __slots__ = ("entity_id", "t0", "count", "columns", "stops", "stops_annotated")
+
+    def __init__(self, track: Optional[Track], sel) -> None:
+        self.entity_id = None
+        self.t0 = 0
+        self.count = len(sel)
+        self.columns: Dict[str, array] = {name: array("i") for name in COLUMNS}
+        self.stops: List[Dict[str, Any]] = []
+        self.stops_annotated = bool(track is not None and track.stops_annotated)
+        if not self.count:
+            return
+
+        lat_col, lon_col, acc_col, speed_col, ts_col = track.lat, track.lon, track.acc, track.speed, track.ts
+        origin, attrs_list = track.origin, track.attrs
+        c_lat, c_lon, c_t = self.columns["latitude"], self.columns["longitude"], self.columns["t"]
+        c_speed, c_acc, c_bat = self.columns["speed"], self.columns["gps_accuracy"], self.columns["battery"]
+        k_coord, k_speed, k_acc, k_bat = SCALES["latitude"], SCALES["speed"], SCALES["gps_accuracy"], SCALES["battery"]
+
+        self.entity_id = track.states[origin[sel[0]]].entity_id
+        self.t0 = prev_t = ts_col[sel[0]] // US_PER_S
+        prev_lat = prev_lon = 0
+        for i, row in enumerate(sel):
+            lat = int(round(lat_col[row] * k_coord))
+            lon = int(round(lon_col[row] * k_coord))
+            t = ts_col[row] // US_PER_S
+            c_lat.append(lat - prev_lat)
+            c_lon.append(lon - prev_lon)
+            c_t.append(t - prev_t)
+            prev_lat, prev_lon, prev_t = lat, lon, t
+
+            c_speed.append(_quantize(speed_col[row], k_speed))
+            c_acc.append(_quantize(acc_col[row], k_acc))
+            c_bat.append(_quantize(_battery(attrs_list[origin[row]]), k_bat))
+
+            stop = track.stop_of(row)
+            if stop is not None:
+                pos = {"i": i}
+                track._stop_fields(pos, stop)
+                pos.pop("stop", None)
+                self.stops.append(pos)
+
+    def meta(self, encoding: str, extra: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "header": {"entity_id": self.entity_id},
+            "encoding": encoding,
+            "count": self.count,
+            "t0": self.t0,
+            "columns": list(COLUMNS),
+            "delta": list(DELTA_COLUMNS),
+            "scales": dict(SCALES),
+            "stops_annotated": self.stops_annotated,
+            "stops": self.stops,
+            **extra,
+        }
+
+
+# ----------------------------
+# Polyline (algoritmo de Google: zigzag + bloques de 5 bits en ASCII 63..126)
+# ----------------------------
+def polyline_encode(values) -> str:
+    out = []
+    append = out.append
+    for v in values:
+        v = ~(v << 1) if v < 0 else v << 1
+        while v >= 0x20:
+            append(chr((0x20 | (v & 0x1F)) + 63))
+            v >>= 5
+        append(chr(v + 63))
+    return "".join(out)
+
+
+def encode_polyline(enc: EncodedTrack, extra: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON con una cadena polyline por columna (lat/lon intercaladas, como una polyline de precisión 6)."""
+    cols = enc.columns
+    coords = array("i", bytes(8 * enc.count))
+    coords[0::2] = cols["latitude"]
+    coords[1::2] = cols["longitude"]
+    data = {"coords": polyline_encode(coords)}
+    for name in COLUMNS[2:]:
+        data[name] = polyline_encode(cols[name])
+    payload = enc.meta("polyline", extra)
+    payload["data"] = data
+    return payload
+
+
+# ----------------------------
+# Binario: "HTK1" | u32 largo JSON | JSON utf-8 | relleno a 4 | columnas int32 (LE)
+# ----------------------------
+def encode_binary(enc: EncodedTrack, extra: Dict[str, Any]) -> bytes:
+    meta = json.dumps(enc.meta("binary", extra), separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+    head = BINARY_MAGIC + struct.pack("<I", len(meta)) + meta
+    parts = [head, b"\0" * (-len(head) % 4)]
+    for name in COLUMNS:
+        col = enc.columns[name]
+        if sys.byteorder != "little":
+            col = array("i", col)
+            col.byteswap()
+        parts.append(col.tobytes())
+    return b"".join(parts)
+
+
+def encode_payload(encoding: str, enc: EncodedTrack, extra: Dict[str, Any]) -> Union[Dict[str, Any], bytes]:
+    """Respuesta final en `encoding` (ENCODINGS); `extra` son las demás claves (summary, zones, cursor...)."""
+    if encoding == "binary":
+        return encode_binary(enc, extra)
+    return encode_polyline(enc, extra)
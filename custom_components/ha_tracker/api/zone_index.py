@@ -0,0 +1,233 @@
+"""Índice espacial (rejilla) de zonas y cruce analítico tramo-círculo"""
+
+import math
+
+from collections import defaultdict
+from typing import Any, Dict, List, Sequence, Tuple
+
+from .kernels import EARTH_RADIUS_M, haversine
+
+ZONE_GRID_DEG = 0.01          # tamaño de celda (~1.1 km en latitud)
+ZONE_MAX_CELLS = 1024         # zonas que cubren más celdas se comprueban siempre
+
+M_PER_DEG = EARTH_RADIUS_M * math.pi / 180.0   # metros por grado (misma esfera que haversine)
+SPLIT_EPS_T = 1e-9            # subtramos más cortos (en t) se funden con el anterior
+
+
+class ZoneIndex:
+    """
+    Rejilla fija en grados sobre las bounding boxes de las zonas.
+
+    Cada celda guarda las zonas cuya bbox la toca, en el MISMO orden que la lista
+    original, de modo que el desempate por centro más cercano de _zone_of da el
+    mismo resultado que el recorrido lineal. Es inmutable una vez construido:
+    se puede compartir entre hilos del executor.
+    """
+
+    __slots__ = ("zones", "cell_deg", "_cells", "_always")
+
+    def __init__(self, zones: List[Dict[str, Any]], cell_deg: float = ZONE_GRID_DEG) -> None:
+        self.zones = list(zones)
+        self.cell_deg = float(cell_deg)
+
+        cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        always: List[int] = []
+        for idx, z in enumerate(self.zones):
+            try:
+                i0, i1 = self._key(z["lat_min"]), self._key(z["lat_max"])
+                j0, j1 = self._key(z["lon_min"]), self._key(z["lon_max"])
+            except (KeyError, TypeError, ValueError, OverflowError):
+                always.append(idx)
+                continue
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > ZONE_MAX_CELLS:
+                always.append(idx)
+                continue
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    cells[(i, j)].append(idx)
+
+        # Fusionar las zonas "siempre" en cada celda respetando el orden original
+        self._always: Tuple[Dict[str, Any], ...] = tuple(self.zones[k] for k in always)
+        self._cells: Dict[Tuple[int, int], Tuple[Dict[str, Any], ...]] = {
+            key: tuple(self.zones[k] for k in sorted(set(lst) | set(always)))
+            for key, lst in cells.items()
+        }
+
+    def _key(self, deg: float) -> int:
+        return math.floor(float(deg) / self.cell_deg)
+
+    def __iter__(self):
+        return iter(self.zones)
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+    def candidates(self, lat: float, lon: float) -> Sequence[Dict[str, Any]]:
+        """Zonas cuya bbox puede contener el punto (superconjunto exacto)."""
+        try:
+            key = (self._key(lat), self._key(lon))
+        except (ValueError, OverflowError):
+            # NaN/Inf: ninguna bbox lo contiene
+            return ()
+        return self._cells.get(key, self._always)
+
+    def candidates_bbox(self, lat1: float, lon1: float, lat2: float, lon2: float) -> Sequence[Dict[str, Any]]:
+        """Zonas cuya bbox puede tocar el rectángulo (lat1, lon1)-(lat2, lon2), en el orden original."""
+        try:
+            i0, i1 = sorted((self._key(lat1), self._key(lat2)))
+            j0, j1 = sorted((self._key(lon1), self._key(lon2)))
+        except (ValueError, OverflowError):
+            return ()
+        if i0 == i1 and j0 == j1:
+            return self._cells.get((i0, j0), self._always)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > ZONE_MAX_CELLS:
+            return self.zones
+
+        seen = {id(z) for z in self._always}
+        cells = self._cells
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                for z in cells.get((i, j), ()):
+                    seen.add(id(z))
+        return [z for z in self.zones if id(z) in seen]
+
+
+# --------------------------------------------
+# Cruce analítico tramo - zonas
+# --------------------------------------------
+def _slab(v1: float, v2: float, vmin: float, vmax: float, t0: float, t1: float) -> Tuple[float, float]:
+    """Recorta [t0, t1] al intervalo donde v1 + t·(v2 - v1) está en [vmin, vmax]."""
+    dv = v2 - v1
+    if dv == 0.0:
+        return (t0, t1) if vmin <= v1 <= vmax else (1.0, 0.0)
+    ta = (vmin - v1) / dv
+    tb = (vmax - v1) / dv
+    if ta > tb:
+        ta, tb = tb, ta
+    return max(t0, ta), min(t1, tb)
+
+
+def _zone_interval(lat1: float, lon1: float, lat2: float, lon2: float, z: Dict[str, Any]) -> Tuple[float, float]:
+    """
+    Intervalo [ta, tb] ⊂ [0, 1] del tramo (interpolado linealmente en lat/lon, como
+    _interp_latlon) que cae dentro de la zona: círculo ∩ bbox, igual que _zone_of.
+    El círculo se resuelve en forma cerrada en una proyección equirectangular local
+    centrada en la zona. Devuelve ta > tb si no hay intersección.
+    """
+    # bbox (lineal en t): misma condición previa que _zone_of
+    ta, tb = _slab(lat1, lat2, z["lat_min"], z["lat_max"], 0.0, 1.0)
+    if ta > tb:
+        return ta, tb
+    ta, tb = _slab(lon1, lon2, z["lon_min"], z["lon_max"], ta, tb)
+    if ta > tb:
+        return ta, tb
+
+    # círculo: |A + t·D|² = r²
+    clat = z["latitude"]
+    kx = M_PER_DEG * math.cos(math.radians(clat))
+    ax = (lon1 - z["longitude"]) * kx
+    ay = (lat1 - clat) * M_PER_DEG
+    dx = (lon2 - lon1) * kx
+    dy = (lat2 - lat1) * M_PER_DEG
+    r = z["radius_m"]
+
+    qa = dx * dx + dy * dy
+    qb = ax * dx + ay * dy                      # mitad del término lineal
+    qc = ax * ax + ay * ay - r * r
+    if qa == 0.0:
+        return (ta, tb) if qc <= 0.0 else (1.0, 0.0)
+    disc = qb * qb - qa * qc
+    if disc < 0.0:
+        return 1.0, 0.0
+    sq = math.sqrt(disc)
+    return max(ta, (-qb - sq) / qa), min(tb, (-qb + sq) / qa)
+
+
+def _nearest(hits, lat: float, lon: float, t: float) -> str:
+    """Zona de centro más cercano entre las que contienen t (empate -> primera, como _zone_of)."""
+    best_d = None
+    name = ""
+    for z, ta, tb in hits:
+        if ta <= t <= tb:
+            d = haversine(lat, lon, z["latitude"], z["longitude"])
+            if best_d is None or d < best_d:
+                best_d, name = d, z["name"]
+    return name
+
+
+def split_segment_by_zones(lat1: float, lon1: float, lat2: float, lon2: float, zones) -> List[Tuple[str, float, float]]:
+    """
+    Divide el tramo en subtramos homogéneos por zona: [(zona, t0, t1), ...] cubriendo [0, 1].
+
+    Cada zona aporta su intervalo de entrada/salida exacto (_zone_interval). Donde se solapan
+    varias, el tramo se corta además en los puntos equidistantes a cada par de centros, y cada
+    pieza se asigna con la regla de _zone_of (centro más cercano, empate -> primera zona).
+    """
+    if isinstance(zones, ZoneIndex):
+        cands = zones.candidates_bbox(lat1, lon1, lat2, lon2)
+    else:
+        cands = zones or ()
+
+    lat_lo, lat_hi = (lat1, lat2) if lat1 <= lat2 else (lat2, lat1)
+    lon_lo, lon_hi = (lon1, lon2) if lon1 <= lon2 else (lon2, lon1)
+
+    hits = []                                   # (zona, ta, tb) en el orden original
+    for z in cands:
+        if z["lat_min"] > lat_hi or z["lat_max"] < lat_lo or z["lon_min"] > lon_hi or z["lon_max"] < lon_lo:
+            continue
+        ta, tb = _zone_interval(lat1, lon1, lat2, lon2, z)
+        if ta <= tb:
+            hits.append((z, ta, tb))
+
+    if not hits:
+        return [("", 0.0, 1.0)]
+
+    cuts = [0.0, 1.0]
+    for _, ta, tb in hits:
+        cuts.append(ta)
+        cuts.append(tb)
+
+    if len(hits) > 1:
+        # Cambio de centro más cercano dentro de un solape: d_i² - d_j² es lineal en t
+        # (proyección común del tramo).
+        kx = M_PER_DEG * math.cos(math.radians((lat1 + lat2) / 2.0))
+        dx = (lon2 - lon1) * kx
+        dy = (lat2 - lat1) * M_PER_DEG
+        proj = []
+        for z, ta, tb in hits:
+            ax = (lon1 - z["longitude"]) * kx
+            ay = (lat1 - z["latitude"]) * M_PER_DEG
+            proj.append((ax * ax + ay * ay, ax * dx + ay * dy, ta, tb))
+        for i in range(len(proj)):
+            ni, li, tai, tbi = proj[i]
+            for j in range(i + 1, len(proj)):
+                nj, lj, taj, tbj = proj[j]
+                lo, hi = max(tai, taj), min(tbi, tbj)
+                den = 2.0 * (li - lj)
+                if lo < hi and den != 0.0:
+                    t = (nj - ni) / den
+                    if lo < t < hi:
+                        cuts.append(t)
+
+    cuts.sort()
+    segs: List[Tuple[str, float, float]] = []
+    t0 = 0.0
+    for t1 in cuts:
+        if t1 - t0 <= SPLIT_EPS_T:
+            continue
+
+        tm = (t0 + t1) / 2.0
+        name = _nearest(hits, lat1 + (lat2 - lat1) * tm, lon1 + (lon2 - lon1) * tm, tm)
+
+        if segs and segs[-1][0] == name:
+            segs[-1] = (name, segs[-1][1], t1)
+        else:
+            segs.append((name, t0, t1))
+        t0 = t1
+
+    if not segs:
+        return [(_nearest(hits, lat1, lon1, 0.0), 0.0, 1.0)]
+    if t0 < 1.0:
+        # la última pieza (más corta que SPLIT_EPS_T) se funde con la anterior
+        segs[-1] = (segs[-1][0], segs[-1][1], 1.0)
+    return segs
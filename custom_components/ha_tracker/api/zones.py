@@ -11,6 +11,8 @@ from datetime import datetime
 
 from homeassistant.components.http import HomeAssistantView
 
+from .metrics import instrumented
+
 DOMAIN = __package__.split(".")[-2]
 
 _LOGGER = logging.getLogger(__name__)
@@ -28,6 +30,7 @@ class ZonesAPI(HomeAssistantView):
     name = "api:ha_tracker/zones"
     requires_auth = True
 
+    @instrumented("zones")
     async def get(self, request):
         """Devuelve las zonas"""
 
@@ -105,6 +108,7 @@ class ZonesAPI(HomeAssistantView):
 
         return self.json(normalized)
 
+    @instrumented("zones")
     async def post(self, request):
         """Crear una nueva zona."""
 
@@ -167,6 +171,7 @@ class ZonesAPI(HomeAssistantView):
         msg = {"success": True, "message": "Zone created", "id": data["id"]}
         return self.json(msg)
 
+    @instrumented("zones")
     async def delete(self, request):
         """Eliminar una zona."""
 
@@ -207,6 +212,7 @@ class ZonesAPI(HomeAssistantView):
 
         return self.json({"success": True, "message": "Zone deleted successfully"})
 
+    @instrumented("zones")
     async def put(self, request):
         """Actualizar una zona existente (admite actualización parcial)."""
 
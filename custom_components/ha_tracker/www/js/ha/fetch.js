@@ -7,13 +7,64 @@ import { getToken } from './auth.js';
 import { setDevices, setPersons } from '../screens/persons.js';
 import { setZones } from '../screens/zones.js';
 import { setFilter } from '../screens/filter.js';
+import { decodeTrack, TRACK_BINARY_TYPE } from '../utils/trackcodec.js';
+
+// Cuerpo NDJSON registro a registro, según llega: onRecord(objeto) por cada línea no vacía
+async function forEachNdjson(response, onRecord) {
+    const handleLine = (line) => {
+        if (line.trim()) onRecord(JSON.parse(line));
+    };
+
+    if (!response.body || !response.body.getReader) {
+        (await response.text()).split('\n').forEach(handleLine);
+    } else {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let pending = '';
+        for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            pending += decoder.decode(value, { stream: true });
+            const lines = pending.split('\n');
+            pending = lines.pop();
+            lines.forEach(handleLine);
+        }
+        handleLine(pending + decoder.decode());
+    }
+}
+
+// Respuesta NDJSON (stream=1): una línea por posición y después registros de una
+// sola clave ({"summary": ...}, {"zones": [...]}, ...) que acaban en {"end": true}
+async function readNdjson(response) {
+    const out = { positions: [] };
+    let complete = false;
+
+    await forEachNdjson(response, (rec) => {
+        const keys = Object.keys(rec);
+        if (keys.length !== 1) {
+            out.positions.push(rec);
+        } else if (keys[0] === 'end') {
+            complete = true;
+        } else if (keys[0] === 'error') {
+            throw new Error(`Stream error: ${rec.error}`);
+        } else {
+            out[keys[0]] = rec[keys[0]];
+        }
+    });
+
+    if (!complete) {
+        throw new Error("Truncated NDJSON response.");
+    }
+    return out;
+}
 
 async function fetchData(
     url, {
     method = 'GET',
     headers = {},
     body,
-    timeoutMs = 15000
+    timeoutMs = 15000,
+    onRecord
 } = {},
     authRequired = true) {
     const controller = new AbortController();
@@ -91,6 +142,17 @@ async function fetchData(
         }
 
         // OK 2xx “normal”
+        if (contentType.includes('application/x-ndjson')) {
+            if (onRecord) {
+                // el llamador procesa cada registro según llega
+                await forEachNdjson(response, onRecord);
+                return null;
+            }
+            return await readNdjson(response);
+        }
+        if (contentType.includes(TRACK_BINARY_TYPE)) {
+            return decodeTrack(await response.arrayBuffer());
+        }
         if (contentType.includes('application/json')) {
             return await response.json();
         }
@@ -127,6 +189,40 @@ export async function fetchReverseGeocode(lat, lon) {
     }
 }
 
+// Varias coordenadas en un solo POST. onResult(rec) por cada punto en cuanto se resuelve
+// (rec.i = índice en points; mismo payload que fetchReverseGeocode, o error/retry_after).
+// Los que no llegan en maxWait segundos vuelven como {error:'queued', retry_after:n}.
+export async function fetchReverseGeocodeBatch(points, onResult, maxWait = 8) {
+    if (!Array.isArray(points) || !points.length) {
+        return null;
+    }
+    const url = `${haUrl}/api/ha_tracker/reverse_geocode/batch?stream=1`;
+    const body = JSON.stringify({
+        points: points.map(([lat, lon]) => [Number(lat), Number(lon)]),
+        max_wait: maxWait,
+    });
+
+    let end = null;
+    try {
+        await fetchData(url, {
+            method: 'POST',
+            body,
+            timeoutMs: (maxWait + 7) * 1000,
+            onRecord: (rec) => {
+                if (rec.end) end = rec;
+                else onResult?.(rec);
+            },
+        });
+    } catch (error) {
+        console.error("Error getting batch reverse geocode:", error);
+        throw error;
+    }
+    if (!end) {
+        throw new Error("Truncated NDJSON response.");
+    }
+    return end; // resumen: points, hits, fetched, queued, errors
+}
+
 export async function fetchResetReverseGeocodeCache() {
     const u = new URL(`${haUrl}/api/ha_tracker/reverse_geocode`);
     u.searchParams.set("reset", "all");
@@ -326,16 +422,59 @@ export async function createZone(name, radius, latitude, longitude, icon = "mdi:
     }
 }
 
+// Respuesta proyectada (fields=, por defecto el perfil compacto): entity_id y los
+// atributos que valen lo mismo en todas las posiciones llegan una sola vez en `header`
+function expandHeader(data) {
+    const header = data?.header;
+    if (!header || !Array.isArray(data.positions)) {
+        return data;
+    }
+    const shared = header.attributes || {};
+    const hasShared = Object.keys(shared).length > 0;
+    for (const p of data.positions) {
+        p.entity_id = header.entity_id;
+        if (hasShared) {
+            p.attributes = { ...shared, ...p.attributes };
+        }
+    }
+    return data;
+}
+
+// Última respuesta incremental (rango que termina en "ahora"): se reenvía el cursor
+// y el servidor solo devuelve las posiciones a partir de `base`
+let filterCursor = null;
+
 export async function fetchFilteredPositions(person_id, startDate, endDate) {
     if (!person_id || !startDate || !endDate) {
         console.error("The person_id, startDate and endDate parameters are required.");
         return;
     }
 
-    const url = `${haUrl}/api/ha_tracker/filtered_positions?person_id=${encodeURIComponent(person_id)}&start_date=${encodeURIComponent(startDate)}&end_date=${encodeURIComponent(endDate)}`;
+    let url = `${haUrl}/api/ha_tracker/filtered_positions?person_id=${encodeURIComponent(person_id)}&start_date=${encodeURIComponent(startDate)}&end_date=${encodeURIComponent(endDate)}&format=binary`;
+
+    const key = `${person_id}|${startDate}`;
+    const live = new Date(endDate).getTime() >= Date.now();
+    const prev = (live && filterCursor && filterCursor.key === key) ? filterCursor : null;
+    if (live) {
+        url += prev ? `&cursor=${encodeURIComponent(prev.cursor)}` : '&incremental=1';
+    }
 
     try {
-        const data = await fetchData(url);
+        const data = expandHeader(await fetchData(url));
+
+        if (data && data.cursor && Array.isArray(data.positions)) {
+            const base = Number(data.base) || 0;
+            if (base > 0 && !(prev && base <= prev.positions.length)) {
+                // delta sobre una copia que ya no tenemos: pedir todo de nuevo
+                filterCursor = null;
+                return fetchFilteredPositions(person_id, startDate, endDate);
+            }
+            data.positions = (base > 0 ? prev.positions.slice(0, base) : []).concat(data.positions);
+            filterCursor = { key, cursor: data.cursor, positions: data.positions.slice() };
+        } else {
+            filterCursor = null;
+        }
+
         await setFilter(data);
     } catch (error) {
         console.error("Error getting filtered positions:", error);
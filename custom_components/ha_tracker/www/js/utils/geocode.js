@@ -2,15 +2,18 @@
 // geocode.js
 // Reverse-geocoding con caché LRU, cola (concurrencia limitada) y backoff.
 // Reintenta también cuando 200 viene sin dirección utilizable.
+// Las peticiones que llegan juntas (listas de paradas) van en un solo POST de lote.
 // Úsalo para convertir (lat,lon,ts) -> address.
 //
 
-import { fetchReverseGeocode } from '../ha/fetch.js';
+import { fetchReverseGeocode, fetchReverseGeocodeBatch } from '../ha/fetch.js';
 
 // ---------- Config ----------
 let POS_CACHE_MAX = 400; // caché LRU por uniqueId
 let RG_MAX = 4; // concurrencia máxima
 let MAX_EMPTY_RETRIES = 2; // reintentos extra cuando 200 llega sin address
+let BATCH_MAX = 200; // puntos por POST de lote
+const BATCH_WINDOW_MS = 30; // espera para juntar peticiones en un lote
 
 export function setGeocodeCacheSize(n) {
     POS_CACHE_MAX = Math.max(50, Number(n) || POS_CACHE_MAX);
@@ -21,6 +24,9 @@ export function setGeocodeConcurrency(n) {
 export function setGeocodeEmptyRetries(n) {
     MAX_EMPTY_RETRIES = Math.max(0, Number(n) || MAX_EMPTY_RETRIES);
 }
+export function setGeocodeBatchSize(n) {
+    BATCH_MAX = Math.min(500, Math.max(1, Number(n) || BATCH_MAX));
+}
 
 // ---------- Key helpers ----------
 const posKey = (lat, lon, tsMs) => `${Number(lat).toFixed(6)},${Number(lon).toFixed(6)},${Number(tsMs)}`;
@@ -79,6 +85,58 @@ function pump() {
     }
 }
 
+// ---------- Lotes ----------
+// Las coordenadas pedidas en la misma ventana se resuelven con un POST a
+// reverse_geocode/batch (una sola pasada por la caché del servidor); cada promesa
+// recibe el resultado de su punto en cuanto llega, con la misma forma que el GET.
+let batchQueue = []; // [{ lat, lon, resolve, reject }]
+let batchTimer = null;
+
+function lookupAddress(lat, lon) {
+    return new Promise((resolve, reject) => {
+        batchQueue.push({ lat, lon, resolve, reject });
+        if (batchQueue.length >= BATCH_MAX)
+            flushBatch();
+        else if (!batchTimer)
+            batchTimer = setTimeout(flushBatch, BATCH_WINDOW_MS);
+    });
+}
+
+function flushBatch() {
+    clearTimeout(batchTimer);
+    batchTimer = null;
+    const items = batchQueue.splice(0, BATCH_MAX);
+    if (batchQueue.length)
+        batchTimer = setTimeout(flushBatch, 0);
+    if (!items.length)
+        return;
+
+    // un solo punto: GET con nowait (202 inmediato si no está en caché)
+    if (items.length === 1) {
+        const { lat, lon, resolve, reject } = items[0];
+        run(() => fetchReverseGeocode(lat, lon)).then(resolve, reject);
+        return;
+    }
+
+    const settled = new Set();
+    run(() => fetchReverseGeocodeBatch(items.map(it => [it.lat, it.lon]), (rec) => {
+        const it = items[rec.i];
+        if (it && !settled.has(rec.i)) {
+            settled.add(rec.i);
+            it.resolve(rec);
+        }
+    })).then(() => {
+        // no debería quedar ninguno: se reintentan como si siguieran en cola
+        items.forEach((it, i) => {
+            if (!settled.has(i)) it.resolve({ error: 'queued', retry_after: 1.5 });
+        });
+    }, (err) => {
+        items.forEach((it, i) => {
+            if (!settled.has(i)) it.reject(err);
+        });
+    });
+}
+
 // ---------- API ----------
 /**
  * Resuelve dirección para (lat,lon,tsMs) y la entrega a onAddress(address:string).
@@ -172,8 +230,8 @@ export async function requestAddress(uniqueId, lat, lon, tsMs, onAddress) {
       return;
     }
 
-    // Dispara petición con cola de concurrencia
-    const p = run(() => fetchReverseGeocode(lat, lon));
+    // Dispara petición (en lote con las de la misma ventana, con cola de concurrencia)
+    const p = lookupAddress(lat, lon);
     // El promise compartido entrega SOLO el display_name (o '' si no viene)
     coordInFlight.set(cKey, p.then(d => (d?.address?.display_name || '').trim()));
 
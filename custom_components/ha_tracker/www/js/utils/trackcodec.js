@@ -0,0 +1,127 @@
+//
+// trackcodec.js
+// Decodifica las posiciones filtradas en formato compacto (format=polyline|binary):
+// columnas enteras con deltas -> mismas posiciones que el JSON con el perfil compacto, salvo
+// last_updated, que llega truncado al segundo, y la batería, que siempre se decodifica como
+// attributes.battery_level (el servidor elige la clave que leería extractBatteryPercent).
+//
+
+export const TRACK_BINARY_TYPE = 'application/vnd.ha-tracker.track';
+const MAGIC = 'HTK1';
+
+const LITTLE_ENDIAN = new Uint8Array(new Uint16Array([1]).buffer)[0] === 1;
+
+// Polyline de Google (zigzag + bloques de 5 bits): cadena -> enteros
+function polylineDecode(str, count) {
+    const out = new Int32Array(count);
+    let idx = 0;
+    let n = 0;
+    while (idx < str.length && n < count) {
+        let result = 0;
+        let shift = 0;
+        let b;
+        do {
+            b = str.charCodeAt(idx++) - 63;
+            result |= (b & 0x1f) << shift;
+            shift += 5;
+        } while (b >= 0x20);
+        out[n++] = (result & 1) ? ~(result >>> 1) : (result >>> 1);
+    }
+    if (n !== count) {
+        throw new Error('Truncated polyline column.');
+    }
+    return out;
+}
+
+function binaryColumns(buffer) {
+    const bytes = new Uint8Array(buffer);
+    if (String.fromCharCode(...bytes.subarray(0, 4)) !== MAGIC) {
+        throw new Error('Unknown track encoding.');
+    }
+    const metaLen = new DataView(buffer).getUint32(4, true);
+    const meta = JSON.parse(new TextDecoder().decode(bytes.subarray(8, 8 + metaLen)));
+
+    let offset = Math.ceil((8 + metaLen) / 4) * 4;
+    const columns = {};
+    for (const name of meta.columns) {
+        if (offset + meta.count * 4 > buffer.byteLength) {
+            throw new Error('Truncated track response.');
+        }
+        if (LITTLE_ENDIAN) {
+            columns[name] = new Int32Array(buffer, offset, meta.count);
+        } else {
+            const view = new DataView(buffer, offset, meta.count * 4);
+            const col = new Int32Array(meta.count);
+            for (let i = 0; i < meta.count; i++) col[i] = view.getInt32(i * 4, true);
+            columns[name] = col;
+        }
+        offset += meta.count * 4;
+    }
+    return { meta, columns };
+}
+
+function polylineColumns(meta) {
+    const columns = {};
+    const coords = polylineDecode(meta.data.coords || '', meta.count * 2);
+    columns.latitude = new Int32Array(meta.count);
+    columns.longitude = new Int32Array(meta.count);
+    for (let i = 0; i < meta.count; i++) {
+        columns.latitude[i] = coords[2 * i];
+        columns.longitude[i] = coords[2 * i + 1];
+    }
+    for (const name of meta.columns) {
+        if (!(name in columns)) {
+            columns[name] = polylineDecode(meta.data[name] || '', meta.count);
+        }
+    }
+    return { meta, columns };
+}
+
+// ArrayBuffer (binary) u objeto (polyline) -> { header, positions, summary, zones, ... }
+export function decodeTrack(input) {
+    const { meta, columns } = (input instanceof ArrayBuffer) ? binaryColumns(input) : polylineColumns(input);
+    const { count, scales, header } = meta;
+
+    for (const name of meta.delta) {
+        const col = columns[name];
+        for (let i = 1; i < count; i++) col[i] += col[i - 1];
+    }
+
+    const stops = new Map((meta.stops || []).map(s => [s.i, s]));
+    const lat = columns.latitude, lon = columns.longitude, t = columns.t;
+    const speed = columns.speed, acc = columns.gps_accuracy, battery = columns.battery;
+
+    const positions = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const attributes = {
+            latitude: lat[i] / scales.latitude,
+            longitude: lon[i] / scales.longitude,
+        };
+        if (acc[i] >= 0) attributes.gps_accuracy = acc[i] / scales.gps_accuracy;
+        if (speed[i] >= 0) attributes.speed = speed[i] / scales.speed;
+        if (battery[i] >= 0) attributes.battery_level = battery[i] / scales.battery;
+
+        const pos = {
+            entity_id: header.entity_id,
+            last_updated: new Date((meta.t0 + t[i]) * 1000).toISOString(),
+            attributes,
+        };
+        if (meta.stops_annotated) {
+            pos.stop = stops.has(i);
+        }
+        const stop = stops.get(i);
+        if (stop) {
+            const { i: _, ...fields } = stop;
+            Object.assign(pos, fields);
+        }
+        positions[i] = pos;
+    }
+
+    const out = { header, positions };
+    for (const [key, value] of Object.entries(meta)) {
+        if (!['header', 'encoding', 'count', 't0', 'columns', 'delta', 'scales', 'stops_annotated', 'stops', 'data'].includes(key)) {
+            out[key] = value;
+        }
+    }
+    return out;
+}